@@ -5,6 +5,14 @@ APP GUI
 
 * Handles GUI with PyQt5.
 * GUI done for the client-side of the Group Chat application.
+* The chat messages can be given from any thread; they are queued and rendered in batches
+    (at most once per CHAT_RENDER_INTERVAL) and the chat console keeps only the last CHAT_SCROLLBACK_BLOCKS lines.
+* Double-clicking a client in the client list turns the chat entry to a direct message to that client
+    (Escape turns it back to the room).
+* Typing '/search [from:<name>] <words>' in the chat entry searches the recent messages of the room
+    (kept by the server) and shows the matches in the chat console.
+* The '+' button sends a file to the room; the files shared in the room are downloaded to DOWNLOAD_DIRECTORY
+    (up to AUTO_DOWNLOAD_MAX_SIZE), in the background.
 * The 'Ui_Window' class requires an instance of 'GroupChatClient' for doing the client operations, 
     which must be provided through the 'set_client' method.
 
@@ -12,10 +20,14 @@ APP GUI
 
 
 from PyQt5 import QtCore, QtWidgets, uic
+import os
 import sys
-from PyQt5.QtWidgets import QDialog, QPushButton, QLabel, QVBoxLayout
-from PyQt5.QtGui import QFont
-from PyQt5.QtCore import pyqtSignal, QObject
+import time
+from collections import deque
+from threading import Lock
+from PyQt5.QtWidgets import QDialog, QPushButton, QLabel, QVBoxLayout, QShortcut, QFileDialog
+from PyQt5.QtGui import QFont, QTextCursor, QKeySequence
+from PyQt5.QtCore import pyqtSignal, QObject, QTimer
 
 from client_config import *
 
@@ -30,6 +42,8 @@ class Ui_Window(QtWidgets.QWidget):
     """This class requires an instance of 'GroupChatClient' for doing the client operations, 
     Which must be provided through the 'set_client' method."""
 
+    chat_messages_pending = pyqtSignal()        # Emitted (from any thread) when the first message of a batch is queued
+
     def __init__(self):
         super().__init__()
 
@@ -38,13 +52,26 @@ class Ui_Window(QtWidgets.QWidget):
         title = "Group Chat" + " V" + VERSION
         self.setWindowTitle(QtCore.QCoreApplication.translate("Window", title))
         self.client_list.setDisabled(True)
+        self.room_selector.setDisabled(True)
         #self.chat_console.setDisabled(True)
         self.chat_console.setReadOnly(True)
+        self.chat_console.document().setMaximumBlockCount(CHAT_SCROLLBACK_BLOCKS)
+
+        self.pending_chat_messages = deque()
+        self.pending_chat_lock = Lock()
+        self.chat_flush_scheduled = False
+        self.last_chat_flush = 0
+        self.direct_recipient = None    # (<Client-id-no.>, <Client-name>) while typing a direct message
 
         self.connect_button.clicked.connect(self.connect)
         self.send_button.clicked.connect(self.send)
+        self.attach_button.clicked.connect(self.send_file)
         self.message_entry.returnPressed.connect(self.send)
+        self.room_selector.activated[str].connect(self.join_room)
+        self.client_list.itemDoubleClicked.connect(self.open_direct_message)
+        QShortcut(QKeySequence(QtCore.Qt.Key_Escape), self.message_entry, self.close_direct_message)
         self.chat_console.textChanged.connect(self.auto_scroll)
+        self.chat_messages_pending.connect(self.schedule_chat_flush)
         #self.chat_console.verticalScrollBar().setSliderPosition(0)
 
     def set_client(self, get_client_function):
@@ -85,10 +112,15 @@ class Ui_Window(QtWidgets.QWidget):
         condition = not(self.get_client_instance().connected)
         self.message_entry.setDisabled(condition)
         self.send_button.setDisabled(condition)
+        self.attach_button.setDisabled(condition)
         self.address_entry.setDisabled(not(condition))
         self.client_name_entry.setDisabled(not(condition))
         self.connect_button.setDisabled(not(condition))
-        if condition: self.client_list.clear()
+        self.room_selector.setDisabled(condition)
+        if condition:
+            self.client_list.clear()
+            self.room_selector.clear()
+            self.close_direct_message()
 
     def connect(self):
         """Calls the required functions from the client-side class to connect with the server."""
@@ -101,13 +133,61 @@ class Ui_Window(QtWidgets.QWidget):
         elif len(client_name) > MAX_CLIENT_NAME_LENGTH:
             self.alert("Your name is too lengthy!\nProvide your nickname or something.")
         else:
+            self.connect_button.setDisabled(True)      # Till the server accepts (it may keep this client waiting)
+            self.address_entry.setDisabled(True)
+            self.client_name_entry.setDisabled(True)
             status = self.get_client_instance().connect(server_address, client_name)
-            if status == 0:
-                self.set_gui_active_area()
-            elif status == 1:
-                self.alert("Server denied your request as max. no. of clients are connected.\nTry again later!")
-            else:
-                self.alert("Something went wrong when connecting with the server.\nTry again or try later.")
+            if status is not None: self.show_connect_result(status)     # Else it comes later (see 'qt_client_core.py')
+
+    def show_connect_result(self, status):
+        """Gets the result of connecting with the server (see 'ClientCore.connect') and,
+        Sets the active area, raising an alert if it failed."""
+
+        self.set_gui_active_area()
+        if status == 1:
+            self.alert("Server denied your request as max. no. of clients are connected.\nTry again later!")
+        elif status == 2:
+            self.alert("Something went wrong when connecting with the server.\nTry again or try later.")
+
+    def show_connection_state(self, state):
+        """Gets the new state of the connection (see 'qt_client_core.py') and shows it in the window title."""
+
+        title = "Group Chat" + " V" + VERSION
+        state_title = {"connecting": "Connecting...", "waiting": "Waiting for the server...",\
+            "handshaking": "Joining..."}.get(state)
+        if state_title is not None: title += " - " + state_title
+        self.setWindowTitle(QtCore.QCoreApplication.translate("Window", title))
+
+    def show_queue_position(self, position):
+        """Gets the position of this client in the waiting room of the server and shows it in the chat console.
+        Called (from the GUI thread) while connecting, so it also lets the window repaint if 'connect' is blocking."""
+
+        self.chat_console.append(f"\nServer is full, waiting for a free slot... (position {position} in the queue)")
+        if self.get_client_instance().blocking_connect:
+            QtWidgets.QApplication.processEvents(QtCore.QEventLoop.ExcludeUserInputEvents)
+
+    def show_rate_limit(self, action, retry_after):
+        """Gets the action taken by the server as this client sent too many messages and,
+        Shows it in the chat console. Can be called from any thread (see 'show_chat_message')."""
+
+        if action == "drop": notice = f"Your last message was not sent. Wait {retry_after:g} s before sending again."
+        elif action == "disconnect": notice = "The server disconnected you for sending too many messages."
+        else: notice = "Slow down! Your messages are being delayed by the server."
+        self.show_chat_message("*** " + notice + " ***")
+
+    def show_reconnecting(self, attempt, delay):
+        """Gets the attempt to reconnect with the server (after the connection was lost) and the delay before it and,
+        Shows it in the chat console. Can be called from any thread (see 'show_chat_message')."""
+
+        if attempt == 1: self.show_chat_message("*** The connection with the server was lost. Reconnecting... ***")
+        else: self.show_chat_message(f"*** Reconnecting in {delay:.1f} s (attempt {attempt})... ***")
+
+    def show_reconnected(self, complete):
+        """Gets whether no chat message was missed while reconnecting and,
+        Shows it in the chat console. Can be called from any thread (see 'show_chat_message')."""
+
+        if complete: self.show_chat_message("*** Reconnected. ***")
+        else: self.show_chat_message("*** Reconnected. Some messages sent meanwhile may be missing. ***")
 
     def update_client_list(self, client_list):
         """Gets the new client list and updates it in the client_list widget"""
@@ -115,28 +195,174 @@ class Ui_Window(QtWidgets.QWidget):
         self.client_list.clear()
         self.client_list.addItems(client_list)
 
+    def update_room_list(self, room_list, current_room):
+        """Gets the list of room names and the current room and updates them in the room_selector widget"""
+
+        self.room_selector.clear()
+        self.room_selector.addItems(room_list)
+        self.room_selector.setCurrentText(current_room)
+
+    def join_room(self, room_name):
+        """Gets the room name chosen (or typed) in the room_selector and,
+        Asks the client core to join that room."""
+
+        room_name = room_name.strip()
+        if len(room_name) > MAX_ROOM_NAME_LENGTH:
+            self.alert("The room name is too lengthy!\nProvide a shorter name.")
+        elif room_name and room_name != self.get_client_instance().room:
+            self.flush_chat_messages()
+            self.chat_console.append("\n--- Room: " + room_name + " ---")
+            self.get_client_instance().join_room(room_name)
+
+    def open_direct_message(self, item):
+        """Gets the item double-clicked in the client_list widget and,
+        Turns the chat entry to a direct message to that client."""
+
+        client_id_numbers = list(self.get_client_instance().client_list)    # In the order of the client_list widget
+        row = self.client_list.row(item)
+        if not(0 <= row < len(client_id_numbers)): return
+        self.direct_recipient = (client_id_numbers[row], item.text())
+        self.message_entry.setPlaceholderText(f"Direct message to {item.text()} (Esc to chat with the room)")
+        self.message_entry.setFocus()
+
+    def close_direct_message(self):
+        """Turns the chat entry back to the room."""
+
+        self.direct_recipient = None
+        self.message_entry.setPlaceholderText("")
+
+    def show_direct_message(self, sender, recipient, message):
+        """Gets the sender and the recipient (as (<Client-id-no.>, <Client-name>)) of a direct message and the message and,
+        Shows it in the chat console. Can be called from any thread (see 'show_chat_message')."""
+
+        self.show_chat_message(f"[Direct] {sender[1]} -> {recipient[1]}> {message}")
+
+    def show_direct_failure(self, recipient, reason):
+        """Gets the recipient (as addressed) of a direct message which could not be sent and the reason and,
+        Shows it in the chat console. Can be called from any thread (see 'show_chat_message')."""
+
+        direct_recipient = self.direct_recipient
+        if direct_recipient is not None and recipient == direct_recipient[0]: recipient = direct_recipient[1]
+        if reason == "unknown": notice = f"Your direct message was not sent, as {recipient} is not connected anymore."
+        elif reason == "ambiguous": notice = f"Your direct message was not sent, as many clients are named {recipient}."
+        else: notice = f"Your direct message was not sent, as {recipient} cannot get direct messages."
+        self.show_chat_message("*** " + notice + " ***")
+
+    def show_search_results(self, query, results, error):
+        """Gets a search query, its results (newest first) and the error (if any) and,
+        Shows the results in the chat console (oldest first). Can be called from any thread (see 'show_chat_message')."""
+
+        if error == "busy": notice = "The server is busy, search again in a while."
+        elif error is not None: notice = f"Cannot search for '{query}'."
+        elif not(results): notice = f"Nothing found for '{query}'."
+        else: notice = f"Found {len(results)} messages for '{query}':"
+        lines = ["*** " + notice + " ***"]
+        for result in reversed(results):
+            lines.append(f"[{time.strftime('%d %b %H:%M', time.localtime(result['time']))}] {result['from']}> {result['message']}")
+        self.show_chat_message("\n".join(lines))
+
     def send(self):
         """Fetches the message from the chat entry and checks for validity.
-        Sends it to the server if valid and, 
+        Sends it to the server (to the room, or to a client as a direct message) if valid and, 
         Raises an alert if invalid."""
 
         message = self.message_entry.text()
         if len(message) > MAX_CHAT_CONTENT:
             self.alert("Your message is too lengthy!\n\
 Break it into separate messages and then send them one by one.")
+        elif message.startswith(SEARCH_COMMAND):
+            words, sender_name = [], None
+            for word in message[len(SEARCH_COMMAND):].split():
+                if word.startswith("from:") and sender_name is None: sender_name = word[len("from:"):]
+                else: words.append(word)
+            self.get_client_instance().search_chat(" ".join(words), sender_name)
+            self.message_entry.clear()
+        elif self.direct_recipient is not None:
+            self.get_client_instance().send_direct_message(self.direct_recipient[0], message)
+            self.message_entry.clear()
         else:
-            message = message.replace(":", "{colon}")
             self.get_client_instance().send_chat_message(message)
             self.message_entry.clear()
 
-    def show_chat_message(self, message):
-        """Gets the given string chat message and appends it to the chat console."""
+    def send_file(self):
+        """Asks for a file and sends it to the room (in the background), raising an alert if it cannot be sent."""
+
+        path, file_filter = QFileDialog.getOpenFileName(self, "Send a file to the room")
+        if not(path): return
+        if self.get_client_instance().send_file(path):
+            self.show_chat_message(f"*** Sending {os.path.basename(path)}... ***")
+        elif os.path.isfile(path) and os.path.getsize(path) > MAX_FILE_SIZE:
+            self.alert(f"The file is too large!\nThe max. size is {MAX_FILE_SIZE // (1024 * 1024)} MB.")
+        else: self.alert("The file could not be sent.\nTry again or try later.")
+
+    def accept_file(self, transfer_id, sender_name, file_name, size):
+        """Gets a file shared in the room (its id, the name of the sender, its name and size) and,
+        Returns the path to download it at (a new file in DOWNLOAD_DIRECTORY), or None if it is too large.
+        Can be called from any thread (see 'show_chat_message')."""
+
+        if size > AUTO_DOWNLOAD_MAX_SIZE:
+            self.show_chat_message(f"*** {sender_name} shared {file_name} ({size} bytes), too large to download. ***")
+            return None
+        os.makedirs(DOWNLOAD_DIRECTORY, exist_ok = True)
+        name, extension = os.path.splitext(os.path.basename(file_name))
+        path, copy_no = os.path.join(DOWNLOAD_DIRECTORY, name + extension), 1
+        while os.path.exists(path):
+            copy_no += 1
+            path = os.path.join(DOWNLOAD_DIRECTORY, f"{name} ({copy_no}){extension}")
+        open(path, "wb").close()        # Claims the name (another file may be offered before this one is done)
+        self.show_chat_message(f"*** {sender_name} shared {file_name} ({size} bytes), downloading... ***")
+        return path
+
+    def show_file_progress(self, path, done, size, bytes_per_second):
+        """Gets the path of a file being sent or downloaded, its bytes done so far, its size and the throughput and,
+        Shows it in the chat console once it is done. Can be called from any thread (see 'show_chat_message')."""
+
+        if done == size: self.show_chat_message(f"*** {os.path.basename(path)} is done ({size} bytes,\
+ {bytes_per_second / 1024:.0f} KB/s). ***")
+
+    def show_file_failure(self, path, reason):
+        """Gets the path of a file which could not be sent or downloaded and the reason and,
+        Shows it in the chat console. Can be called from any thread (see 'show_chat_message')."""
+
+        if reason == "too_large": reason = "it is too large"
+        elif reason == "busy": reason = "the server has too many files"
+        elif reason == "unknown": reason = "the server does not have it anymore"
+        elif reason == "disabled": reason = "the server does not take files"
+        self.show_chat_message(f"*** {os.path.basename(path)} failed, as {reason}. ***")
 
-        self.chat_console.append('\n' + message)
+    def show_chat_message(self, message):
+        """Gets the given string chat message and queues it to be appended to the chat console.
+        Can be called from any thread (the GUI thread is signalled only once per batch)."""
+
+        with self.pending_chat_lock:
+            self.pending_chat_messages.append(message)
+            if self.chat_flush_scheduled: return
+            self.chat_flush_scheduled = True
+        self.chat_messages_pending.emit()
+
+    def schedule_chat_flush(self):
+        """Flushes the queued chat messages once CHAT_RENDER_INTERVAL had passed since the last flush."""
+
+        delay = self.last_chat_flush + CHAT_RENDER_INTERVAL - time.monotonic()
+        QTimer.singleShot(max(0, int(delay * 1000)), self.flush_chat_messages)
+
+    def flush_chat_messages(self):
+        """Appends all the queued chat messages to the chat console in one go."""
+
+        with self.pending_chat_lock:
+            messages = list(self.pending_chat_messages)
+            self.pending_chat_messages.clear()
+            self.chat_flush_scheduled = False
+        self.last_chat_flush = time.monotonic()
+        if not(messages): return
+        # Every message takes two lines (a blank one and itself), the older ones would be evicted right away.
+        messages = messages[-(CHAT_SCROLLBACK_BLOCKS // 2):]
+        cursor = QTextCursor(self.chat_console.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText("\n\n" + "\n\n".join(messages))
         #QtCore.QCoreApplication.instance().processEvents()
         #self.chat_console.repaint()
         #QtWidgets.QApplication.processEvents()
-        #self.chat_console.verticalScrollBar().setValue(self.chat_console.verticalScrollBar().maximum())
 
     def auto_scroll(self):
         """Scrolls the chat console to the bottom."""
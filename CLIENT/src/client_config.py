@@ -19,17 +19,85 @@ CLIENT CONFIG
 
 # Client Core Configurations
 VERSION                             = "1.0.4"
-MAX_MESSAGE_LENGTH                  = 1024
+MAX_MESSAGE_LENGTH                  = 1024          # For the unframed (legacy) messages
+MAX_FRAME_LENGTH                    = 65536
+RECEIVE_BUFFER_SIZE                 = 65536         # Bytes read per 'recv' (may contain many frames)
 MAX_CHAT_CONTENT                    = 900
 MAX_CLIENT_NAME_LENGTH              = 24
 SERVER_LISTENING_PORT               = 50000
+DEFAULT_ROOM_NAME                   = "Lobby"
+MAX_ROOM_NAME_LENGTH                = 24
+COMPRESSION_ENABLED                 = True          # Asks the server to compress the large messages
+COMPRESSION_THRESHOLD               = 256           # Bytes (the smaller messages are never compressed)
+COMPRESSION_LEVEL                   = 6             # zlib level (1: fastest ... 9: smallest)
+HEARTBEATS_ENABLED                  = True          # Asks the server to ping this client when it is silent
+HEARTBEAT_TIMEOUT                   = 60.0          # Seconds without any data from the server before the connection is taken as lost
+SESSIONS_ENABLED                    = True          # Asks for a session, so that a lost connection is resumed without missing messages
+RECONNECT_INITIAL_DELAY             = 0.5           # Seconds (the max.) before the first attempt to reconnect
+RECONNECT_MAX_DELAY                 = 30.0          # Seconds (the max.) between the attempts (the delay doubles every attempt)
+RECONNECT_MAX_ATTEMPTS              = 10            # Attempts before the connection is reported as lost
+RECONNECT_OUTBOX_SIZE               = 100           # Chat messages kept (to be sent) while reconnecting
+CLIENT_TRANSPORT                    = "qt"          # "qt": driven by the Qt event loop (see 'qt_client_core.py'),
+                                                    # "thread": blocking calls and a receiving thread
+CONNECT_TIMEOUT                     = 10.0          # Seconds to connect and handshake (the "qt" transport, the waiting room excluded)
+SHUTDOWN_FLUSH_TIMEOUT              = 1.0           # Seconds to wait for the goodbye to be sent (the "qt" transport)
+TCP_NODELAY_ENABLED                 = True          # Sends the chat messages at once (Nagle's algorithm off)
+SOCKET_SEND_BUFFER_SIZE             = 0             # Bytes of the kernel send buffer (0 for the default of the kernel)
+SOCKET_RECEIVE_BUFFER_SIZE          = 0             # Bytes of the kernel receive buffer (0 for the default of the kernel)
+
+# File Transfers
+MAX_FILE_SIZE                       = 100 * 1024 * 1024 # Bytes (the server rejects the larger files)
+FILE_CHUNK_SIZE                     = 48000             # Bytes of the file per chunk (a multiple of 3, as it is sent
+                                                        # in base64, and small enough for a frame)
+FILE_SEND_BUFFER                    = 4 * 65536         # Bytes waiting to be written before the next chunk is sent
+                                                        # (the "qt" transport, so that the chat never waits behind a file)
+DOWNLOAD_DIRECTORY                  = "downloads"       # Where the GUI saves the files shared in the room
+AUTO_DOWNLOAD_MAX_SIZE              = 20 * 1024 * 1024  # Bytes (the GUI does not download the larger files)
+
+# Runtime Settings (see 'client_settings.py')
+SETTINGS_FILE_PATH                  = "client_settings.json"    # Read at startup (if it exists)
+SETTINGS_ENVIRONMENT_PREFIX         = "GROUPCHAT_CLIENT_"       # Like GROUPCHAT_CLIENT_SERVER_LISTENING_PORT=50000
+
+# Chat Rendering
+CHAT_RENDER_INTERVAL                = 1 / 30        # Seconds between the batched updates of the chat console
+CHAT_SCROLLBACK_BLOCKS              = 5000          # Lines kept in the chat console (the oldest are evicted)
 
 # Message Format
 DENY_MESSAGE                        = "RequestDenied"
 ACCEPT_MESSAGE                      = "RequestAccepted"
-CLIENT_LIST_UPDATE_MESSAGE_PREFIX   = "UpdateClientList:"
+QUEUE_POSITION_MESSAGE_PREFIX       = "QueuePosition:"         # "QueuePosition:<position>\n" (before 'RequestAccepted')
+CLIENT_LIST_UPDATE_MESSAGE_PREFIX   = "UpdateClientList:"      # Full list of names (for the unframed clients)
+CLIENT_LIST_SNAPSHOT_MESSAGE_PREFIX = "ClientListSnapshot:"    # {"room": room, "clients": [[id, name], ...]} (sent on join)
+CLIENT_LIST_DELTA_MESSAGE_PREFIX    = "ClientListDelta:"       # {"added": [[id, name], ...], "removed": [id, ...]}
 CHAT_MESSAGE_PREFIX                 = "Chat:"
 SHUTDOWN_MESSAGE_PREFIX             = "ShutDown:"
+JOIN_ROOM_MESSAGE_PREFIX            = "JoinRoom:"
+LEAVE_ROOM_MESSAGE_PREFIX           = "LeaveRoom:"              # Goes back to the default room
+LIST_ROOMS_MESSAGE_PREFIX           = "ListRooms:"
+ROOM_LIST_MESSAGE_PREFIX            = "RoomList:"               # [[room, no. of members], ...]
+FRAMING_REQUEST                     = "UseFraming:"
+COMPRESSION_REQUEST                 = "UseCompression:"         # Sent right after FRAMING_REQUEST (optional)
+HEARTBEAT_REQUEST                   = "UseHeartbeats:"          # Sent after the above requests (optional)
+PING_MESSAGE_PREFIX                 = "Ping:"                   # Answered with "Pong:" (only to the clients which asked)
+PONG_MESSAGE_PREFIX                 = "Pong:"
+RATE_LIMITED_MESSAGE_PREFIX         = "RateLimited:"            # {"action": "throttle"/"drop"/"disconnect", "retry_after": seconds}
+SESSION_REQUEST                     = "UseSessions:"            # Sent after the above requests (optional)
+SESSION_MESSAGE_PREFIX              = "Session:"                # {"token": token, "seq": last seq. no., "resumed": bool, "complete": bool}
+RESUME_MESSAGE_PREFIX               = "Resume:"                 # {"token": token, "last_seq": seq. no., "name": name} (instead of the name)
+SEQUENCED_MESSAGE_PREFIX            = "Seq:"                    # "Seq:<seq. no.>:<chat message>"
+DIRECT_MESSAGE_PREFIX               = "Direct:"                 # {"to": id or name, "message": msg} to the server,
+                                                                # {"from": [id, name], "to": [id, name], "message": msg} back
+DIRECT_FAILED_MESSAGE_PREFIX        = "DirectFailed:"           # {"to": id or name, "reason": "unknown"/"ambiguous"/"unsupported"}
+FILE_OFFER_MESSAGE_PREFIX           = "FileOffer:"              # {"name": name, "size": bytes, "ref": ref} or {"id", "key", "ref"}
+FILE_ACCEPTED_MESSAGE_PREFIX        = "FileAccepted:"           # {"ref": ref, "id": id, "key": key, "offset": bytes to resume from}
+FILE_REJECTED_MESSAGE_PREFIX        = "FileRejected:"           # {"ref": ref (or "id": id), "reason": reason}
+FILE_OFFERED_MESSAGE_PREFIX         = "FileOffered:"            # {"id": id, "from": name, "name": file name, "size": bytes}
+FILE_CHUNK_MESSAGE_PREFIX           = "FileChunk:"              # "FileChunk:<id>:<offset>:<base64 data>" (both directions)
+FILE_REQUEST_MESSAGE_PREFIX         = "FileRequest:"            # {"id": id, "offset": bytes already received}
+FILE_COMPLETE_MESSAGE_PREFIX        = "FileComplete:"           # {"id": id, "size": bytes, "seconds": s, "bytes_per_second": rate}
+SEARCH_MESSAGE_PREFIX               = "Search:"                 # {"query": words, "from": name, "since": ts, "until": ts, "room": room}
+SEARCH_RESULTS_MESSAGE_PREFIX       = "SearchResults:"          # {"query": words, "results": [{"time", "room", "from", "message"}, ...]}
+SEARCH_COMMAND                      = "/search "                # Typed in the chat entry, like this: /search [from:<name>] <words>
 
 
 if __name__ == '__main__':
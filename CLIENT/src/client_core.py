@@ -0,0 +1,720 @@
+"""
+-----------
+CLIENT CORE
+-----------
+
+* The networking core of the Group Chat client, free of any GUI (PyQt5 is never imported here).
+* Contains the class called 'ClientCore' which connects with the server (waiting in the waiting room of the server
+    if it is full), receives the messages in a background thread and reports the incoming chat messages,
+    client list, room list and disconnection through callbacks, so that headless bots and tests can chat
+    without the Qt startup cost or a display.
+* Answers the pings of the server and takes the connection as lost if the server is silent for too long
+    (see HEARTBEAT_TIMEOUT).
+* Searches the recent chat messages kept by the server (see 'search_chat').
+* Sends and receives files in chunks interleaved with the chat (see 'send_file' and 'on_file_offered'),
+    resuming them from where they were after a reconnection.
+* Reconnects by itself when the connection is lost (with a jittered exponential backoff) and resumes its session,
+    getting the chat messages it had missed meanwhile (see SESSIONS_ENABLED and 'reconnect').
+* Applies the socket tunables (TCP_NODELAY and the kernel buffer sizes) before connecting (see 'apply_settings').
+* 'QtClientCore' (in 'qt_client_core.py') speaks the same protocol from the Qt event loop instead of a thread.
+* 'GroupChatClient' (in 'group_chat_client.py') is the GUI consumer of this core.
+
+"""
+
+
+import base64
+import binascii
+import json
+import os
+import random
+import socket
+import time
+from collections import deque
+from threading import Thread, Lock, Event
+
+from client_config import *
+from message_framing import FrameDecoder, encode_frame
+
+
+JUNK_MESSAGE_ALERT = "Server had sent some junk message...\n\
+Its advisable to close the window and reopen the application.\n\
+(or just reconnect with the server)"
+SHUTDOWN_ALERT = "The server had shutted down.\n\
+Sorry for the inconvenience. Try chatting later!"
+CONNECTION_LOST_ALERT = "The server stopped responding.\n\
+Check your network and reconnect."
+
+
+class ClientCore(object):
+    """The GUI-free client of the Group Chat application.
+    The port to which the client should request for connection with server,
+        should be given when the class instance is created.
+    The events are reported through the callbacks given to 'set_callbacks' (they are called from the receiving thread)."""
+
+    def __init__(self, server_port):
+        self.client_socket = socket.socket()
+        self.server_port = server_port
+        self.connected = False
+        self.client_list = {}       # Will contain items like this: <Client-id-no.>: <Client-name>
+        self.room = DEFAULT_ROOM_NAME
+        self.send_lock = Lock()         # The receiving thread answers the pings while the user sends messages
+        self.heartbeat_missed = False   # Set if the server was silent for HEARTBEAT_TIMEOUT
+        self.server_address = None
+        self.client_name = None
+        self.session_token = None       # Given by the server when this client joins (see SESSIONS_ENABLED)
+        self.last_sequence_number = 0   # Of the last chat message received (asked for when resuming the session)
+        self.reconnecting = False
+        self.resuming = False           # Set until the server confirms the session after a reconnection
+        self.closing_event = Event()    # Set when the client shuts down (stops reconnecting)
+        self.unsent_messages = deque(maxlen = RECONNECT_OUTBOX_SIZE)     # Chat messages sent while reconnecting
+        self.outgoing_files = {}        # Will contain items like this: <Reference-no.>: <OutgoingFile>
+        self.incoming_files = {}        # Will contain items like this: <Transfer-id>: <IncomingFile>
+        self.next_file_reference = 1
+        self.blocking_connect = True    # 'connect' returns once connected (see 'qt_client_core.py' for the other way)
+        self.receive_buffer_size = RECEIVE_BUFFER_SIZE      # The socket tunables (see 'apply_settings')
+        self.tcp_nodelay = TCP_NODELAY_ENABLED
+        self.socket_send_buffer_size = SOCKET_SEND_BUFFER_SIZE
+        self.socket_receive_buffer_size = SOCKET_RECEIVE_BUFFER_SIZE
+
+        self.on_chat_message = None     # Called like this: on_chat_message(<Message>)
+        self.on_client_list = None      # Called like this: on_client_list([<Client-name>, ...])
+        self.on_room_list = None        # Called like this: on_room_list([<Room-name>, ...], <Current-room>)
+        self.on_disconnect = None       # Called like this: on_disconnect(<Reason (empty if expected)>)
+        self.on_queue_position = None   # Called like this: on_queue_position(<Position in the waiting room>)
+        self.on_rate_limited = None     # Called like this: on_rate_limited(<Action taken by the server>, <Retry after (s)>)
+        self.on_reconnecting = None     # Called like this: on_reconnecting(<Attempt>, <Delay before it (s)>)
+        self.on_reconnected = None      # Called like this: on_reconnected(<True if no message was missed>)
+        # Called like this: on_direct_message((<Sender-id-no.>, <Sender-name>), (<Recipient-id-no.>, <Recipient-name>), <Message>)
+        self.on_direct_message = None
+        self.on_direct_failed = None    # Called like this: on_direct_failed(<Recipient as addressed>, <Reason>)
+        # Called like this: on_search_results(<Query>, <List of {"time", "room", "from", "message"} (newest first)>, <Error>)
+        self.on_search_results = None
+        # Called like this: on_file_offered(<Transfer-id>, <Sender-name>, <File-name>, <Size>)
+        # It returns the path to save the file at (None not to download it).
+        self.on_file_offered = None
+        # Called like this: on_file_progress(<File-path>, <Bytes done>, <Size>, <Bytes per second>) (done when all are)
+        self.on_file_progress = None
+        self.on_file_failed = None      # Called like this: on_file_failed(<File-path>, <Reason>)
+
+    def set_callbacks(self, on_chat_message = None, on_client_list = None, on_room_list = None, on_disconnect = None,\
+        on_queue_position = None, on_rate_limited = None, on_reconnecting = None, on_reconnected = None,\
+        on_direct_message = None, on_direct_failed = None, on_file_offered = None, on_file_progress = None,\
+        on_file_failed = None, on_search_results = None):
+        """Gets the functions to be called when the respective events happen (None to ignore an event).
+        'on_queue_position' is called from the thread which called 'connect', while it waits for a free slot
+            (it is not called while reconnecting)."""
+
+        self.on_chat_message = on_chat_message
+        self.on_client_list = on_client_list
+        self.on_room_list = on_room_list
+        self.on_disconnect = on_disconnect
+        self.on_queue_position = on_queue_position
+        self.on_rate_limited = on_rate_limited
+        self.on_reconnecting = on_reconnecting
+        self.on_reconnected = on_reconnected
+        self.on_direct_message = on_direct_message
+        self.on_direct_failed = on_direct_failed
+        self.on_search_results = on_search_results
+        self.on_file_offered = on_file_offered
+        self.on_file_progress = on_file_progress
+        self.on_file_failed = on_file_failed
+
+    def apply_settings(self, settings):
+        """Gets the runtime settings (see 'client_settings.py') and applies the socket tunables in them
+        (to the connections made from now on)."""
+
+        self.receive_buffer_size = settings["RECEIVE_BUFFER_SIZE"]
+        self.tcp_nodelay = settings["TCP_NODELAY_ENABLED"]
+        self.socket_send_buffer_size = settings["SOCKET_SEND_BUFFER_SIZE"]
+        self.socket_receive_buffer_size = settings["SOCKET_RECEIVE_BUFFER_SIZE"]
+
+    def connect(self, address, client_name):
+        """Gets the IP address of the server and the client name and,
+        Connects with the server,
+        Creates and starts a thread to receive messages from the server.
+        This is a non-blocking call, unless the server is full and puts the client in its waiting room
+            (then it waits until the client is accepted, reporting the position through 'on_queue_position').
+        Returns 0 if successfull
+        Returns 1 if denied
+        Returns 2 if error"""
+
+        self.server_address = address
+        self.client_name = client_name
+        self.session_token = None
+        self.last_sequence_number = 0
+        self.unsent_messages.clear()
+        self.closing_event.clear()
+        return self.open_connection()
+
+    def open_connection(self):
+        """Connects with the server (see 'connect'), resuming the session if this client has one.
+        Returns the same as 'connect'."""
+
+        try:
+            self.tune_socket()
+            self.client_socket.connect((self.server_address, self.server_port))
+            permission = self.receive_permission()
+        except:
+            self.client_socket.close()
+            self.client_socket = socket.socket()
+            return 2
+
+        if permission == DENY_MESSAGE:
+            self.client_socket.close()
+            self.client_socket = socket.socket()
+            return 1
+
+        elif permission == ACCEPT_MESSAGE:
+            self.client_socket.sendall(self.fetch_handshake())
+            # The server pings a silent client, so a longer silence of the server means that it is gone.
+            if HEARTBEATS_ENABLED and HEARTBEAT_TIMEOUT: self.client_socket.settimeout(HEARTBEAT_TIMEOUT)
+            received_messages = []
+            while received_messages == []: received_messages = self.receive_messages()
+            if received_messages is None: received_messages = [""]      # Connection lost in the handshake
+            if self.accept_client_list(received_messages[0]):
+                # The messages received along with the client list are handled by the receiving thread.
+                self.message_receive_thread = Thread(target = self.start_receiving_messages,\
+                    args = (received_messages[1:],))
+                self.message_receive_thread.start()
+                self.connected = True
+                return 0
+            else:
+                self.client_socket.close()
+                self.client_socket = socket.socket()
+                return 2
+
+        else:
+            self.client_socket.close()
+            self.client_socket = socket.socket()
+            return 2
+
+    def tune_socket(self):
+        """Applies the socket tunables (see 'apply_settings') to the client socket, before it connects."""
+
+        if self.socket_send_buffer_size:
+            self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.socket_send_buffer_size)
+        if self.socket_receive_buffer_size:
+            self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.socket_receive_buffer_size)
+        self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self.tcp_nodelay))
+
+    def receive_permission(self):
+        """Waits for the server to accept or deny this client and,
+        Returns the permission message (reporting the positions in the waiting room till then).
+        Returns an empty string if the connection is lost or the server sent something else.
+        Note: This function is a blocking call."""
+
+        permission = ""
+        while not(permission in (ACCEPT_MESSAGE, DENY_MESSAGE)):
+            data = self.client_socket.recv(MAX_MESSAGE_LENGTH)
+            if not(data): return ""
+            try: permission = self.parse_permission(permission + data.decode())
+            except ValueError: return ""
+        return permission
+
+    def parse_permission(self, permission):
+        """Gets the data received so far while waiting for the server to accept or deny this client and,
+        Reports the positions in the waiting room in it (the complete lines) and,
+        Returns the rest of the data (the permission message, once it is complete).
+        Raises ValueError if the server sent something else."""
+
+        *queue_position_messages, permission = permission.split("\n")
+        for queue_position_message in queue_position_messages:
+            if not(queue_position_message.startswith(QUEUE_POSITION_MESSAGE_PREFIX)): raise ValueError(queue_position_message)
+            queue_position = int(queue_position_message[len(QUEUE_POSITION_MESSAGE_PREFIX):])
+            if self.on_queue_position is not None and not(self.reconnecting): self.on_queue_position(queue_position)
+        if len(permission) > MAX_MESSAGE_LENGTH: raise ValueError("Too lengthy permission message")
+        return permission
+
+    def fetch_handshake(self):
+        """Returns the handshake (bytes) to be sent once the server accepts this client:
+        Negotiates the framing (and the compression, heartbeats and session) and sends the name of the client,
+            or asks to resume the session if it has one. All the messages after this are frames in both directions."""
+
+        self.frame_decoder = FrameDecoder()
+        self.heartbeat_missed = False
+        handshake_request = FRAMING_REQUEST + (COMPRESSION_REQUEST if COMPRESSION_ENABLED else "")\
+            + (HEARTBEAT_REQUEST if HEARTBEATS_ENABLED else "") + (SESSION_REQUEST if SESSIONS_ENABLED else "")
+        if self.session_token is None: client_name = self.client_name
+        else: client_name = RESUME_MESSAGE_PREFIX + json.dumps({"token": self.session_token,\
+            "last_seq": self.last_sequence_number, "name": self.client_name})
+        self.resuming = self.session_token is not None
+        return handshake_request.encode() + encode_frame(client_name)
+
+    def accept_client_list(self, message):
+        """Gets the first message received after the handshake and,
+        Applies it as the client list of the room. Returns False if it is not a client list, else True."""
+
+        message_type, separator, message_content = message.partition(":")
+        try:
+            if not(message_type + separator in (CLIENT_LIST_SNAPSHOT_MESSAGE_PREFIX,\
+                CLIENT_LIST_UPDATE_MESSAGE_PREFIX)): raise ValueError(message_type)
+            self.update_client_list(message_type + separator, message_content)
+        except (ValueError, TypeError, KeyError): return False
+        return True
+
+    def receive_messages(self):
+        """Waits for data from the server and,
+        Returns the list of complete messages in it (may be empty if a frame is incomplete).
+        Returns None if the connection is lost or the server sent an invalid frame.
+        Note: This function is a blocking call."""
+
+        try: data = self.client_socket.recv(self.receive_buffer_size)
+        except socket.timeout:
+            self.heartbeat_missed = True
+            return None
+        except: return None
+        if not(data): return None
+        try: return self.frame_decoder.feed(data)
+        except ValueError: return None
+
+    def start_receiving_messages(self, received_messages = ()):
+        """Receive the messages from the server and does the needful.
+        The messages which were already received can be given, they are handled first.
+        Note: This function is a blocking call."""
+
+        while 1:
+            for message in received_messages:
+                if not(self.process_server_message(message)): return
+            received_messages = self.receive_messages()
+            if received_messages is None:
+                # Even when the user closes the window, the code comes here! (Then it is neither reported nor resumed.)
+                if self.closing_event.is_set(): self.disconnect()
+                elif self.session_token is not None:
+                    if not(self.reconnect()): self.disconnect(CONNECTION_LOST_ALERT)
+                else: self.disconnect(CONNECTION_LOST_ALERT if self.heartbeat_missed else "")
+                break
+
+    def reconnect(self):
+        """Reconnects with the server after the connection was lost and resumes the session (see 'open_connection'),
+        Waiting a random delay of up to RECONNECT_INITIAL_DELAY (doubling every attempt, up to RECONNECT_MAX_DELAY)
+            before each attempt, so that the clients of a restarted server do not all come back at the same moment.
+        The chat messages sent meanwhile are sent once reconnected (back in the room, even if not resumed).
+        Returns True if reconnected (a new thread receives the messages then), else False.
+        Note: This function is a blocking call."""
+
+        room_name = self.room
+        self.connected = False
+        self.reconnecting = True
+        self.client_socket.close()
+        self.client_socket = socket.socket()
+        for attempt in range(1, RECONNECT_MAX_ATTEMPTS + 1):
+            delay = fetch_reconnect_delay(attempt)
+            if self.on_reconnecting is not None: self.on_reconnecting(attempt, delay)
+            if self.closing_event.wait(delay) or self.open_connection() == 0: break
+        self.reconnecting = False
+        if not(self.connected): return False
+        self.finish_reconnection(room_name)
+        return True
+
+    def finish_reconnection(self, room_name):
+        """Gets the room this client was in before the connection was lost and, once reconnected,
+        Goes back to it (if the session could not be resumed), sends the chat messages kept meanwhile and
+            resumes the files being sent and received."""
+
+        if self.room != room_name: self.join_room(room_name)
+        while self.unsent_messages: self.send_chat_message(self.unsent_messages.popleft())
+        self.resume_files()
+
+    def process_server_message(self, message):
+        """Gets a message received from the server and does the needful.
+        Returns False if the connection is over, else True."""
+
+        message_type, separator, message_content = message.partition(":")
+        if not(separator):
+            self.disconnect(JUNK_MESSAGE_ALERT)
+            return False
+
+        if message_type + ":" == CHAT_MESSAGE_PREFIX:
+            if self.on_chat_message is not None: self.on_chat_message(message_content)
+
+        elif message_type + ":" == SEQUENCED_MESSAGE_PREFIX:
+            sequence_number, separator, sequenced_message = message_content.partition(":")
+            try: self.last_sequence_number = int(sequence_number)
+            except ValueError:
+                self.disconnect(JUNK_MESSAGE_ALERT)
+                return False
+            return self.process_server_message(sequenced_message)
+
+        elif message_type + ":" == SESSION_MESSAGE_PREFIX:
+            try:
+                session_data = json.loads(message_content)
+                self.session_token = str(session_data["token"])
+                # The missed messages (if resumed) come before this, the later ones come after this.
+                self.last_sequence_number = int(session_data["seq"])
+                complete = bool(session_data["resumed"]) and bool(session_data["complete"])
+            except (ValueError, TypeError, KeyError):
+                self.disconnect(JUNK_MESSAGE_ALERT)
+                return False
+            if self.resuming:
+                self.resuming = False
+                if self.on_reconnected is not None: self.on_reconnected(complete)
+
+        elif message_type + ":" in (CLIENT_LIST_SNAPSHOT_MESSAGE_PREFIX, CLIENT_LIST_DELTA_MESSAGE_PREFIX,\
+            CLIENT_LIST_UPDATE_MESSAGE_PREFIX):
+            try: self.update_client_list(message_type + ":", message_content)
+            except (ValueError, TypeError, KeyError):
+                self.disconnect(JUNK_MESSAGE_ALERT)
+                return False
+
+        elif message_type + ":" in (DIRECT_MESSAGE_PREFIX, DIRECT_FAILED_MESSAGE_PREFIX):
+            try:
+                direct_data = json.loads(message_content)
+                if message_type + ":" == DIRECT_MESSAGE_PREFIX:
+                    sender, recipient = tuple(direct_data["from"]), tuple(direct_data["to"])
+                    if self.on_direct_message is not None:
+                        self.on_direct_message(sender, recipient, str(direct_data["message"]))
+                elif self.on_direct_failed is not None:
+                    self.on_direct_failed(direct_data["to"], str(direct_data["reason"]))
+            except (ValueError, TypeError, KeyError):
+                self.disconnect(JUNK_MESSAGE_ALERT)
+                return False
+
+        elif message_type + ":" == SEARCH_RESULTS_MESSAGE_PREFIX:
+            try:
+                search_data = json.loads(message_content)
+                if self.on_search_results is not None: self.on_search_results(search_data["query"],\
+                    list(search_data.get("results", [])), search_data.get("error"))
+            except (ValueError, TypeError, KeyError):
+                self.disconnect(JUNK_MESSAGE_ALERT)
+                return False
+
+        elif message_type + ":" == FILE_CHUNK_MESSAGE_PREFIX:
+            try: self.receive_file_chunk(message_content)
+            except (ValueError, binascii.Error):
+                self.disconnect(JUNK_MESSAGE_ALERT)
+                return False
+
+        elif message_type + ":" in (FILE_OFFERED_MESSAGE_PREFIX, FILE_ACCEPTED_MESSAGE_PREFIX,\
+            FILE_REJECTED_MESSAGE_PREFIX, FILE_COMPLETE_MESSAGE_PREFIX):
+            try: self.process_file_message(message_type + ":", json.loads(message_content))
+            except (ValueError, TypeError, KeyError, AttributeError):
+                self.disconnect(JUNK_MESSAGE_ALERT)
+                return False
+
+        elif message_type + ":" == PING_MESSAGE_PREFIX:
+            try: self.send_frame(PONG_MESSAGE_PREFIX + message_content)
+            except OSError: pass        # The receiving side finds the connection lost
+
+        elif message_type + ":" == RATE_LIMITED_MESSAGE_PREFIX:
+            try:
+                rate_limit_data = json.loads(message_content)
+                action, retry_after = str(rate_limit_data["action"]), float(rate_limit_data.get("retry_after", 0))
+            except (ValueError, TypeError, KeyError, AttributeError): action, retry_after = "", 0.0
+            if action == "disconnect": self.session_token = None     # Not to be resumed
+            if self.on_rate_limited is not None: self.on_rate_limited(action, retry_after)
+
+        elif message_type + ":" == ROOM_LIST_MESSAGE_PREFIX:
+            try: room_list = [room_name for room_name, no_of_members in json.loads(message_content)]
+            except (ValueError, TypeError): room_list = [self.room]
+            if self.on_room_list is not None: self.on_room_list(room_list, self.room)
+
+        elif message_type + ":" == SHUTDOWN_MESSAGE_PREFIX:
+            self.disconnect(SHUTDOWN_ALERT)
+            return False
+
+        else:
+            self.disconnect(JUNK_MESSAGE_ALERT)
+            return False
+
+        return True
+
+    def send_file(self, path):
+        """Gets the path of a file and offers it to the room (the members of the room can download it),
+        Uploading it in chunks from a background thread once the server accepts it.
+        The progress is reported through 'on_file_progress' (and a failure through 'on_file_failed').
+        Returns False if the file cannot be sent (too large, not readable or not connected), else True."""
+
+        try: size = os.path.getsize(path)
+        except OSError: return False
+        if size > MAX_FILE_SIZE or not(self.connected): return False
+        outgoing_file = OutgoingFile(self.next_file_reference, path, size)
+        self.next_file_reference += 1
+        self.outgoing_files[outgoing_file.reference] = outgoing_file
+        try: self.send_frame(FILE_OFFER_MESSAGE_PREFIX + json.dumps({"name": os.path.basename(path), "size": size,\
+            "ref": outgoing_file.reference}))
+        except OSError: pass        # Offered again once reconnected
+        return True
+
+    def process_file_message(self, message_prefix, file_data):
+        """Gets the prefix and the (decoded JSON) content of a file message (other than a chunk) and does the needful."""
+
+        if message_prefix == FILE_OFFERED_MESSAGE_PREFIX:
+            transfer_id, size = str(file_data["id"]), int(file_data["size"])
+            path = None
+            if self.on_file_offered is not None:
+                path = self.on_file_offered(transfer_id, str(file_data["from"]), str(file_data["name"]), size)
+            if path is not None: self.download_file(transfer_id, size, path)
+
+        elif message_prefix == FILE_ACCEPTED_MESSAGE_PREFIX:
+            outgoing_file = self.outgoing_files.get(file_data["ref"])
+            if outgoing_file is None: return
+            outgoing_file.transfer_id, outgoing_file.key = str(file_data["id"]), str(file_data["key"])
+            outgoing_file.start(int(file_data["offset"]))
+            self.start_upload(outgoing_file)
+
+        elif message_prefix == FILE_COMPLETE_MESSAGE_PREFIX:
+            for reference, outgoing_file in list(self.outgoing_files.items()):
+                if outgoing_file.transfer_id != file_data["id"]: continue
+                del self.outgoing_files[reference]
+                if self.on_file_progress is not None: self.on_file_progress(outgoing_file.path, outgoing_file.size,\
+                    outgoing_file.size, float(file_data["bytes_per_second"]))
+
+        else:
+            if "ref" in file_data: file = self.outgoing_files.pop(file_data["ref"], None)
+            else: file = self.incoming_files.pop(file_data.get("id"), None)
+            if file is None: return
+            file.close()
+            if self.on_file_failed is not None: self.on_file_failed(file.path, str(file_data["reason"]))
+
+    def start_upload(self, outgoing_file):
+        """Gets a file accepted by the server and starts sending it from a background thread (see 'upload_file')."""
+
+        Thread(target = self.upload_file, args = (outgoing_file, outgoing_file.generation), daemon = True).start()
+
+    def upload_file(self, outgoing_file, generation):
+        """Gets a file accepted by the server and the generation of the acceptance and,
+        Sends the file in chunks from where the server asked for (until the file is sent or is accepted again,
+            as the client reconnected). The chat messages sent meanwhile go between the chunks.
+        Note: This function is a blocking call."""
+
+        try:
+            with open(outgoing_file.path, "rb") as file:
+                file.seek(outgoing_file.offset)
+                while outgoing_file.offset < outgoing_file.size and outgoing_file.generation == generation:
+                    self.send_file_chunk(outgoing_file, file)
+        except OSError as error:
+            # The connection was lost (the upload is resumed once reconnected) or the file cannot be read.
+            if self.connected and outgoing_file.generation == generation\
+                and self.outgoing_files.pop(outgoing_file.reference, None) is not None:
+                if self.on_file_failed is not None: self.on_file_failed(outgoing_file.path, str(error))
+
+    def send_file_chunk(self, outgoing_file, file):
+        """Gets a file being sent and its file object (at the offset) and sends the next chunk of it.
+        Raises OSError if the connection is lost or the file cannot be read."""
+
+        data = file.read(min(FILE_CHUNK_SIZE, outgoing_file.size - outgoing_file.offset))
+        if not(data): raise OSError("The file got shorter")
+        self.send_frame(f"{FILE_CHUNK_MESSAGE_PREFIX}{outgoing_file.transfer_id}:{outgoing_file.offset}:"\
+            + base64.b64encode(data).decode())
+        outgoing_file.offset += len(data)
+        if self.on_file_progress is not None and outgoing_file.offset < outgoing_file.size:
+            self.on_file_progress(outgoing_file.path, outgoing_file.offset, outgoing_file.size, outgoing_file.fetch_rate())
+
+    def download_file(self, transfer_id, size, path):
+        """Gets the id and size of a file offered in the room and the path to save it at and,
+        Asks the server for the file. The chunks are written as they come (see 'receive_file_chunk')."""
+
+        try: incoming_file = IncomingFile(transfer_id, path, size)
+        except OSError as error:
+            if self.on_file_failed is not None: self.on_file_failed(path, str(error))
+            return
+        if not(size):
+            incoming_file.close()
+            if self.on_file_progress is not None: self.on_file_progress(path, 0, 0, 0.0)
+            return
+        self.incoming_files[transfer_id] = incoming_file
+        incoming_file.start(0)
+        if self.connected:
+            try: self.send_frame(FILE_REQUEST_MESSAGE_PREFIX + json.dumps({"id": transfer_id, "offset": 0}))
+            except OSError: pass    # Asked again once reconnected
+
+    def receive_file_chunk(self, message_content):
+        """Gets the content of a chunk of a file being downloaded and writes it at its offset.
+        Raises ValueError or binascii.Error if the chunk is broken."""
+
+        transfer_id, separator, chunk = message_content.partition(":")
+        offset, separator, data = chunk.partition(":")
+        incoming_file = self.incoming_files.get(transfer_id)
+        if incoming_file is None: return
+        offset, data = int(offset), base64.b64decode(data, validate = True)
+        if offset + len(data) > incoming_file.size: raise ValueError("Chunk beyond the end of the file")
+        incoming_file.file.seek(offset)
+        incoming_file.file.write(data)
+        incoming_file.offset = max(incoming_file.offset, offset + len(data))
+        if incoming_file.offset >= incoming_file.size:
+            del self.incoming_files[transfer_id]
+            incoming_file.close()
+        if self.on_file_progress is not None: self.on_file_progress(incoming_file.path, incoming_file.offset,\
+            incoming_file.size, incoming_file.fetch_rate())
+
+    def resume_files(self):
+        """Resumes the uploads and the downloads from where they were, after a reconnection."""
+
+        try:
+            for outgoing_file in list(self.outgoing_files.values()):
+                if outgoing_file.transfer_id is None: file_offer = {"name": os.path.basename(outgoing_file.path),\
+                    "size": outgoing_file.size, "ref": outgoing_file.reference}
+                else: file_offer = {"id": outgoing_file.transfer_id, "key": outgoing_file.key, "ref": outgoing_file.reference}
+                self.send_frame(FILE_OFFER_MESSAGE_PREFIX + json.dumps(file_offer))
+            for incoming_file in list(self.incoming_files.values()):
+                incoming_file.start(incoming_file.offset)
+                self.send_frame(FILE_REQUEST_MESSAGE_PREFIX + json.dumps({"id": incoming_file.transfer_id,\
+                    "offset": incoming_file.offset}))
+        except OSError: pass        # The receiving side finds the connection lost
+
+    def update_client_list(self, message_prefix, message_content):
+        """Gets the prefix and the (JSON) content of a client list message and,
+        Applies the full client list or the change in it and reports the new client list."""
+
+        client_list_data = json.loads(message_content)
+        if message_prefix == CLIENT_LIST_SNAPSHOT_MESSAGE_PREFIX:
+            self.room = client_list_data["room"]
+            self.client_list = {client_id_number: client_name\
+                for client_id_number, client_name in client_list_data["clients"]}
+        elif message_prefix == CLIENT_LIST_DELTA_MESSAGE_PREFIX:
+            for client_id_number in client_list_data.get("removed", []): self.client_list.pop(client_id_number, None)
+            for client_id_number, client_name in client_list_data.get("added", []):
+                self.client_list[client_id_number] = client_name
+        else:
+            self.client_list = dict(enumerate(client_list_data))
+        if self.on_client_list is not None: self.on_client_list(list(self.client_list.values()))
+
+    def join_room(self, room_name):
+        """Gets a room name and asks the server to move this client to that room."""
+
+        if self.connected: self.send_frame(JOIN_ROOM_MESSAGE_PREFIX + room_name)
+
+    def leave_room(self):
+        """Asks the server to move this client back to the default room."""
+
+        if self.connected: self.send_frame(LEAVE_ROOM_MESSAGE_PREFIX)
+
+    def request_room_list(self):
+        """Asks the server for the list of rooms."""
+
+        if self.connected: self.send_frame(LIST_ROOMS_MESSAGE_PREFIX)
+
+    def disconnect(self, message = ""):
+        """Disconnects from the server and reports it (with the reason, if it was not expected)."""
+
+        self.connected = False
+        self.client_list = {}       # Will contain items like this: <Client-id-no.>: <Client-name>
+        self.room = DEFAULT_ROOM_NAME
+        self.session_token = None
+        for file in list(self.outgoing_files.values()) + list(self.incoming_files.values()): file.close()
+        self.outgoing_files, self.incoming_files = {}, {}
+        self.client_socket.close()
+        self.client_socket = socket.socket()
+        if self.on_disconnect is not None: self.on_disconnect(message)
+
+    def send_chat_message(self, message):
+        """Gets the given string chat message and sends it to the server,
+        Or keeps it to be sent once reconnected, if the connection is lost (see 'reconnect')."""
+
+        if self.connected:
+            try: self.send_frame(CHAT_MESSAGE_PREFIX + message)
+            except OSError: self.unsent_messages.append(message)   # The receiving side finds the connection lost
+        elif self.reconnecting: self.unsent_messages.append(message)
+
+    def send_direct_message(self, recipient, message):
+        """Gets the id number (int) or name (str) of a client and a string message and,
+        Sends the message to that client only (it comes back through 'on_direct_message' once delivered).
+        A name works only if no other client has it, so the id number (see 'client_list') is preferred."""
+
+        if self.connected:
+            try: self.send_frame(DIRECT_MESSAGE_PREFIX + json.dumps({"to": recipient, "message": message}))
+            except OSError: pass        # The receiving side finds the connection lost
+
+    def search_chat(self, words, sender_name = None, since = None, until = None, all_rooms = False):
+        """Gets the words to search for and the optional filters (the name of the sender and the time range as
+            timestamps) and asks the server for the recent chat messages which match (in the current room or all of them).
+        The results come through 'on_search_results'."""
+
+        search_request = {"query": words}
+        if sender_name is not None: search_request["from"] = sender_name
+        if since is not None: search_request["since"] = since
+        if until is not None: search_request["until"] = until
+        if all_rooms: search_request["room"] = None
+        if self.connected:
+            try: self.send_frame(SEARCH_MESSAGE_PREFIX + json.dumps(search_request))
+            except OSError: pass        # The receiving side finds the connection lost
+
+    def send_frame(self, message):
+        """Gets a string message and sends it to the server as a frame.
+        Can be called from any thread (the frames are never interleaved)."""
+
+        with self.send_lock: self.client_socket.sendall(encode_frame(message))
+
+    def shutdown(self):
+        """Shuts down the client.
+        Informs the server that this client is shuted down.
+        Closes the client socket.
+        Terminates the message receiving thread."""
+
+        self.closing_event.set()
+        if self.connected:
+            try: self.send_frame(SHUTDOWN_MESSAGE_PREFIX + "ClientTerminated")
+            except OSError: pass
+            self.client_socket.close()
+            self.message_receive_thread.join()
+        elif self.reconnecting:
+            self.client_socket.close()      # Interrupts the attempt in progress (if any)
+            self.message_receive_thread.join()
+            # As a new socket will be reopenned in the same name, we have to close it second time.
+        self.client_socket.close()
+
+
+class OutgoingFile(object):
+    """A file being sent (see 'send_file'), from the given path, with the given size and reference no.
+    'generation' changes every time the server accepts the file, so that the thread sending it before stops."""
+
+    def __init__(self, reference, path, size):
+        self.reference = reference
+        self.path = path
+        self.size = size
+        self.transfer_id = None         # Given by the server when it accepts the file
+        self.key = None                 # Given by the server (needed to resume the upload)
+        self.offset = 0                 # Bytes sent so far
+        self.generation = 0
+        self.started_at = time.monotonic()
+        self.start_offset = 0
+        self.file = None                # Opened by the senders which send it chunk by chunk (see 'qt_client_core.py')
+
+    def start(self, offset):
+        """Gets the offset to send the file from (the server had received the bytes before it) and starts from it."""
+
+        self.generation += 1
+        self.offset = self.start_offset = offset
+        self.started_at = time.monotonic()
+
+    def fetch_rate(self):
+        """Returns the bytes sent per second since the file was (re)started."""
+
+        seconds = time.monotonic() - self.started_at
+        return (self.offset - self.start_offset) / seconds if seconds > 0 else 0.0
+
+    def close(self):
+        """Closes the file (if it is open)."""
+
+        if self.file is not None: self.file.close()
+        self.file = None
+
+
+class IncomingFile(OutgoingFile):
+    """A file being received (see 'download_file'), with the given transfer id, to the given path, with the given size.
+    The file is created (or truncated) when the instance is created."""
+
+    def __init__(self, transfer_id, path, size):
+        super().__init__(None, path, size)
+        self.transfer_id = transfer_id
+        self.file = open(path, "wb")    # 'offset' is the bytes received so far (as much of it is kept when closed)
+
+
+def fetch_reconnect_delay(attempt):
+    """Returns the random delay (in seconds) before the given attempt to reconnect: up to RECONNECT_INITIAL_DELAY,
+    doubling every attempt (up to RECONNECT_MAX_DELAY), so that the clients of a restarted server do not all
+    come back at the same moment."""
+
+    return random.uniform(0, min(RECONNECT_MAX_DELAY, RECONNECT_INITIAL_DELAY * 2 ** (attempt - 1)))
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the GUI-free client core.\n\
+Run 'group_chat_client.py' to start the client-side application.\n\
+")
+
+
+# END
@@ -0,0 +1,143 @@
+"""
+---------------
+CLIENT SETTINGS
+---------------
+
+* The runtime configuration of the Group Chat client: the tunables of 'client_config.py' listed in SETTINGS
+    can be overridden without editing it by (in the order of precedence, the last one wins):
+    the settings file (a JSON object, see SETTINGS_FILE_PATH), the environment variables
+    (like GROUPCHAT_CLIENT_SERVER_LISTENING_PORT=50001) and the command line options (like --server-listening-port 50001).
+* The same as 'server_settings.py' of the server, without the profiles and the reloading.
+
+"""
+
+
+import argparse
+import json
+import os
+#from ... import ...
+
+import client_config
+from client_config import *
+
+
+SETTINGS = {
+    # <Name>: (<Type>, <Can be None>)
+    "SERVER_LISTENING_PORT":        (int, False),
+    "CLIENT_TRANSPORT":             (str, False),
+    "RECEIVE_BUFFER_SIZE":          (int, False),
+    "TCP_NODELAY_ENABLED":          (bool, False),
+    "SOCKET_SEND_BUFFER_SIZE":      (int, False),
+    "SOCKET_RECEIVE_BUFFER_SIZE":   (int, False),
+}
+SETTING_CHOICES = {"CLIENT_TRANSPORT": ("qt", "thread")}
+MIN_SETTING_VALUES = {"RECEIVE_BUFFER_SIZE": 1}
+
+
+def fetch_default_settings():
+    """Returns the settings as in 'client_config.py' (a dictionary like this: <Name>: <Value>)."""
+
+    return {name: getattr(client_config, name) for name in SETTINGS}
+
+
+def parse_setting(name, value):
+    """Gets the name of a setting and its value (as given in the settings file, or as a string) and,
+    Returns the value as the type of the setting. Raises ValueError if it is not a valid value for the setting."""
+
+    if not(name in SETTINGS): raise ValueError(f"Unknown setting: {name}")
+    setting_type, nullable = SETTINGS[name]
+    if value is None or (nullable and isinstance(value, str) and value.lower() in ("", "none")):
+        if nullable: return None
+        raise ValueError(f"{name} cannot be none")
+
+    if setting_type is bool:
+        if isinstance(value, bool): return value
+        if isinstance(value, str) and value.lower() in ("1", "true", "yes", "on"): return True
+        if isinstance(value, str) and value.lower() in ("0", "false", "no", "off"): return False
+        raise ValueError(f"{name} must be true or false, not {value!r}")
+    if setting_type is str:
+        if not(isinstance(value, str)): raise ValueError(f"{name} must be a string, not {value!r}")
+        parsed_value = value
+    else:
+        if isinstance(value, bool) or not(isinstance(value, (str, int, float))):
+            raise ValueError(f"{name} must be a number, not {value!r}")
+        try: parsed_value = setting_type(value)
+        except ValueError: raise ValueError(f"{name} must be {'an integer' if setting_type is int else 'a number'},\
+ not {value!r}") from None
+        if setting_type is int and isinstance(value, float) and parsed_value != value:
+            raise ValueError(f"{name} must be an integer, not {value!r}")
+        if parsed_value < MIN_SETTING_VALUES.get(name, 0): raise ValueError(f"{name} is too small: {value!r}")
+
+    choices = SETTING_CHOICES.get(name)
+    if choices is not None and not(parsed_value in choices):
+        raise ValueError(f"{name} must be one of {', '.join(choices)}, not {value!r}")
+    return parsed_value
+
+
+def read_settings_file(settings_file_path):
+    """Gets the path of a settings file (a JSON object like this: {<Name>: <Value>, ...}) and,
+    Returns the settings in it (none if the path is None or the file does not exist).
+    Raises ValueError if the file cannot be read or has an invalid setting."""
+
+    if settings_file_path is None or not(os.path.exists(settings_file_path)): return {}
+    try:
+        with open(settings_file_path) as settings_file: file_settings = json.load(settings_file)
+        if not(isinstance(file_settings, dict)): raise ValueError("Not a JSON object")
+        return {name: parse_setting(name, value) for name, value in file_settings.items()}
+    except (OSError, ValueError) as error: raise ValueError(f"{settings_file_path}: {error}") from None
+
+
+def read_environment_settings(environment):
+    """Gets the environment variables (a dictionary) and,
+    Returns the settings given in them (named like SETTINGS_ENVIRONMENT_PREFIX + <Name>).
+    Raises ValueError if any of them is invalid."""
+
+    return {name: parse_setting(name, environment[SETTINGS_ENVIRONMENT_PREFIX + name]) for name in SETTINGS\
+        if SETTINGS_ENVIRONMENT_PREFIX + name in environment}
+
+
+def load_settings(argument_settings = None, settings_file_path = SETTINGS_FILE_PATH, environment = None):
+    """Gets the settings given on the command line (see 'fetch_argument_settings'), the path of the settings file
+        and the environment variables (of this process, if not given) and,
+    Returns all the settings, the defaults of 'client_config.py' overridden by the settings file,
+        then by the environment and the command line.
+    Raises ValueError if any setting is invalid."""
+
+    settings = fetch_default_settings()
+    settings.update(read_settings_file(settings_file_path))
+    settings.update(read_environment_settings(os.environ if environment is None else environment))
+    settings.update(argument_settings or {})
+    return settings
+
+
+def add_setting_arguments(argument_parser):
+    """Gets an argument parser and adds an option for every setting to it (like --client-transport for CLIENT_TRANSPORT),
+    And the option for the path of the settings file (--settings-file)."""
+
+    argument_parser.add_argument("--settings-file", default = SETTINGS_FILE_PATH, metavar = "PATH",\
+        help = f"the JSON file of the settings (default: {SETTINGS_FILE_PATH})")
+    argument_group = argument_parser.add_argument_group("settings",\
+        f"(override the settings file and the {SETTINGS_ENVIRONMENT_PREFIX}<NAME> environment variables)")
+    for name, (setting_type, nullable) in SETTINGS.items():
+        argument_group.add_argument("--" + name.lower().replace("_", "-"), dest = name, metavar = "VALUE",\
+            default = argparse.SUPPRESS, help = f"{setting_type.__name__}{' or none' if nullable else ''}\
+ (default: {getattr(client_config, name)})")
+
+
+def fetch_argument_settings(arguments):
+    """Gets the arguments parsed by a parser with the setting options (see 'add_setting_arguments') and,
+    Returns the settings given in them. Raises ValueError if any of them is invalid."""
+
+    return {name: parse_setting(name, getattr(arguments, name)) for name in SETTINGS if hasattr(arguments, name)}
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the runtime settings of the client.\n\
+Run 'group_chat_client.py --help' to see the settings.\n\
+")
+
+
+# END
@@ -4,32 +4,57 @@ GROUP CHAT CLIENT
 -----------------
 
 * Acts as the client for the group chat application.
-* This is the backend implementation.
+* This is the backend implementation (the GUI consumer of 'ClientCore' from 'client_core.py').
+* PyQt5 is imported only when the GUI client is created, so importing this module stays cheap.
+* 'create_client' creates the client with the transport set by CLIENT_TRANSPORT: "qt" runs the networking in the
+    Qt event loop (see 'qt_client_core.py'), so the GUI is never touched from another thread, and "thread"
+    runs it in a background thread (like the headless clients).
+* The port, the transport and the socket tunables can be set without editing 'client_config.py'
+    (see 'client_settings.py', or run with --help).
 
 """
 
 
-import socket
+import argparse
+import sys
 #import ...
-from threading import Thread
+#from ... import ...
 
-from app_gui import *
+from client_config import *
+from client_core import ClientCore
+from client_settings import add_setting_arguments, fetch_argument_settings, load_settings
 
 
-class GroupChatClient(object):
-    """Acts as the client for Group Chat application.
-    The port to which the client should request for connection with server, 
+class GroupChatClient(ClientCore):
+    """Acts as the client for Group Chat application (with the GUI).
+    The port to which the client should request for connection with server,
         should be given when the class instance is created."""
 
     def __init__(self, server_port):
-        self.client_socket = socket.socket()
-        self.server_port = server_port
-        self.connected = False
+        super().__init__(server_port)
+        from app_gui import AlertSignal, QtWidgets, Ui_Window
 
         self.alert_message = ""
         self.alert_signal = AlertSignal()
         self.qt_app = QtWidgets.QApplication(sys.argv)
         self.gui_window = Ui_Window()
+        self.set_callbacks(on_chat_message = self.gui_window.show_chat_message,\
+            on_client_list = self.gui_window.update_client_list,\
+            on_room_list = self.gui_window.update_room_list,\
+            on_disconnect = self.show_disconnection,\
+            on_queue_position = self.gui_window.show_queue_position,\
+            on_rate_limited = self.gui_window.show_rate_limit,\
+            on_reconnecting = self.gui_window.show_reconnecting,\
+            on_reconnected = self.gui_window.show_reconnected,\
+            on_direct_message = self.gui_window.show_direct_message,\
+            on_direct_failed = self.gui_window.show_direct_failure,\
+            on_file_offered = self.gui_window.accept_file,\
+            on_file_progress = self.gui_window.show_file_progress,\
+            on_file_failed = self.gui_window.show_file_failure,\
+            on_search_results = self.gui_window.show_search_results)
+        if not(self.blocking_connect):
+            self.set_connection_callbacks(on_connection_state = self.gui_window.show_connection_state,\
+                on_connect_result = self.gui_window.show_connect_result)
         #self.client_threads = {}
 
     def open_gui_window(self):
@@ -39,125 +64,40 @@ class GroupChatClient(object):
         self.gui_window.show()
         sys.exit(self.qt_app.exec_())
 
-    def connect(self, address, client_name):
-        """Gets the IP address of the server and the client name and,
-        Connects with the server,
-        Creates and starts a thread to receive messages from the server.
-        This is a non-blocking call.
-        Returns 0 if successfull 
-        Returns 1 if denied 
-        Returns 2 if error"""
-
-        try:
-            self.client_socket.connect((address, self.server_port))
-            permission = self.client_socket.recv(MAX_MESSAGE_LENGTH).decode()
-        except:
-            self.client_socket.close()
-            self.client_socket = socket.socket()
-            return 2
-
-        if permission == DENY_MESSAGE:
-            self.client_socket.close()
-            self.client_socket = socket.socket()
-            return 1
-
-        elif permission == ACCEPT_MESSAGE:
-            self.client_socket.send(client_name.encode())
-            client_list_message = self.client_socket.recv(MAX_MESSAGE_LENGTH).decode()
-            message_type, message_content = client_list_message.split(":")
-            if message_type + ":" == CLIENT_LIST_UPDATE_MESSAGE_PREFIX:
-                client_list = eval(message_content)
-                self.gui_window.update_client_list(client_list)
-                self.message_receive_thread = Thread(target = self.start_receiving_messages)
-                self.message_receive_thread.start()
-                self.connected = True
-                return 0
-            else:
-                self.client_socket.close()
-                self.client_socket = socket.socket()
-                return 2
-
-        else:
-            self.client_socket.close()
-            self.client_socket = socket.socket()
-            return 2
-
-    def start_receiving_messages(self):
-        """Receive the messages from the server and does the needful.
-        Note: This function is a blocking call."""
+    def show_disconnection(self, message):
+        """Gets the reason of the disconnection and,
+        Raises an alert with it in the GUI thread (if any) and resets the GUI to the connecting area."""
 
-        while 1:
-            try: message = self.client_socket.recv(MAX_MESSAGE_LENGTH).decode()
-            except: message = ""
-            if not(message):
-                # Don't do the below todo, as even when the user closes the window, the code comes here!
-                # todo: Raise an error message in the GUI window that the server had disconnected unexpectedly.
-                self.disconnect()
-                break
-            #message_type, message_content = message.split(":")
-            message_list = message.split(":")
-            if len(message_list) == 2:
-                message_type, message_content = message_list
-            else:
-                self.disconnect("Server had sent some junk message...\n\
-Its advisable to close the window and reopen the application.\n\
-(or just reconnect with the server)")
-                break
-
-            if message_type + ":" == CHAT_MESSAGE_PREFIX:
-                self.gui_window.show_chat_message(message_content)
-
-            elif message_type + ":" == CLIENT_LIST_UPDATE_MESSAGE_PREFIX:
-                client_list = eval(message_content)
-                self.gui_window.update_client_list(client_list)
-
-            elif message_type + ":" == SHUTDOWN_MESSAGE_PREFIX:
-                self.disconnect("The server had shutted down.\n\
-Sorry for the inconvenience. Try chatting later!")
-                break
-
-            else:
-                self.disconnect("Server had sent some junk message...\n\
-Its advisable to close the window and reopen the application.\n\
-(or just reconnect with the server)")
-                break
-
-    def disconnect(self, message = ""):
-        """Disconnects from the server."""
-
-        self.connected = False
-        self.client_socket.close()
-        self.client_socket = socket.socket()
         if message:
             self.alert_message = message
             self.alert_signal.signal.emit()
             #self.gui_window.alert(message)
         self.gui_window.set_gui_active_area()
 
-    def send_chat_message(self, message):
-        """Gets the given string chat message and sends it to the server."""
-
-        if self.connected: self.client_socket.send((CHAT_MESSAGE_PREFIX + message).encode())
 
-    def shutdown(self):
-        """Shuts down the client.
-        Informs the server that this client is shuted down.
-        Closes the client socket.
-        Terminates the message receiving thread."""
+def create_client(server_port, transport = CLIENT_TRANSPORT):
+    """Gets the port of the server and the transport ("qt" or "thread", see CLIENT_TRANSPORT) and,
+    Returns the GUI client using that transport."""
 
-        if self.connected:
-            self.client_socket.send((SHUTDOWN_MESSAGE_PREFIX + "ClientTerminated").encode())
-            self.client_socket.close()
-            self.message_receive_thread.join()
-            # As a new socket will be reopenned in the same name, we have to close it second time.
-        self.client_socket.close()
+    if transport == "thread": return GroupChatClient(server_port)
+    if transport != "qt": raise ValueError(f"Unknown client transport: {transport}")
+    from qt_client_core import QtClientCore
 
+    class QtGroupChatClient(GroupChatClient, QtClientCore):
+        """Acts as the client for Group Chat application (with the GUI), driven by the Qt event loop."""
 
-#def ...(...):
+    return QtGroupChatClient(server_port)
 
 
 if __name__ == '__main__':
-    client = GroupChatClient(SERVER_LISTENING_PORT)
+    argument_parser = argparse.ArgumentParser(description = "Starts the client of the Group Chat application.")
+    add_setting_arguments(argument_parser)
+    arguments = argument_parser.parse_args()
+    try: settings = load_settings(fetch_argument_settings(arguments), arguments.settings_file)
+    except ValueError as error: argument_parser.error(str(error))
+
+    client = create_client(settings["SERVER_LISTENING_PORT"], settings["CLIENT_TRANSPORT"])
+    client.apply_settings(settings)
     client.gui_window.set_client(lambda: client)
     client.open_gui_window()
 
@@ -0,0 +1,106 @@
+"""
+---------------
+MESSAGE FRAMING
+---------------
+
+* Length-prefixed framing of the chat protocol messages.
+* Every frame is a 4 byte (big-endian) payload length followed by the UTF-8 encoded message.
+* Contains the class called 'FrameDecoder' which decodes a stream of bytes into messages 
+    over a reusable buffer, so that many messages can be read per 'recv'.
+* The framing is negotiated in the handshake: After 'RequestAccepted', 
+    the client sends FRAMING_REQUEST immediately followed by its name as a frame.
+* The compression can be negotiated too, by sending COMPRESSION_REQUEST between FRAMING_REQUEST and the name.
+    A compressed frame has the top bit of its length set and carries the message deflated (raw zlib)
+    with a preset dictionary of the common protocol text, so that each frame can be inflated on its own
+    (and a broadcast is compressed only once for all its recipients).
+    Only the messages of at least COMPRESSION_THRESHOLD bytes are compressed.
+
+"""
+
+
+import struct
+import zlib
+#import ...
+#from ... import ...
+
+from client_config import *
+
+
+FRAME_HEADER = struct.Struct("!I")
+COMPRESSED_FLAG = 0x80000000
+COMPRESSION_DICTIONARY = (
+    '{"room": "Lobby", "clients": [[1, "'
+    '{"added": [[", "removed": [", "], ["'
+    'UpdateClientList:["ClientListSnapshot:ClientListDelta:RoomList:[["Lobby", '
+    'ShutDown:ServerTerminatedChat:'
+).encode()
+
+
+class FrameDecoder(object):
+    """Decodes a stream of bytes into messages.
+    The bytes of an incomplete frame are kept in the buffer until the rest of the frame arrives."""
+
+    def __init__(self, max_frame_length = MAX_FRAME_LENGTH):
+        self.buffer = bytearray()
+        self.max_frame_length = max_frame_length
+
+    def feed(self, data):
+        """Gets the bytes received from the socket and,
+        Returns the list of the complete messages (strings) decoded so far.
+        Raises ValueError if a frame is longer (even when inflated) than the allowed max. frame length or
+            a compressed frame is corrupt."""
+
+        self.buffer += data
+        messages = []
+        offset = 0
+        buffer_length = len(self.buffer)
+        while buffer_length - offset >= FRAME_HEADER.size:
+            frame_length = FRAME_HEADER.unpack_from(self.buffer, offset)[0]
+            compressed = frame_length & COMPRESSED_FLAG
+            frame_length &= ~COMPRESSED_FLAG
+            if frame_length > self.max_frame_length:
+                raise ValueError(f"Frame of {frame_length} bytes exceeds the max. frame length")
+            frame_end = offset + FRAME_HEADER.size + frame_length
+            if frame_end > buffer_length: break
+            if compressed: payload = decompress_payload(self.buffer[offset + FRAME_HEADER.size:frame_end], self.max_frame_length)
+            else: payload = self.buffer[offset + FRAME_HEADER.size:frame_end]
+            if payload: messages.append(payload.decode(errors = "replace"))
+            offset = frame_end
+        # Deleting from the front of a bytearray does not reallocate it.
+        if offset: del self.buffer[:offset]
+        return messages
+
+
+def encode_frame(message, compress = False):
+    """Gets a string message and returns it as a frame (bytes).
+    If 'compress' is True, the message is compressed when it is long enough and compressing makes it shorter."""
+
+    payload = message.encode()
+    if compress and len(payload) >= COMPRESSION_THRESHOLD:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS, zdict = COMPRESSION_DICTIONARY)
+        compressed_payload = compressor.compress(payload) + compressor.flush()
+        if len(compressed_payload) < len(payload):
+            return FRAME_HEADER.pack(len(compressed_payload) | COMPRESSED_FLAG) + compressed_payload
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def decompress_payload(compressed_payload, max_length):
+    """Returns the inflated payload (bytes) of a compressed frame.
+    Raises ValueError if it is corrupt or inflates to more than the given max. length."""
+
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict = COMPRESSION_DICTIONARY)
+    try: payload = decompressor.decompress(compressed_payload, max_length)
+    except zlib.error as error: raise ValueError(f"Corrupt compressed frame: {error}")
+    if decompressor.unconsumed_tail: raise ValueError("Compressed frame exceeds the max. frame length")
+    return payload
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for message framing.\n\
+")
+
+
+# END
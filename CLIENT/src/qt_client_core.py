@@ -0,0 +1,287 @@
+"""
+--------------
+QT CLIENT CORE
+--------------
+
+* The transport of the Group Chat client driven by the Qt event loop (see CLIENT_TRANSPORT in 'client_config.py').
+* Contains the class called 'QtClientCore' which speaks the same protocol as 'ClientCore' (from 'client_core.py'),
+    over a non-blocking 'QTcpSocket' in the GUI thread instead of blocking calls and a receiving thread.
+* Connecting (and waiting in the waiting room of the server) never blocks the GUI: 'connect' returns at once,
+    the progress is reported through 'on_connection_state' and the result through 'on_connect_result'.
+* Every callback is called from the GUI thread, so the GUI can touch its widgets in them directly.
+* The files are sent chunk by chunk as the socket drains (see FILE_SEND_BUFFER), so that a chat message typed
+    meanwhile never waits behind much of a file.
+
+"""
+
+
+#import ...
+from PyQt5.QtCore import QTimer
+from PyQt5.QtNetwork import QTcpSocket, QAbstractSocket
+
+from client_config import *
+from message_framing import encode_frame
+from client_core import ClientCore, CONNECTION_LOST_ALERT, fetch_reconnect_delay
+
+
+class QtClientCore(ClientCore):
+    """The client of the Group Chat application, driven by the Qt event loop.
+    The port to which the client should request for connection with server,
+        should be given when the class instance is created.
+    A 'QApplication' (or 'QCoreApplication') must exist before connecting, and all the calls must be made from its thread.
+    The states of the connection are "connecting", "waiting" (for the server to accept this client, maybe in its
+        waiting room), "handshaking", "connected" and "disconnected" (a reconnection goes through them again)."""
+
+    def __init__(self, server_port):
+        super().__init__(server_port)
+        self.blocking_connect = False
+        self.connection = None          # The 'QTcpSocket' of the current connection (or attempt)
+        self.connection_state = "disconnected"
+        self.permission = ""            # Received so far while waiting for the server to accept this client
+        self.reconnect_attempt = 0
+        self.reconnect_room = DEFAULT_ROOM_NAME     # The room to go back to once reconnected
+        self.watchdog_timer = None      # Times out the connecting and the handshake, and the silence of the server after
+        self.reconnect_timer = None
+
+        self.on_connection_state = None # Called like this: on_connection_state(<State>)
+        self.on_connect_result = None   # Called like this: on_connect_result(<Same as what 'ClientCore.connect' returns>)
+
+    def set_connection_callbacks(self, on_connection_state = None, on_connect_result = None):
+        """Gets the functions to be called when the state of the connection changes and when 'connect' is done."""
+
+        self.on_connection_state = on_connection_state
+        self.on_connect_result = on_connect_result
+
+    def connect(self, address, client_name):
+        """Gets the IP address of the server and the client name and,
+        Starts connecting with the server.
+        This is a non-blocking call: Returns None, the result comes through 'on_connect_result'
+            (0 if successfull, 1 if denied and 2 if error)."""
+
+        super().connect(address, client_name)
+
+    def open_connection(self):
+        """Starts connecting with the server (see 'connect'), resuming the session if this client has one."""
+
+        self.close_connection()
+        if self.watchdog_timer is None:
+            self.watchdog_timer, self.reconnect_timer = QTimer(), QTimer()
+            self.watchdog_timer.setSingleShot(True)
+            self.watchdog_timer.timeout.connect(self.expire_watchdog)
+            self.reconnect_timer.setSingleShot(True)
+            self.reconnect_timer.timeout.connect(self.open_connection)
+        self.permission = ""
+        # The signals of a connection which was replaced meanwhile are ignored.
+        connection = self.connection = QTcpSocket()
+        connection.connected.connect(lambda: self.start_waiting(connection))
+        connection.readyRead.connect(lambda: self.read_connection(connection))
+        connection.disconnected.connect(lambda: self.lose_connection(connection))
+        connection.errorOccurred.connect(lambda error: self.lose_connection(connection))
+        connection.bytesWritten.connect(lambda length: self.send_file_chunks())
+        self.watchdog_timer.start(int(CONNECT_TIMEOUT * 1000))
+        self.set_connection_state("connecting")
+        connection.connectToHost(self.server_address, self.server_port)
+
+    def start_waiting(self, connection):
+        """Gets the connection which was just made and waits for the server to accept this client."""
+
+        if connection is not self.connection: return
+        connection.setSocketOption(QAbstractSocket.LowDelayOption, int(self.tcp_nodelay))
+        if self.socket_send_buffer_size:
+            connection.setSocketOption(QAbstractSocket.SendBufferSizeSocketOption, self.socket_send_buffer_size)
+        if self.socket_receive_buffer_size:
+            connection.setSocketOption(QAbstractSocket.ReceiveBufferSizeSocketOption, self.socket_receive_buffer_size)
+        self.set_connection_state("waiting")
+
+    def read_connection(self, connection):
+        """Gets the connection which has data and reads all of it and does the needful."""
+
+        if connection is not self.connection: return
+        data = bytes(connection.readAll())
+        if not(data): return
+
+        if self.connection_state == "waiting":
+            # The server may keep this client in its waiting room as long as it takes.
+            if b"\n" in data: self.watchdog_timer.stop()
+            try: self.permission = self.parse_permission(self.permission + data.decode())
+            except (ValueError, UnicodeDecodeError):
+                self.fail_connection(2)
+                return
+            if self.permission == DENY_MESSAGE: self.fail_connection(1)
+            elif self.permission == ACCEPT_MESSAGE:
+                self.set_connection_state("handshaking")
+                self.watchdog_timer.start(int(CONNECT_TIMEOUT * 1000))
+                connection.write(self.fetch_handshake())
+            return
+
+        try: received_messages = self.frame_decoder.feed(data)
+        except ValueError:
+            self.lose_connection(connection)
+            return
+        if self.connection_state == "handshaking":
+            if not(received_messages): return
+            if not(self.accept_client_list(received_messages[0])):
+                self.fail_connection(2)
+                return
+            received_messages = received_messages[1:]
+            self.connected = True
+            self.set_connection_state("connected")
+            if self.reconnecting:
+                self.reconnecting = False
+                self.finish_reconnection(self.reconnect_room)
+            elif self.on_connect_result is not None: self.on_connect_result(0)
+        # The server pings a silent client, so a longer silence of the server means that it is gone.
+        if HEARTBEATS_ENABLED and HEARTBEAT_TIMEOUT: self.watchdog_timer.start(int(HEARTBEAT_TIMEOUT * 1000))
+        else: self.watchdog_timer.stop()
+        for message in received_messages:
+            if not(self.process_server_message(message)): return
+
+    def expire_watchdog(self):
+        """Takes the connection as lost (if the server was silent for too long) or the attempt as failed."""
+
+        if self.connection_state != "connected":
+            self.fail_connection(2)
+            return
+        self.heartbeat_missed = True
+        self.lose_connection(self.connection)
+
+    def fail_connection(self, status):
+        """Gets the status (see 'connect') of an attempt to connect which failed and,
+        Reports it, or makes the next attempt if reconnecting."""
+
+        self.close_connection()
+        self.set_connection_state("disconnected")
+        if self.reconnecting: self.schedule_reconnection()
+        elif self.on_connect_result is not None: self.on_connect_result(status)
+
+    def lose_connection(self, connection):
+        """Gets the connection which was closed (or broken) and,
+        Reconnects (if this client has a session to resume) or reports the disconnection."""
+
+        if connection is not self.connection: return
+        if self.connection_state != "connected":
+            self.fail_connection(2)
+            return
+        self.close_connection()
+        if self.closing_event.is_set(): self.disconnect()
+        elif self.session_token is not None: self.start_reconnecting()
+        else: self.disconnect(CONNECTION_LOST_ALERT if self.heartbeat_missed else "")
+
+    def start_reconnecting(self):
+        """Starts reconnecting with the server after the connection was lost (see 'ClientCore.reconnect')."""
+
+        self.reconnect_room = self.room
+        self.connected = False
+        self.reconnecting = True
+        self.reconnect_attempt = 0
+        self.set_connection_state("disconnected")
+        self.schedule_reconnection()
+
+    def schedule_reconnection(self):
+        """Schedules the next attempt to reconnect (after a random delay, see 'fetch_reconnect_delay'),
+        Or reports the connection as lost if all the attempts failed."""
+
+        self.reconnect_attempt += 1
+        if self.reconnect_attempt > RECONNECT_MAX_ATTEMPTS:
+            self.reconnecting = False
+            self.disconnect(CONNECTION_LOST_ALERT)
+            return
+        delay = fetch_reconnect_delay(self.reconnect_attempt)
+        if self.on_reconnecting is not None: self.on_reconnecting(self.reconnect_attempt, delay)
+        self.reconnect_timer.start(int(delay * 1000))
+
+    def close_connection(self):
+        """Closes the current connection (if any) at once, along with the files being sent over it."""
+
+        if self.watchdog_timer is not None: self.watchdog_timer.stop()
+        for outgoing_file in list(self.outgoing_files.values()): outgoing_file.close()     # Reopened when resumed
+        connection, self.connection = self.connection, None
+        if connection is None: return
+        connection.abort()
+        connection.deleteLater()
+
+    def set_connection_state(self, state):
+        """Gets the new state of the connection and reports it (if it changed)."""
+
+        if state == self.connection_state: return
+        self.connection_state = state
+        if self.on_connection_state is not None: self.on_connection_state(state)
+
+    def start_upload(self, outgoing_file):
+        """Gets a file accepted by the server and starts sending it (see 'send_file_chunks')."""
+
+        outgoing_file.close()
+        try:
+            outgoing_file.file = open(outgoing_file.path, "rb")
+            outgoing_file.file.seek(outgoing_file.offset)
+        except OSError as error:
+            self.outgoing_files.pop(outgoing_file.reference, None)
+            if self.on_file_failed is not None: self.on_file_failed(outgoing_file.path, str(error))
+            return
+        self.send_file_chunks()
+
+    def send_file_chunks(self):
+        """Sends the next chunks of the files being sent (in turns) while less than FILE_SEND_BUFFER bytes
+            wait to be written, so that a chat message is never queued behind much of a file.
+        Called again every time the socket drains."""
+
+        connection = self.connection
+        while self.connection_state == "connected" and connection.bytesToWrite() < FILE_SEND_BUFFER:
+            outgoing_files = [outgoing_file for outgoing_file in self.outgoing_files.values() if outgoing_file.file is not None]
+            if not(outgoing_files): return
+            for outgoing_file in outgoing_files:
+                try: self.send_file_chunk(outgoing_file, outgoing_file.file)
+                except OSError as error:
+                    if self.connection_state != "connected": return     # Resumed once reconnected
+                    self.outgoing_files.pop(outgoing_file.reference, None)
+                    outgoing_file.close()
+                    if self.on_file_failed is not None: self.on_file_failed(outgoing_file.path, str(error))
+                    continue
+                if outgoing_file.offset >= outgoing_file.size: outgoing_file.close()    # Done once the server confirms
+
+    def send_frame(self, message):
+        """Gets a string message and sends it to the server as a frame (it is written as the socket drains).
+        Must be called from the GUI thread. Raises OSError if not connected."""
+
+        connection = self.connection
+        if connection is None or connection.state() != QAbstractSocket.ConnectedState: raise OSError("Not connected")
+        data = encode_frame(message)
+        if connection.write(data) != len(data): raise OSError(connection.errorString())
+
+    def disconnect(self, message = ""):
+        """Disconnects from the server and reports it (with the reason, if it was not expected)."""
+
+        if self.reconnect_timer is not None: self.reconnect_timer.stop()
+        self.close_connection()
+        self.set_connection_state("disconnected")
+        super().disconnect(message)
+
+    def shutdown(self):
+        """Shuts down the client.
+        Informs the server that this client is shuted down (waiting up to SHUTDOWN_FLUSH_TIMEOUT for it to be sent)
+        And closes the connection."""
+
+        self.closing_event.set()
+        if self.reconnect_timer is not None: self.reconnect_timer.stop()
+        if self.connected:
+            try:
+                self.send_frame(SHUTDOWN_MESSAGE_PREFIX + "ClientTerminated")
+                self.connection.waitForBytesWritten(int(SHUTDOWN_FLUSH_TIMEOUT * 1000))
+            except OSError: pass
+        self.connected = False
+        self.reconnecting = False
+        self.close_connection()
+        self.connection_state = "disconnected"
+        self.client_socket.close()
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the client core driven by the Qt event loop.\n\
+Run 'group_chat_client.py' to start the client-side application.\n\
+")
+
+
+# END
@@ -0,0 +1,87 @@
+"""
+----------------
+RENDER BENCHMARK
+----------------
+
+* Stress test of the chat rendering of the GUI window (no server involved).
+* Feeds the chat messages into 'Ui_Window' from a background thread (like the receiving thread does)
+    at the given rate and measures how responsive the GUI thread stays:
+    A heartbeat timer ticks every few milliseconds in the GUI thread and its worst lateness is the longest freeze.
+* Also reports the no. of messages rendered, the lines kept in the chat console and the peak memory.
+* Uses the 'offscreen' Qt platform by default, so no display is needed.
+* Usage: python render_benchmark.py [<messages per second> [<duration in seconds>]]
+
+"""
+
+
+import os
+import resource
+import sys
+import time
+from threading import Thread, Event
+#from ... import ...
+
+from client_config import *
+
+
+DEFAULT_MESSAGE_RATE                = 10000         # Messages per second
+DEFAULT_DURATION                    = 10.0          # Seconds
+HEARTBEAT_INTERVAL                  = 0.005         # Seconds
+MESSAGE_CONTENT                     = "bot> " + "x" * 80
+
+
+def feed_messages(gui_window, message_rate, duration, stop_event, results):
+    """Feeds the chat messages into the window at the given rate (paced in bursts) for the given duration."""
+
+    sent = 0
+    start = time.perf_counter()
+    while not(stop_event.is_set()) and time.perf_counter() - start < duration:
+        due = int((time.perf_counter() - start) * message_rate)
+        while sent < due:
+            gui_window.show_chat_message(f"{MESSAGE_CONTENT} {sent}")
+            sent += 1
+        time.sleep(0.001)
+    results["sent"] = sent
+
+
+if __name__ == '__main__':
+    message_rate = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_MESSAGE_RATE
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_DURATION
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    from app_gui import QtCore, QtWidgets, Ui_Window
+    qt_app = QtWidgets.QApplication(sys.argv)
+    gui_window = Ui_Window()
+    gui_window.show()
+
+    results = {"max_lateness": 0, "ticks": 0}
+    stop_event = Event()
+    heartbeat = QtCore.QTimer()
+    last_tick = [time.perf_counter()]
+
+    def on_heartbeat():
+        now = time.perf_counter()
+        results["max_lateness"] = max(results["max_lateness"], now - last_tick[0] - HEARTBEAT_INTERVAL)
+        results["ticks"] += 1
+        last_tick[0] = now
+
+    heartbeat.timeout.connect(on_heartbeat)
+    heartbeat.start(int(HEARTBEAT_INTERVAL * 1000))
+    feeder_thread = Thread(target = feed_messages, args = (gui_window, message_rate, duration, stop_event, results))
+    feeder_thread.start()
+    QtCore.QTimer.singleShot(int(duration * 1000) + 500, qt_app.quit)      # Lets the last batch get rendered
+    qt_app.exec_()
+    stop_event.set()
+    feeder_thread.join()
+
+    last_message = f"{MESSAGE_CONTENT} {results['sent'] - 1}"
+    last_message_shown = gui_window.chat_console.toPlainText().endswith(last_message)
+    print(f"\nRate: {message_rate} messages/s    Duration: {duration:g} s    Render interval: {CHAT_RENDER_INTERVAL * 1000:.1f} ms\n")
+    print(f"Messages fed:       {results['sent']}")
+    print(f"Last one shown:     {last_message_shown}")
+    print(f"Lines kept:         {gui_window.chat_console.document().blockCount()} (cap {CHAT_SCROLLBACK_BLOCKS})")
+    print(f"Longest freeze:     {results['max_lateness'] * 1000:.1f} ms ({results['ticks']} heartbeats)")
+    print(f"Peak memory:        {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB\n")
+
+
+# END
@@ -0,0 +1,66 @@
+"""
+-----------------
+STARTUP BENCHMARK
+-----------------
+
+* Measures the cold-start time of the client: A fresh Python interpreter is started for every run,
+    which imports the client and creates an instance of it.
+* Compares the GUI-free core ('ClientCore', as used by the bots and tests) with the GUI client
+    ('GroupChatClient', which imports PyQt5 and builds the 'QApplication' and the window), with either transport.
+* The GUI client is created with the 'offscreen' Qt platform, so no display is needed.
+* Usage: python startup_benchmark.py [<no. of runs>]
+
+"""
+
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+#from ... import ...
+
+from client_config import *
+
+
+DEFAULT_RUNS                        = 10
+STARTUP_CODES = {
+    "python": "pass",       # The interpreter alone, for reference
+    "core": "from client_core import ClientCore; ClientCore(SERVER_LISTENING_PORT)",
+    "gui": "from group_chat_client import GroupChatClient; GroupChatClient(SERVER_LISTENING_PORT)",
+    "gui (qt)": "from group_chat_client import create_client; create_client(SERVER_LISTENING_PORT, 'qt')",
+}
+
+
+def measure_startup(startup_code, no_of_runs):
+    """Runs the given code in a fresh interpreter the given no. of times and,
+    Returns the list of the times taken (in seconds), or None if the code failed (say, PyQt5 is not installed)."""
+
+    source_directory = os.path.dirname(os.path.abspath(__file__))
+    environment = dict(os.environ, QT_QPA_PLATFORM = "offscreen")
+    startup_times = []
+    for run_no in range(no_of_runs):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", "from client_config import *; " + startup_code],\
+            cwd = source_directory, env = environment, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+        startup_times.append(time.perf_counter() - start)
+        if completed.returncode != 0: return None
+    return startup_times
+
+
+if __name__ == '__main__':
+    no_of_runs = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS
+
+    print(f"\nRuns: {no_of_runs} (a fresh interpreter each)\n")
+    print(f"{'Client':<8}{'Median (ms)':>14}{'Min (ms)':>12}{'Max (ms)':>12}")
+    for client_kind, startup_code in STARTUP_CODES.items():
+        startup_times = measure_startup(startup_code, no_of_runs)
+        if startup_times is None:
+            print(f"{client_kind:<8}{'(failed to start, is PyQt5 installed?)':>38}")
+            continue
+        print(f"{client_kind:<8}{statistics.median(startup_times) * 1000:>14.1f}\
+{min(startup_times) * 1000:>12.1f}{max(startup_times) * 1000:>12.1f}")
+    print()
+
+
+# END
@@ -0,0 +1,447 @@
+"""
+-----------------------
+ASYNC GROUP CHAT SERVER
+-----------------------
+
+* The asyncio based server engine for the group chat application.
+* Speaks the same protocol as the threaded engine, but serves all the clients from a single event loop
+    (no thread per client), so that thousands of concurrent connections can be handled in one process.
+* Contains the class called 'AsyncGroupChatServer' which reuses the message handling of 'GroupChatServer'.
+* Also contains a class called 'AsyncClientInterface' with the same semantics as 'ClientInterface'
+    and a class called 'AsyncWaitingClient' with the same semantics as 'WaitingClient'.
+
+"""
+
+
+import asyncio
+import os
+import time
+#from ... import ...
+
+from server_config import *
+from group_chat_server import GroupChatServer, ClientInterface, WaitingClient
+
+
+class AsyncGroupChatServer(GroupChatServer):
+    """Acts as the server for Group Chat application, using asyncio.
+    The port in which the server should listen for clients should be given
+        when instance of the class is created.
+    The event loop runs in the thread which calls 'start_listening'."""
+
+    def __init__(self, server_port, host = None, **options):
+        super().__init__(server_port, host, **options)
+        self.server_socket.setblocking(False)
+        self.loop = None
+        self.async_server = None
+        self.stop_event = None
+        self.heartbeat_task = None
+        self.handed_clients = []        # Taken over from the previous server process, adopted once the loop runs
+
+    def start_listening(self):
+        """Starts listening for clients by running the event loop.
+        Note: This function is a blocking call."""
+
+        print("STATE: Listening...\n")
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        """Serves the clients until the server is shut down."""
+
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        self.server_socket.listen(self.settings["LISTEN_BACKLOG"])
+        self.event_log.log("info", "listening", host = self.host, port = self.server_port, engine = "asyncio")
+        await self.adopt_handed_clients()
+        self.async_server = await asyncio.start_server(self.handle_connection, sock = self.server_socket)
+        self.heartbeat_task = asyncio.ensure_future(self.monitor_heartbeats_async())
+        self.start_handoff_listener()
+        self.listening_event.set()
+        await self.stop_event.wait()
+        self.heartbeat_task.cancel()
+
+    async def monitor_heartbeats_async(self):
+        """Checks the heartbeats of the clients every 'heartbeat_check_interval' seconds.
+        Note: This function is a coroutine."""
+
+        while 1:
+            await asyncio.sleep(self.heartbeat_check_interval)
+            self.check_heartbeats()
+
+    async def handle_connection(self, reader, writer):
+        """Gets the stream reader and writer of a new connection and,
+        Accepts or Denies the client and if accepts,
+        Serves the client until it disconnects.
+        This is the asyncio counterpart of 'configure_client' and 'start_receiving_messages'."""
+
+        client_address = writer.get_extra_info("peername")
+        self.event_log.log("info", "request", address = client_address)
+        if not(self.accept_rate_limiter.allow(client_address[0])):
+            self.metrics.rate_limited_clients += 1
+            await self.deny_connection(writer)
+            self.event_log.log("warning", "rate_limited", address = client_address)
+            return
+
+        waiting_client = AsyncWaitingClient(reader, writer, client_address)
+        admission = self.request_admission(waiting_client)
+        if admission is None:
+            self.metrics.denied_clients += 1
+            await self.deny_connection(writer)
+            self.event_log.log("warning", "denied", address = client_address)
+            return
+        if not(admission):
+            self.event_log.log("info", "waiting", address = client_address)
+            await self.serve_waiting_client(waiting_client)
+        else: await self.serve_client(waiting_client.admission.result())
+
+    async def serve_waiting_client(self, waiting_client):
+        """Gets a client in the waiting room and,
+        Serves the client once it is accepted (or forgets it if it leaves the waiting room).
+        Note: This function is a coroutine."""
+
+        if not(await waiting_client.wait_admission()):
+            self.remove_waiting_client(waiting_client)
+            waiting_client.close()
+            return
+        await self.serve_client(waiting_client.admission.result())
+
+    async def serve_client(self, client_interface):
+        """Gets the client interface of an accepted (or adopted) client and,
+        Finishes configuring the client (unless it was configured before it was handed over) and,
+        Serves the client until it disconnects.
+        Note: This function is a coroutine."""
+
+        if not(client_interface.configured):
+            client_name = await client_interface.get_client_message_wait()
+            if not(client_name):
+                self.process_client_message(client_interface, client_name)     # Lost (or reaped) in the handshake
+                return
+            self.configure_client_name(client_interface, client_name)
+
+        while 1:
+            client_message, delay = self.police_client_message(client_interface,\
+                await client_interface.get_client_message_wait())
+            if delay:       # Throttles the client (only this coroutine waits)
+                client_interface.held_message = client_message     # Handed over with the rest if it comes to that
+                await asyncio.sleep(delay)
+                if self.handoff_gate.handing_off: return
+                client_interface.held_message = None
+            if client_message is None:
+                if client_interface.finishing:      # Disconnected for flooding, closes once the notice is sent
+                    await asyncio.wait((client_interface.writer_task,), timeout = SHUTDOWN_FLUSH_TIMEOUT)
+                    client_interface.abort()
+                    break
+                continue
+            if not(self.metrics.profiler.run(self.process_client_message, client_interface, client_message)): break
+
+    def accept_client(self, waiting_client):
+        """Gets a client which was admitted (see 'request_admission') and,
+        Accepts the client and hands its client interface to the coroutine which serves it."""
+
+        self.metrics.accepted_clients += 1
+        client_interface = AsyncClientInterface(self.next_client_id_number, waiting_client.reader,\
+            waiting_client.writer, waiting_client.address)
+        self.add_client_entity(client_interface)
+        if self.wire_capture is not None: self.wire_capture.record_open(client_interface.id_no, waiting_client.address)
+        self.next_client_id_number += self.client_id_step
+        waiting_client.writer.write(ACCEPT_MESSAGE.encode())       # Always unframed, framing is negotiated after this
+        client_interface.start_writer()
+        if not(waiting_client.admission.done()): waiting_client.admission.set_result(client_interface)
+        self.event_log.log("info", "accepted", client_interface.id_no, waiting_client.address)
+
+    def hand_over(self, handoff_connection):
+        """Gets the connection of a new server process (see 'server_handoff.py') and,
+        Hands over the listening socket and the clients to it (see 'hand_over_async').
+        Note: This function is a blocking call (made from outside the event loop)."""
+
+        asyncio.run_coroutine_threadsafe(self.hand_over_async(handoff_connection), self.loop).result()
+
+    async def hand_over_async(self, handoff_connection):
+        """Does the handover from inside the event loop.
+        Nothing is read from the clients from the start (the coroutines which serve them wait forever) and,
+        The transports are given time to send what the writers had written.
+        The event loop is blocked by the sending of the handover (this process exits right after it)."""
+
+        self.handoff_gate.handing_off = True
+        self.heartbeat_task.cancel()
+        client_interfaces = list(self.live_connections.values())
+        for client_interface in client_interfaces + list(self.waiting_clients):
+            client_interface.writer.transport.pause_reading()
+        listening_fd = os.dup(self.server_socket.fileno())      # Closing the server closes its socket
+        self.async_server.close()
+        for client_interface in client_interfaces: client_interface.stop_writer()
+        deadline = time.monotonic() + HANDOFF_DRAIN_TIMEOUT
+        while time.monotonic() < deadline and not(all(client_interface.is_drained()\
+            for client_interface in client_interfaces)): await asyncio.sleep(0.01)
+        for client_interface in client_interfaces:
+            # The data which was read but not consumed (the coroutines never resume) is handed over too.
+            if client_interface.reader._buffer: client_interface.feed_received_data(bytes(client_interface.reader._buffer))
+        # A transport which could not send everything (to a client which does not read) cannot be handed over.
+        self.send_handover(handoff_connection, listening_fd, [client_interface\
+            for client_interface in client_interfaces if client_interface.is_drained()])
+
+    def adopt_clients(self, handed_clients):
+        """Gets the clients handed over by the previous server process (see 'take_over_server') and,
+        Keeps them to be adopted once the event loop runs (see 'adopt_handed_clients')."""
+
+        self.handed_clients = handed_clients
+
+    async def adopt_handed_clients(self):
+        """Carries on serving the clients handed over by the previous server process, where it left off.
+        Note: This function is a coroutine."""
+
+        client_interfaces, waiting_clients = [], []
+        for record, connection in self.handed_clients:
+            reader, writer = await asyncio.open_connection(sock = connection)
+            client_address = tuple(record["address"])
+            if record["type"] == "waiting":
+                waiting_clients.append(AsyncWaitingClient(reader, writer, client_address))
+                self.waiting_clients.append(waiting_clients[-1])
+                continue
+            client_interfaces.append(AsyncClientInterface(record["id"], reader, writer, client_address))
+            self.adopt_client(client_interfaces[-1], record)
+        self.handed_clients = []
+        # All the clients must be back in their rooms before any message is processed (and broadcast).
+        for client_interface in client_interfaces:
+            client_interface.start_writer()
+            asyncio.ensure_future(self.serve_client(client_interface))
+        for waiting_client in waiting_clients: asyncio.ensure_future(self.serve_waiting_client(waiting_client))
+
+    async def deny_connection(self, writer):
+        """Gets the stream writer of a connection which is not accepted and,
+        Sends the denial and closes it.
+        Note: This function is a coroutine."""
+
+        writer.write(DENY_MESSAGE.encode())
+        try: await writer.drain()
+        except: pass
+        writer.close()
+
+    def run_in_server_context(self, function, *args):
+        """Runs the given function with the given arguments in the event loop (can be called from any thread)."""
+
+        if self.loop is not None and not(self.loop.is_closed()): self.loop.call_soon_threadsafe(function, *args)
+
+    def shutdown(self):
+        """Shuts down the server.
+        Informs all the clients that the server is shuted down.
+        Closes all the client connections.
+        Stops the event loop.
+        Can be called from any thread."""
+
+        print("\n\nShutting down...\n")
+        if self.handoff_listener is not None: self.handoff_listener.close()
+        if self.loop is None or self.loop.is_closed():
+            if self.chat_search is not None: self.chat_search.close()
+            if self.chat_history is not None: self.chat_history.close()
+            if self.wire_capture is not None: self.wire_capture.close()
+            if self.metrics_endpoint is not None: self.metrics_endpoint.close()
+            self.event_log.log("info", "stopped")
+            self.event_log.close()
+            self.server_socket.close()
+            return
+        try: asyncio.run_coroutine_threadsafe(self.shutdown_async(), self.loop).result()
+        except RuntimeError: pass       # The event loop had already stopped
+
+    async def shutdown_async(self):
+        """Does the shutdown from inside the event loop."""
+
+        self.close_waiting_clients()
+        self.broadcast(SHUTDOWN_MESSAGE_PREFIX + "ServerTerminated")
+        self.async_server.close()
+        client_interfaces = list(self.live_connections.values())
+        # The pending messages (including the above) are flushed by the writers before closing.
+        for client_interface in client_interfaces: client_interface.finish()
+        writer_tasks = [client_interface.writer_task for client_interface in client_interfaces\
+            if client_interface.writer_task is not None]
+        if writer_tasks: await asyncio.wait(writer_tasks, timeout = SHUTDOWN_FLUSH_TIMEOUT)
+        for client_interface in client_interfaces: client_interface.close()
+        if self.file_transfers is not None: self.file_transfers.close()
+        if self.chat_search is not None: self.chat_search.close()
+        if self.chat_history is not None: self.chat_history.close()
+        if self.wire_capture is not None: self.wire_capture.close()
+        if self.metrics_endpoint is not None: self.metrics_endpoint.close()
+        self.event_log.log("info", "stopped")
+        self.event_log.close()
+        self.stop_event.set()
+
+
+class AsyncClientInterface(ClientInterface):
+    """Contains all the required methods for communication with the client, using asyncio streams.
+    Instance of this class must be created for each client.
+    Client id number, Stream reader, Stream writer and client address
+        must be given at the time of instance creation."""
+
+    def __init__(self, id_number, reader, writer, address):
+        super().__init__(id_number, writer.get_extra_info("socket"), address)
+        self.reader = reader
+        self.writer = writer
+        self.writer_task = None
+
+    async def get_client_message_wait(self):
+        """Waits for message from the client and,
+        Returns the message (Returns empty string if the connection is lost).
+        Note: This function is a coroutine."""
+
+        while not(self.pending_messages):
+            try:
+                data = await self.reader.read(self.receive_buffer_size if self.framed else MAX_MESSAGE_LENGTH)
+                if not(data): return ""
+                self.feed_received_data(data)
+            except: return ""
+        return self.pending_messages.popleft()
+
+    def start_writer(self):
+        """Creates and starts the task which sends the queued messages to the client."""
+
+        self.outbound_ready = asyncio.Event()
+        self.writer_task = asyncio.ensure_future(self.write_outbound_messages())
+
+    def send_data(self, data):
+        """Queues the given encoded message (bytes) to be sent to the client.
+        This never blocks the event loop."""
+
+        if self.closed or self.finishing: return
+        if not(self.queue_outbound(data)):
+            if self.event_log is not None: self.event_log.log("warning", "too_slow", self.id_no, self.address,\
+                name = self.name, queue_depth = len(self.outbound_queue))
+            self.close()
+            return
+        self.outbound_ready.set()
+
+    async def write_outbound_messages(self):
+        """Sends the queued messages to the client until the connection is closed.
+        The messages queued within the batching window are coalesced into a single write.
+        While the transport waits to drain, the new messages are held in the bounded outbound queue.
+        The files being relayed are sent only while no message is queued, a slice at a time.
+        Note: This function is a coroutine."""
+
+        while 1:
+            if not(self.outbound_queue or self.closed or self.finishing or self.handing_off):
+                file_slice = self.fetch_file_slice()
+                if file_slice is None:
+                    self.outbound_ready.clear()
+                    await self.outbound_ready.wait()
+                    continue
+                if self.writer.transport.is_closing(): break
+                try: await self.send_file_slice(*file_slice)
+                except: break
+                continue
+            batch_size = self.batch_size if self.framed else 1      # The unframed clients take every 'recv' as a message
+            if self.framed and self.batch_window and len(self.outbound_queue) < batch_size and not(self.finishing):
+                await asyncio.sleep(self.batch_window)      # Lets more messages gather for this write
+            if self.handing_off: return     # The queued messages are handed over
+            if self.closed or not(self.outbound_queue) or self.writer.transport.is_closing(): break
+            batch = [self.outbound_queue.popleft() for n in range(min(len(self.outbound_queue), batch_size))]
+            batch_queued_at = self.pop_queued_at()
+            self.write_calls += 1
+            self.writer.writelines(batch)
+            try: await self.writer.drain()
+            except: break
+            self.record_sent(batch, batch_queued_at)
+        self.close()
+
+    async def send_file_slice(self, file_download, slice_length):
+        """Gets a file download and the length of its frames to be relayed and,
+        Sends them to the client straight from the spool (the event loop uses 'sendfile' where the platform has it).
+        Note: This function is a coroutine."""
+
+        self.write_calls += 1
+        await asyncio.get_running_loop().sendfile(self.writer.transport, file_download.open_spool(),\
+            file_download.spool_offset, slice_length)
+        self.record_file_sent(file_download, slice_length)
+
+    def wake_writer(self):
+        """Wakes up the writer, as there may be more to send (a chunk was spooled for a file being relayed)."""
+
+        if self.writer_task is not None: self.outbound_ready.set()
+
+    def stop_writer(self):
+        """Stops the writer (what it had written is still sent by the transport), as the client is being handed over
+            to a new server process. The connection is never closed by this process after this."""
+
+        self.handing_off = True
+        if self.writer_task is not None: self.outbound_ready.set()
+
+    def is_drained(self):
+        """Returns True if the writer had stopped and the transport had sent everything, else False."""
+
+        return (self.writer_task is None or self.writer_task.done()) and not(self.writer.transport.get_write_buffer_size())
+
+    def finish(self):
+        """Lets the writer send the queued messages and then close the connection."""
+
+        self.finishing = True
+        if self.writer_task is not None: self.outbound_ready.set()
+        else: self.close()
+
+    def close(self):
+        """Closes the client connection."""
+
+        if not(self.closed or self.handing_off):      # A client being handed over keeps its connection
+            self.closed = True
+            if self.writer_task is not None: self.outbound_ready.set()
+            self.writer.close()
+            for file_download in list(self.downloads): self.end_download(file_download)
+
+    def abort(self):
+        """Closes the client connection at once, even if the peer is gone (the unsent data is discarded).
+        Unlike 'close', this does not wait for the transport to flush (which never happens if the peer is gone)."""
+
+        self.close()
+        if not(self.handing_off): self.writer.transport.abort()
+
+
+class AsyncWaitingClient(WaitingClient):
+    """A new client which waits in the waiting room for a free slot, using asyncio streams.
+    Stream reader, Stream writer and client address must be given at the time of instance creation.
+    'admission' gets the client interface once the client is accepted (or None if the waiting is over)."""
+
+    def __init__(self, reader, writer, address):
+        super().__init__(writer.get_extra_info("socket"), address)
+        self.reader = reader
+        self.writer = writer
+        self.admission = asyncio.get_running_loop().create_future()
+
+    def send_queue_position(self, position):
+        """Gets the position of the client in the waiting room and tells it to the client (unframed)."""
+
+        if not(self.gone): self.writer.write(f"{QUEUE_POSITION_MESSAGE_PREFIX}{position}\n".encode())
+
+    def is_gone(self):
+        """Returns True if the client had left the waiting room, else False."""
+
+        return self.gone or self.writer.transport.is_closing()
+
+    async def wait_admission(self):
+        """Waits until the client is accepted (Returns True) or leaves the waiting room (Returns False).
+        Note: This function is a coroutine."""
+
+        leaving = asyncio.ensure_future(self.reader.read(1))
+        await asyncio.wait((self.admission, leaving), return_when = asyncio.FIRST_COMPLETED)
+        if not(leaving.done()):
+            leaving.cancel()
+            await asyncio.wait((leaving,))
+        else: self.gone = True
+        return self.admission.done() and self.admission.result() is not None
+
+    def close(self):
+        """Closes the connection of the client (which was not accepted) and ends its waiting."""
+
+        self.gone = True
+        if not(self.admission.done()): self.admission.set_result(None)
+        self.writer.close()
+
+
+#def ...(...):
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the asyncio server engine.\n\
+Run 'group_chat_server.py asyncio' to start the server with this engine.\n\
+")
+
+
+# END
@@ -0,0 +1,198 @@
+"""
+------------
+CHAT HISTORY
+------------
+
+* Persists the chat messages of all the rooms in a segmented, append-only, memory-mapped log.
+* Contains the class called 'ChatHistory' which keeps the recent messages of each room (the hot tail)
+    in in-memory ring buffers and appends every message to the log from a background writer thread,
+    so that the broadcast path never waits for the disk.
+* The segments are rotated based on their size and age. The sealed segments are truncated to their used size.
+* Run 'compact_chat_history.py' (offline) to compact the segments.
+
+Record format (big-endian): <Record length (4 bytes)> <Timestamp (8 bytes)> <Room length (2 bytes)> <Room> <Message>
+
+"""
+
+
+import mmap
+import os
+import queue
+import struct
+import time
+from collections import deque, OrderedDict
+from threading import Thread, Lock
+
+from server_config import *
+
+
+RECORD_HEADER = struct.Struct("!IdH")
+SEGMENT_NAME_FORMAT = "segment-{:08d}.log"
+
+
+class ChatHistory(object):
+    """Keeps the history of the chat messages of all the rooms.
+    The directory where the segments should be stored should be given when instance of the class is created."""
+
+    def __init__(self, directory, segment_size = CHAT_HISTORY_SEGMENT_SIZE,\
+        segment_max_age = CHAT_HISTORY_SEGMENT_MAX_AGE, ring_buffer_size = CHAT_HISTORY_RING_BUFFER_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.segment_max_age = segment_max_age
+        self.ring_buffer_size = ring_buffer_size
+
+        self.recent_messages = OrderedDict()       # Will contain items like this: <Room-name>: deque([<Message>, ...])
+        self.recent_messages_lock = Lock()
+        self.append_queue = queue.Queue(CHAT_HISTORY_QUEUE_SIZE)
+        self.dropped_appends = 0
+
+        self.segment_file = None
+        self.segment_map = None
+        self.segment_offset = 0
+        self.segment_created = 0
+
+        os.makedirs(self.directory, exist_ok = True)
+        self.load_recent_messages()
+        self.writer_thread = Thread(target = self.write_records)
+        self.writer_thread.start()
+
+    def append(self, room_name, message):
+        """Gets the room name and the chat message (string) and,
+        Adds it to the ring buffer of the room and queues it to be appended to the log.
+        This is a non-blocking call (the message is not persisted if the writer is too far behind)."""
+
+        self.remember(room_name, message)
+        try: self.append_queue.put_nowait((time.time(), room_name, message))
+        except queue.Full: self.dropped_appends += 1
+
+    def remember(self, room_name, message):
+        """Adds the message to the ring buffer of the room.
+        Only the ring buffers of the recently used CHAT_HISTORY_MAX_ROOMS rooms are kept."""
+
+        with self.recent_messages_lock:
+            room_messages = self.recent_messages.get(room_name)
+            if room_messages is None:
+                room_messages = self.recent_messages[room_name] = deque(maxlen = self.ring_buffer_size)
+                if len(self.recent_messages) > CHAT_HISTORY_MAX_ROOMS: self.recent_messages.popitem(last = False)
+            else: self.recent_messages.move_to_end(room_name)
+            room_messages.append(message)
+
+    def fetch_recent(self, room_name, count):
+        """Returns the list of the last 'count' messages of the room (oldest first)."""
+
+        with self.recent_messages_lock:
+            room_messages = self.recent_messages.get(room_name)
+            if not(room_messages) or count <= 0: return []
+            return list(room_messages)[-count:]
+
+    def load_recent_messages(self):
+        """Fills the ring buffers from the newest segments in the directory."""
+
+        segment_paths = list_segments(self.directory)[-CHAT_HISTORY_LOAD_SEGMENTS:]
+        for segment_path in segment_paths:
+            for timestamp, room_name, message in read_segment(segment_path): self.remember(room_name, message)
+
+    def write_records(self):
+        """Appends the queued messages to the log until 'close' is called.
+        Note: This function is a blocking call."""
+
+        while 1:
+            record = self.append_queue.get()
+            if record is None: break
+            try: self.write_record(*record)
+            except OSError as error: print(f"\nCould not write the chat history: {error}\n")
+        self.seal_segment()
+
+    def write_record(self, timestamp, room_name, message):
+        """Writes a record to the current segment, rotating the segment if needed."""
+
+        data = encode_record(timestamp, room_name, message)
+        if len(data) > self.segment_size: return
+        if self.segment_map is not None and (self.segment_offset + len(data) > self.segment_size\
+            or timestamp - self.segment_created > self.segment_max_age): self.seal_segment()
+        if self.segment_map is None: self.open_segment()
+        self.segment_map[self.segment_offset:self.segment_offset + len(data)] = data
+        self.segment_offset += len(data)
+
+    def open_segment(self):
+        """Creates a new segment (preallocated to the segment size) and maps it into the memory."""
+
+        segment_paths = list_segments(self.directory)
+        segment_number = segment_number_of(segment_paths[-1]) + 1 if segment_paths else 1
+        segment_path = os.path.join(self.directory, SEGMENT_NAME_FORMAT.format(segment_number))
+        self.segment_file = open(segment_path, "w+b")
+        self.segment_file.truncate(self.segment_size)
+        self.segment_map = mmap.mmap(self.segment_file.fileno(), self.segment_size)
+        self.segment_offset = 0
+        self.segment_created = time.time()
+
+    def seal_segment(self):
+        """Flushes and unmaps the current segment and truncates it to the used size."""
+
+        if self.segment_map is None: return
+        self.segment_map.flush()
+        self.segment_map.close()
+        self.segment_file.truncate(self.segment_offset)
+        self.segment_file.close()
+        self.segment_map = None
+        self.segment_file = None
+
+    def close(self):
+        """Writes the queued messages, seals the current segment and stops the writer thread."""
+
+        self.append_queue.put(None)
+        self.writer_thread.join()
+
+
+def encode_record(timestamp, room_name, message):
+    """Returns the given message as a log record (bytes)."""
+
+    room_data = room_name.encode()
+    message_data = message.encode()
+    record_length = RECORD_HEADER.size + len(room_data) + len(message_data)
+    return RECORD_HEADER.pack(record_length, timestamp, len(room_data)) + room_data + message_data
+
+
+def read_segment(segment_path):
+    """Yields the records of the given segment as tuples like this: (<Timestamp>, <Room-name>, <Message>)
+    Stops at the end of the written records (a segment which was not sealed is zero-filled at the end)."""
+
+    with open(segment_path, "rb") as segment_file: data = segment_file.read()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        record_length, timestamp, room_length = RECORD_HEADER.unpack_from(data, offset)
+        if record_length < RECORD_HEADER.size + room_length or offset + record_length > len(data): break
+        room_start = offset + RECORD_HEADER.size
+        message_start = room_start + room_length
+        yield timestamp, data[room_start:message_start].decode(errors = "replace"),\
+            data[message_start:offset + record_length].decode(errors = "replace")
+        offset += record_length
+
+
+def list_segments(directory):
+    """Returns the paths of the segments in the given directory (oldest first)."""
+
+    segment_paths = []
+    for file_name in os.listdir(directory):
+        if file_name.startswith("segment-") and file_name.endswith(".log")\
+            and file_name[len("segment-"):-len(".log")].isdigit():
+            segment_paths.append(os.path.join(directory, file_name))
+    return sorted(segment_paths, key = segment_number_of)
+
+
+def segment_number_of(segment_path):
+    """Returns the number of the given segment."""
+
+    return int(os.path.basename(segment_path)[len("segment-"):-len(".log")])
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the chat history.\n\
+Run 'compact_chat_history.py' to compact the stored history.\n\
+")
+
+
+# END
@@ -0,0 +1,253 @@
+"""
+-----------
+CHAT SEARCH
+-----------
+
+* Lets the clients search the chat messages of the server ("what did X say about Y earlier?").
+* Contains the class called 'InvertedIndex' which maps every token (a lowercase word, the sender as "from:<name>"
+    and the room as "in:<room>") to the posting list (ascending ids) of the messages which have it.
+    It keeps the last SEARCH_INDEX_MAX_MESSAGES messages only, in a ring, evicting the oldest ones,
+    so that its memory stays bounded however long the server runs.
+* Contains the class called 'ChatSearch' which owns an index and a background thread. The broadcast path only
+    queues the chat messages (like for the chat history), and the searches are run by the same thread,
+    so that neither the fan-out nor the event loop of the asyncio engine ever waits for the index.
+* The index is filled from the newest segments of the chat history at startup (see 'chat_history.py').
+* Run 'search_benchmark.py' to see the insert cost per message and the query latency at 1M messages.
+
+Protocol (for the framed clients only):
+    Search:{"query": words, "from": sender name, "since": timestamp, "until": timestamp, "room": room, "limit": n}
+    (all optional, but one of "query" and "from" is needed; the room defaults to the room of the client,
+    null for all the rooms) is answered with
+    SearchResults:{"query": words, "results": [{"id": id, "time": timestamp, "room": room, "from": name, "message": msg},
+    ...], "truncated": bool} (the newest matches first) or SearchResults:{"query": words, "error": "busy"/"invalid"}.
+
+"""
+
+
+import bisect
+import queue
+import re
+import time
+from array import array
+from threading import Thread
+
+from server_config import *
+from chat_history import list_segments, read_segment
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+SENDER_TOKEN_PREFIX = "from:"           # Cannot clash with a word, as the words have no colons
+ROOM_TOKEN_PREFIX = "in:"
+
+
+class InvertedIndex(object):
+    """Maps the tokens of the last 'max_messages' chat messages to the ids of the messages which have them.
+    The ids are consecutive, so the message with an id lives in the slot (id % max_messages) of the ring.
+    An evicted message is left in the posting lists (below 'first_id', where no search looks) until
+    it makes up half of the list, so that evicting costs no more than adding. Not thread-safe."""
+
+    def __init__(self, max_messages = SEARCH_INDEX_MAX_MESSAGES):
+        self.max_messages = max_messages
+        self.timestamps = array("d", bytes(8 * max_messages))
+        self.rooms = [None] * max_messages
+        self.senders = [None] * max_messages
+        self.messages = [None] * max_messages
+        self.postings = {}              # Will contain items like this: <Token>: array("q", [<Message-id>, ...])
+        self.first_id = 0               # Oldest message kept
+        self.next_id = 0
+
+    def add(self, timestamp, room_name, sender_name, message):
+        """Gets a chat message (its timestamp, room, sender and content) and indexes it, evicting the oldest message
+        if the index is full. Returns the id of the message."""
+
+        if self.next_id - self.first_id >= self.max_messages: self.evict()
+        message_id = self.next_id
+        slot = message_id % self.max_messages
+        self.timestamps[slot] = timestamp
+        self.rooms[slot] = room_name
+        self.senders[slot] = sender_name
+        self.messages[slot] = message
+        postings = self.postings
+        for token in tokenize_message(room_name, sender_name, message):
+            posting_list = postings.get(token)
+            if posting_list is None: postings[token] = array("q", (message_id,))
+            else: posting_list.append(message_id)
+        self.next_id += 1
+        return message_id
+
+    def evict(self):
+        """Evicts the oldest message, trimming the posting lists which are half evicted."""
+
+        message_id = self.first_id
+        slot = message_id % self.max_messages
+        tokens = tokenize_message(self.rooms[slot], self.senders[slot], self.messages[slot])
+        self.rooms[slot] = self.senders[slot] = self.messages[slot] = None
+        self.first_id += 1
+        for token in tokens:
+            posting_list = self.postings.get(token)
+            if posting_list is None: continue
+            no_of_evicted = bisect.bisect_left(posting_list, self.first_id)
+            if no_of_evicted == len(posting_list): del self.postings[token]
+            elif no_of_evicted * 2 >= len(posting_list): del posting_list[:no_of_evicted]
+
+    def find_first_id_since(self, timestamp):
+        """Returns the id of the first message kept which is not older than the given timestamp (messages are
+        indexed in the order they are sent, so their timestamps ascend)."""
+
+        low, high = self.first_id, self.next_id
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[middle % self.max_messages] < timestamp: low = middle + 1
+            else: high = middle
+        return low
+
+    def search(self, words = "", sender_name = None, room_name = None, since = None, until = None,\
+        limit = SEARCH_RESULT_LIMIT, max_scanned = SEARCH_MAX_SCANNED):
+        """Gets the words to search for and the optional filters (sender, room and time range) and,
+        Returns a tuple like this: (<List of the ids of the messages which have all of them (newest first)>, <Truncated>)
+        At most 'limit' ids are returned and at most 'max_scanned' candidates are checked
+            (<Truncated> is True if the search stopped there, the older messages were not searched)."""
+
+        tokens = set(tokenize(words))
+        if sender_name is not None: tokens.add(SENDER_TOKEN_PREFIX + sender_name)
+        if room_name is not None: tokens.add(ROOM_TOKEN_PREFIX + room_name)
+        if not(tokens): return [], False
+        posting_lists = []
+        for token in tokens:
+            posting_list = self.postings.get(token)
+            if posting_list is None: return [], False
+            posting_lists.append(posting_list)
+        posting_lists.sort(key = len)
+        shortest_list, other_lists = posting_lists[0], posting_lists[1:]
+
+        low_id = self.first_id if since is None else self.find_first_id_since(since)
+        high_id = self.next_id if until is None else self.find_first_id_since(until)
+        start = bisect.bisect_left(shortest_list, low_id)
+        index = bisect.bisect_left(shortest_list, high_id) - 1
+        # The candidates are checked newest first, so the bound of every other list only moves down.
+        other_bounds = [len(other_list) for other_list in other_lists]
+        matching_ids = []
+        no_of_scanned = 0
+        while index >= start and len(matching_ids) < limit:
+            if no_of_scanned >= max_scanned: return matching_ids, True
+            no_of_scanned += 1
+            message_id = shortest_list[index]
+            index -= 1
+            for list_index, other_list in enumerate(other_lists):
+                bound = other_bounds[list_index] = bisect.bisect_right(other_list, message_id, 0, other_bounds[list_index])
+                if not(bound) or other_list[bound - 1] != message_id: break
+            else: matching_ids.append(message_id)
+        return matching_ids, False
+
+    def fetch_message(self, message_id):
+        """Returns the message with the given id as a dictionary (see the protocol)."""
+
+        slot = message_id % self.max_messages
+        return {"id": message_id, "time": self.timestamps[slot], "room": self.rooms[slot], "from": self.senders[slot],\
+            "message": self.messages[slot]}
+
+    def __len__(self):
+        return self.next_id - self.first_id
+
+
+class ChatSearch(object):
+    """Indexes the chat messages and runs the searches in a background thread (see the module docstring).
+    The chat history at 'history_directory' (if given) is indexed first."""
+
+    def __init__(self, history_directory = None, max_messages = SEARCH_INDEX_MAX_MESSAGES):
+        self.index = InvertedIndex(max_messages)
+        self.history_directory = history_directory
+        self.request_queue = queue.Queue(SEARCH_QUEUE_SIZE)
+        self.dropped_messages = 0       # Not indexed as the thread was too far behind
+        self.searches = 0
+        self.indexer_thread = Thread(target = self.serve_requests, daemon = True)
+        self.indexer_thread.start()
+
+    def append(self, room_name, chat_message):
+        """Gets the room name and the chat message (as broadcast, "Chat:<name>> <message>") and,
+        Queues it to be indexed. This is a non-blocking call (the message is not indexed if the thread is too far behind)."""
+
+        try: self.request_queue.put_nowait((time.time(), room_name, chat_message))
+        except queue.Full: self.dropped_messages += 1
+
+    def search(self, search_request, reply_function):
+        """Gets a search request (see the protocol) and the function to call with the reply (a dictionary) and,
+        Queues the search (the reply function is called from the background thread).
+        Returns False if the thread is too far behind (nothing is queued then), else True."""
+
+        try: self.request_queue.put_nowait((search_request, reply_function))
+        except queue.Full: return False
+        return True
+
+    def serve_requests(self):
+        """Indexes the chat history and then the queued messages, and runs the queued searches until 'close' is called.
+        Note: This function is a blocking call."""
+
+        if self.history_directory is not None:
+            try:
+                for segment_path in list_segments(self.history_directory)[-CHAT_HISTORY_LOAD_SEGMENTS:]:
+                    for timestamp, room_name, chat_message in read_segment(segment_path):
+                        self.index_message(timestamp, room_name, chat_message)
+            except OSError as error: print(f"\nCould not index the chat history: {error}\n")
+        while 1:
+            request = self.request_queue.get()
+            if request is None: break
+            if len(request) == 3: self.index_message(*request)
+            else:
+                search_request, reply_function = request
+                self.searches += 1
+                reply_function(self.run_search(search_request))
+
+    def index_message(self, timestamp, room_name, chat_message):
+        """Indexes a chat message (as broadcast) with its sender and content."""
+
+        sender_name, separator, message = chat_message[len(CHAT_MESSAGE_PREFIX):].partition("> ")
+        if separator: self.index.add(timestamp, room_name, sender_name, message)
+
+    def run_search(self, search_request):
+        """Gets a search request (see the protocol, "room" is given) and returns the reply (a dictionary)."""
+
+        words = search_request.get("query") or ""
+        try:
+            sender_name = search_request.get("from")
+            if not(isinstance(words, str)) or (sender_name is not None and not(isinstance(sender_name, str))):
+                raise TypeError(words)
+            since, until = search_request.get("since"), search_request.get("until")
+            since = float(since) if since is not None else None
+            until = float(until) if until is not None else None
+            limit = min(max(int(search_request.get("limit", SEARCH_RESULT_LIMIT)), 1), SEARCH_RESULT_LIMIT)
+        except (ValueError, TypeError): return {"query": str(words), "error": "invalid"}
+        if not(words.strip()) and not(sender_name): return {"query": words, "error": "invalid"}
+        matching_ids, truncated = self.index.search(words, sender_name, search_request.get("room"), since, until, limit)
+        return {"query": words, "results": [self.index.fetch_message(message_id) for message_id in matching_ids],\
+            "truncated": truncated}
+
+    def close(self):
+        """Stops the background thread (the queued messages are indexed first)."""
+
+        self.request_queue.put(None)
+        self.indexer_thread.join()
+
+
+def tokenize(text):
+    """Returns the list of tokens of the given text (its lowercase words, each once, up to SEARCH_MAX_TOKEN_LENGTH)."""
+
+    return list(dict.fromkeys(word for word in TOKEN_PATTERN.findall(text.lower()) if len(word) <= SEARCH_MAX_TOKEN_LENGTH))
+
+
+def tokenize_message(room_name, sender_name, message):
+    """Returns the list of tokens of a chat message (its words, sender and room)."""
+
+    return tokenize(message)[:SEARCH_MAX_TOKENS_PER_MESSAGE] + [SENDER_TOKEN_PREFIX + sender_name, ROOM_TOKEN_PREFIX + room_name]
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the chat search.\n\
+Run 'search_benchmark.py' to benchmark the index.\n\
+")
+
+
+# END
@@ -0,0 +1,184 @@
+"""
+---------------
+CHURN BENCHMARK
+---------------
+
+* Soak test of the Group Chat server under connection churn (no PyQt5 needed).
+* Keeps opening short-lived simulated clients of four kinds, in turns:
+    polite (chats, answers the pings and says 'ShutDown:'), abrupt (vanishes without 'ShutDown:'),
+    silent (stops answering the pings, like a peer gone without a FIN) and stalled (never sends its name).
+* The silent and stalled clients are left to the heartbeat monitor of the server to be reaped,
+    so the heartbeat settings are shortened for the test (see BENCHMARK_HEARTBEAT_*).
+* Samples the live clients, the client threads, the threads, the open files and the memory of the process
+    (the server runs in this process) and reports their growth, which should stay flat however long it runs.
+* Usage: python churn_benchmark.py [<duration in seconds> [<new clients per second> [<engine>]]]
+    (for example 86400 for a 24-hour run)
+
+"""
+
+
+import asyncio
+import contextlib
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from threading import Thread
+
+from server_config import *
+from group_chat_server import create_server
+from message_framing import FrameDecoder, encode_frame
+
+
+BENCHMARK_HOST                      = "127.0.0.1"
+DEFAULT_DURATION                    = 60.0          # Seconds
+DEFAULT_CLIENT_RATE                 = 20            # New clients per second
+BENCHMARK_HEARTBEAT_INTERVAL        = 0.5           # Seconds
+BENCHMARK_HEARTBEAT_TIMEOUT         = 2.0           # Seconds
+BENCHMARK_HEARTBEAT_CHECK_INTERVAL  = 0.25          # Seconds
+CLIENT_LIFETIME                     = (0.5, 3.0)    # Seconds (the range) a polite or abrupt client stays
+SAMPLE_INTERVAL                     = 5.0           # Seconds between the samples (at least 10 samples are taken)
+CLIENT_KINDS                        = ("polite", "abrupt", "silent", "stalled")
+
+
+async def run_client(port, client_number, results):
+    """Connects a client of the next kind with the server and plays its part until the session is over."""
+
+    client_kind = CLIENT_KINDS[client_number % len(CLIENT_KINDS)]
+    try:
+        reader, writer = await asyncio.open_connection(BENCHMARK_HOST, port)
+        permission = (await reader.read(MAX_MESSAGE_LENGTH)).decode()
+        if not(ACCEPT_MESSAGE in permission):
+            writer.close()
+            results["denied"] += 1
+            return
+        if client_kind != "stalled":
+            writer.write((FRAMING_REQUEST + HEARTBEAT_REQUEST).encode() + encode_frame(f"churn{client_number}"))
+
+        if client_kind in ("polite", "abrupt"):
+            writer.write(encode_frame(CHAT_MESSAGE_PREFIX + "hello"))
+            frame_decoder = FrameDecoder()
+            deadline = time.monotonic() + random.uniform(*CLIENT_LIFETIME)
+            while time.monotonic() < deadline:
+                try: data = await asyncio.wait_for(reader.read(RECEIVE_BUFFER_SIZE), deadline - time.monotonic())
+                except asyncio.TimeoutError: break
+                if not(data): raise ConnectionResetError(f"churn{client_number} got disconnected")
+                for message in frame_decoder.feed(data):
+                    if message.startswith(PING_MESSAGE_PREFIX):
+                        writer.write(encode_frame(PONG_MESSAGE_PREFIX + message[len(PING_MESSAGE_PREFIX):]))
+            if client_kind == "polite":
+                writer.write(encode_frame(SHUTDOWN_MESSAGE_PREFIX + "ClientTerminated"))
+                await writer.drain()
+                writer.close()
+            else: writer.transport.abort()
+
+        else:
+            # Reads (so that nothing piles up) but never answers, until the server gives up on this client.
+            while await reader.read(RECEIVE_BUFFER_SIZE): pass
+            results["reaped"] += 1
+            writer.close()
+        results["completed"] += 1
+
+    except (OSError, asyncio.IncompleteReadError): results["failed"] += 1
+
+
+def sample_process():
+    """Returns a dictionary of the resource usage of this process (the open files and memory on Linux only)."""
+
+    try: open_files = len(os.listdir("/proc/self/fd"))
+    except OSError: open_files = -1
+    try:
+        with open("/proc/self/statm") as statm: memory = int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError): memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {"threads": threading.active_count(), "open_files": open_files, "memory_mb": memory / 2 ** 20}
+
+
+async def run_churn(server, duration, client_rate, samples):
+    """Opens the clients at the given rate for the given duration, sampling the server and the process and,
+    Returns the counts of the client sessions as a dictionary."""
+
+    results = {"started": 0, "completed": 0, "reaped": 0, "denied": 0, "failed": 0}
+    client_tasks = set()
+    sample_interval = min(SAMPLE_INTERVAL, duration / 10)
+    start = time.monotonic()
+    next_sample = start
+    while time.monotonic() - start < duration:
+        due = int((time.monotonic() - start) * client_rate)
+        while results["started"] < due:
+            client_task = asyncio.ensure_future(run_client(server.server_port, results["started"], results))
+            client_tasks.add(client_task)
+            client_task.add_done_callback(client_tasks.discard)
+            results["started"] += 1
+        if time.monotonic() >= next_sample:
+            samples.append(dict(sample_process(), elapsed = time.monotonic() - start,\
+                live_clients = len(server.live_connections), client_threads = len(server.client_threads),\
+                sessions = results["completed"], reaped = server.metrics.reaped_clients))
+            print_sample(samples[-1])
+            next_sample += sample_interval
+        await asyncio.sleep(0.01)
+    if client_tasks: await asyncio.wait(client_tasks, timeout = BENCHMARK_HEARTBEAT_TIMEOUT * 3)
+    return results
+
+
+def print_sample(sample):
+    """Prints a row of the table of samples (to the real console, as the server's logs are muted)."""
+
+    print(f"{sample['elapsed']:>9.0f}{sample['sessions']:>10}{sample['live_clients']:>7}{sample['client_threads']:>9}\
+{sample['threads']:>9}{sample['open_files']:>7}{sample['memory_mb']:>13.1f}{sample['reaped']:>8}", file = sys.__stdout__)
+
+
+def benchmark(engine, duration, client_rate):
+    """Runs the churn against a local server of the given engine and,
+    Returns the counts of the client sessions and the list of samples."""
+
+    samples = []
+    # The server logs every connection to the console (discarded, as a log kept in memory would grow).
+    with open(os.devnull, "w") as null_output, contextlib.redirect_stdout(null_output):
+        server = create_server(engine, 0, BENCHMARK_HOST, metrics_port = None, event_log_path = None)
+        server.max_clients = 1000000      # Never the limit here
+        server.heartbeat_interval = BENCHMARK_HEARTBEAT_INTERVAL
+        server.heartbeat_timeout = BENCHMARK_HEARTBEAT_TIMEOUT
+        server.heartbeat_check_interval = BENCHMARK_HEARTBEAT_CHECK_INTERVAL
+        server_thread = Thread(target = server.start_listening)
+        server_thread.start()
+        server.listening_event.wait()
+        try:
+            results = asyncio.run(run_churn(server, duration, client_rate, samples))
+            time.sleep(BENCHMARK_HEARTBEAT_TIMEOUT)      # Lets the server notice the last disconnections
+            samples.append(dict(sample_process(), elapsed = duration, live_clients = len(server.live_connections),\
+                client_threads = len(server.client_threads), sessions = results["completed"],\
+                reaped = server.metrics.reaped_clients))
+            print_sample(samples[-1])
+        finally:
+            server.shutdown()
+            server_thread.join()
+    return results, samples
+
+
+if __name__ == '__main__':
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DURATION
+    client_rate = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CLIENT_RATE
+    engine = sys.argv[3] if len(sys.argv) > 3 else SERVER_ENGINE
+
+    print(f"\nServer: {engine}    Duration: {duration:g} s    New clients: {client_rate}/s\
+    Heartbeat: {BENCHMARK_HEARTBEAT_INTERVAL:g} s (timeout {BENCHMARK_HEARTBEAT_TIMEOUT:g} s)\n")
+    print(f"{'Time (s)':>9}{'Sessions':>10}{'Live':>7}{'Threads':>9}{'(all)':>9}{'Files':>7}{'Memory (MB)':>13}\
+{'Reaped':>8}")
+    results, samples = benchmark(engine, duration, client_rate)
+    # The first samples include the warming up (the imports, the thread stacks and the allocator pools),
+    # The growth is measured up to the last sample under load (the one after is taken once all the clients left).
+    baseline = samples[min(2, len(samples) - 2)]
+    last_loaded = samples[-2]
+    final = samples[-1]
+    print(f"\nSessions:       {results['started']} started, {results['completed']} completed\
+ ({results['reaped']} reaped by the server), {results['denied']} denied, {results['failed']} failed")
+    print(f"Left behind:    {final['live_clients']} live clients, {final['client_threads']} client threads")
+    print(f"Growth:         threads {last_loaded['threads'] - baseline['threads']:+d},\
+ open files {last_loaded['open_files'] - baseline['open_files']:+d},\
+ memory {last_loaded['memory_mb'] - baseline['memory_mb']:+.1f} MB\
+ (from {baseline['elapsed']:.0f} s to {last_loaded['elapsed']:.0f} s)\n")
+
+
+# END
@@ -0,0 +1,140 @@
+"""
+---------------
+CLIENT SESSIONS
+---------------
+
+* Lets a client which lost its connection resume where it left off, so that a short network blip is invisible.
+* Every chat message gets a sequence number from the server (monotonically increasing, for all the rooms), and
+    the recent messages are kept in a bounded buffer (see RESUME_BUFFER_SIZE).
+* The clients which ask for the sessions (see SESSION_REQUEST) get a session token when they join. A client which
+    reconnects (within SESSION_RESUME_TIMEOUT) with its token and the last sequence number it had seen, gets back
+    its name and room and the chat messages it had missed (see 'configure_client_name' in 'group_chat_server.py').
+* Contains the class called 'SessionRegistry'.
+
+"""
+
+
+import secrets
+import time
+#import ...
+from collections import deque
+from threading import Lock
+
+from server_config import *
+
+
+class SessionRegistry(object):
+    """Keeps the sequence numbers, the recent chat messages and the sessions of the clients.
+    The messages are kept in a bounded buffer (the oldest are evicted) and so are the sessions
+        (the expired ones are pruned, then the oldest suspended ones). Can be called from many threads."""
+
+    def __init__(self, buffer_size = RESUME_BUFFER_SIZE, resume_timeout = SESSION_RESUME_TIMEOUT,\
+        max_sessions = MAX_SESSIONS):
+        self.last_sequence_number = 0
+        self.recent_messages = deque(maxlen = buffer_size)     # Will contain items like this: (<Seq-no.>, <Room>, <Message>)
+        self.resume_timeout = resume_timeout
+        self.max_sessions = max_sessions
+        # Will contain items like this: <Token>: [<Client-name>, <Room-name>, <Expiry-time (None while connected)>]
+        self.sessions = {}
+        self.lock = Lock()
+
+    def sequence(self, room_name, message):
+        """Gets a chat message sent to the given room and,
+        Returns its sequence number (the message is kept in the buffer of recent messages)."""
+
+        with self.lock:
+            self.last_sequence_number += 1
+            self.recent_messages.append((self.last_sequence_number, room_name, message))
+            return self.last_sequence_number
+
+    def fetch_missed(self, room_name, last_sequence_number):
+        """Gets a room name and the last sequence number seen by a client and,
+        Returns a tuple like this: (<List of (<Seq-no.>, <Message>) sent to the room after it>, <Complete or not>)
+        It is not complete if the buffer had evicted messages which came after it (of any room)."""
+
+        with self.lock:
+            missed_messages = []
+            for sequence_number, message_room_name, message in reversed(self.recent_messages):
+                if sequence_number <= last_sequence_number: break
+                if message_room_name == room_name: missed_messages.append((sequence_number, message))
+            complete = not(self.recent_messages) or self.recent_messages[0][0] <= last_sequence_number + 1
+            missed_messages.reverse()
+            return missed_messages, complete
+
+    def open(self, client_name, room_name):
+        """Gets the name and room of a client which joined and,
+        Returns the token of its new session."""
+
+        token = secrets.token_urlsafe(16)
+        with self.lock:
+            if len(self.sessions) >= self.max_sessions: self.prune(time.monotonic())
+            self.sessions[token] = [client_name, room_name, None]
+        return token
+
+    def suspend(self, token, room_name):
+        """Gets the token of a client which lost its connection and the room it was in and,
+        Keeps its session for SESSION_RESUME_TIMEOUT seconds."""
+
+        with self.lock:
+            session = self.sessions.get(token)
+            if session is not None: session[1:] = [room_name, time.monotonic() + self.resume_timeout]
+
+    def end(self, token):
+        """Gets the token of a client which left volunteerly (or was disconnected) and forgets its session."""
+
+        with self.lock: self.sessions.pop(token, None)
+
+    def resume(self, token):
+        """Gets the token sent by a client which reconnected and,
+        Returns its session as a tuple like this: (<Client-name>, <Room-name>) (the session is connected again),
+        Returns None if there is no such session (or it had expired)."""
+
+        with self.lock:
+            session = self.sessions.get(token)
+            if session is None: return None
+            if session[2] is not None and session[2] < time.monotonic():
+                del self.sessions[token]
+                return None
+            session[2] = None
+            return session[0], session[1]
+
+    def prune(self, now):
+        """Forgets the expired sessions (or the suspended one which expires first, if none had)."""
+
+        for token, (client_name, room_name, expiry_time) in list(self.sessions.items()):
+            if expiry_time is not None and expiry_time < now: del self.sessions[token]
+        if len(self.sessions) >= self.max_sessions:
+            suspended_sessions = [(expiry_time, token) for token, (client_name, room_name, expiry_time)\
+                in self.sessions.items() if expiry_time is not None]
+            if suspended_sessions: del self.sessions[min(suspended_sessions)[1]]
+
+    def fetch_state(self):
+        """Returns the whole state as a dictionary which can be serialized as JSON (for 'server_handoff.py')."""
+
+        with self.lock:
+            now = time.monotonic()
+            return {"last_sequence_number": self.last_sequence_number,\
+                "recent_messages": [list(recent_message) for recent_message in self.recent_messages],\
+                "sessions": {token: [client_name, room_name, None if expiry_time is None else expiry_time - now]\
+                    for token, (client_name, room_name, expiry_time) in self.sessions.items()}}
+
+    def restore_state(self, state):
+        """Gets a state returned by 'fetch_state' (in another process) and restores it."""
+
+        with self.lock:
+            now = time.monotonic()
+            self.last_sequence_number = state["last_sequence_number"]
+            self.recent_messages.extend(tuple(recent_message) for recent_message in state["recent_messages"])
+            self.sessions = {token: [client_name, room_name, None if expires_in is None else now + expires_in]\
+                for token, (client_name, room_name, expires_in) in state["sessions"].items()}
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the sessions of the clients.\n\
+")
+
+
+# END
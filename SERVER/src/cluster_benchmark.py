@@ -0,0 +1,153 @@
+"""
+-----------------
+CLUSTER BENCHMARK
+-----------------
+
+* Measures the chat throughput (messages delivered per second) of the server cluster (see 'server_cluster.py')
+    with 1, 2, 4 and 8 workers on the loopback interface.
+* The clients are spread over a few rooms and run in several processes (so that the load generator
+    is not the bottleneck); a few clients of every room keep sending 'Chat:' messages for the measured duration.
+* The cluster runs without the flood control (see FLOOD_CONTROL_ENABLED), as the senders send as fast as they can,
+    and without the event log file (see EVENT_LOG_PATH).
+* Usage: python cluster_benchmark.py [<engine> [<no. of clients> [<duration in seconds>]]]
+
+Note: The throughput scales only up to the no. of free CPU cores (the load generator needs some of them too).
+
+"""
+
+
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+#from ... import ...
+
+from server_config import *
+from message_framing import FrameDecoder, encode_frame
+
+
+BENCHMARK_HOST                      = "127.0.0.1"
+WORKER_COUNTS                       = (1, 2, 4, 8)
+DEFAULT_CLIENTS                     = 200
+DEFAULT_DURATION                    = 5.0           # Seconds
+LOAD_PROCESSES                      = 4
+NO_OF_ROOMS                         = 10
+SENDERS_PER_ROOM                    = 2
+MESSAGE_CONTENT                     = "x" * 80
+CLUSTER_START_TIMEOUT               = 10.0          # Seconds
+SENDER_STOP_TIMEOUT                 = 5.0           # Seconds the senders get to finish their last write once stopped
+
+
+async def run_clients(port, client_numbers, start_barrier, duration):
+    """Connects the clients of the given numbers, makes them chat for the given duration and,
+    Returns the no. of chat messages delivered to them."""
+
+    delivered = 0
+    stop = asyncio.Event()
+
+    async def open_client(client_number):
+        reader, writer = await asyncio.open_connection(BENCHMARK_HOST, port)
+        permission = (await reader.read(MAX_MESSAGE_LENGTH)).decode()
+        if not(ACCEPT_MESSAGE in permission): raise ConnectionRefusedError(permission)
+        writer.write(FRAMING_REQUEST.encode() + encode_frame(f"bot{client_number}"))
+        writer.write(encode_frame(JOIN_ROOM_MESSAGE_PREFIX + f"room{client_number % NO_OF_ROOMS}"))
+        await writer.drain()
+        return reader, writer
+
+    async def receive(reader):
+        nonlocal delivered
+        frame_decoder = FrameDecoder()
+        while 1:
+            data = await reader.read(RECEIVE_BUFFER_SIZE)
+            if not(data): break
+            if stop.is_set(): continue          # Only the deliveries within the duration are counted
+            for message in frame_decoder.feed(data):
+                if message.startswith(CHAT_MESSAGE_PREFIX): delivered += 1
+
+    async def send(writer):
+        message_frame = encode_frame(CHAT_MESSAGE_PREFIX + MESSAGE_CONTENT)
+        while not(stop.is_set()):
+            writer.write(message_frame)
+            await writer.drain()
+            await asyncio.sleep(0)
+
+    connections = [await open_client(client_number) for client_number in client_numbers]
+    await asyncio.get_running_loop().run_in_executor(None, start_barrier.wait)
+    receivers = [asyncio.ensure_future(receive(reader)) for reader, writer in connections]
+    senders = [asyncio.ensure_future(send(writer)) for client_number, (reader, writer) in zip(client_numbers, connections)\
+        if client_number // NO_OF_ROOMS < SENDERS_PER_ROOM]
+    await asyncio.sleep(duration)
+    stop.set()
+    # A sender whose writes are held up by the server (like throttled by the flood control) is cancelled.
+    try: await asyncio.wait_for(asyncio.gather(*senders), SENDER_STOP_TIMEOUT)
+    except asyncio.TimeoutError: pass
+    for reader, writer in connections:
+        writer.write(encode_frame(SHUTDOWN_MESSAGE_PREFIX + "ClientTerminated"))
+        writer.close()
+    for receiver in receivers: receiver.cancel()
+    return delivered
+
+
+def run_load_process(port, client_numbers, start_barrier, duration, results):
+    """Runs the clients of the given numbers (in a load process) and puts the no. of deliveries in the results."""
+
+    results.put(asyncio.run(run_clients(port, client_numbers, start_barrier, duration)))
+
+
+def wait_for_port(port):
+    """Waits until the cluster accepts connections on the given port."""
+
+    deadline = time.monotonic() + CLUSTER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((BENCHMARK_HOST, port)): return
+        except OSError: time.sleep(0.1)
+    raise TimeoutError("The cluster did not start")
+
+
+def benchmark_cluster(engine, no_of_workers, no_of_clients, duration):
+    """Starts a cluster of the given no. of workers on loopback, benchmarks it and,
+    Returns the no. of chat messages delivered per second."""
+
+    with socket.socket() as free_socket:
+        free_socket.bind((BENCHMARK_HOST, 0))
+        port = free_socket.getsockname()[1]
+    cluster_process = subprocess.Popen([sys.executable, "server_cluster.py", str(no_of_workers), engine, str(port),\
+        str(no_of_clients + 1)], cwd = os.path.dirname(os.path.abspath(__file__)),\
+        stdout = subprocess.DEVNULL, env = dict(os.environ, **{SETTINGS_ENVIRONMENT_PREFIX + "FLOOD_CONTROL_ENABLED": "false",\
+        SETTINGS_ENVIRONMENT_PREFIX + "EVENT_LOG_PATH": "none"}))
+    try:
+        wait_for_port(port)
+        time.sleep(0.5)         # Lets all the workers start listening (and the probe above get uncounted)
+        start_barrier = multiprocessing.Barrier(LOAD_PROCESSES)
+        results = multiprocessing.Queue()
+        load_processes = [multiprocessing.Process(target = run_load_process, args = (port,\
+            list(range(n, no_of_clients, LOAD_PROCESSES)), start_barrier, duration, results)) for n in range(LOAD_PROCESSES)]
+        for load_process in load_processes: load_process.start()
+        delivered = sum(results.get() for load_process in load_processes)
+        for load_process in load_processes: load_process.join()
+    finally:
+        cluster_process.terminate()
+        cluster_process.wait()
+    return delivered / duration
+
+
+if __name__ == '__main__':
+    engine = sys.argv[1] if len(sys.argv) > 1 else SERVER_ENGINE
+    no_of_clients = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CLIENTS
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_DURATION
+
+    print(f"\nEngine: {engine}    Clients: {no_of_clients}    Rooms: {NO_OF_ROOMS}    CPU cores: {os.cpu_count()}\n")
+    print(f"{'Workers':<9}{'Deliveries/s':>16}{'Speed-up':>10}")
+    base_throughput = None
+    for no_of_workers in WORKER_COUNTS:
+        throughput = benchmark_cluster(engine, no_of_workers, no_of_clients, duration)
+        if base_throughput is None: base_throughput = throughput
+        print(f"{no_of_workers:<9}{throughput:>16.0f}{throughput / base_throughput:>10.2f}")
+    print()
+
+
+# END
@@ -0,0 +1,85 @@
+"""
+--------------------
+COMPACT CHAT HISTORY
+--------------------
+
+* Offline tool to compact the chat history log (run it only when the server is stopped).
+* Keeps only the last given no. of messages of each room (and optionally only the messages newer than the given age)
+    and rewrites them into as few segments as possible.
+* Usage: python compact_chat_history.py [<directory> [<messages per room> [<max. age in days>]]]
+
+"""
+
+
+import os
+import sys
+import time
+from collections import deque
+
+from server_config import *
+from chat_history import encode_record, read_segment, list_segments, segment_number_of, SEGMENT_NAME_FORMAT
+
+
+def compact(directory, messages_per_room, max_age = None, segment_size = CHAT_HISTORY_SEGMENT_SIZE):
+    """Compacts the segments in the given directory.
+    Returns a tuple like this: (<No.-of-records-before>, <No.-of-records-after>, <Bytes-before>, <Bytes-after>)"""
+
+    segment_paths = list_segments(directory)
+    if not(segment_paths): return 0, 0, 0, 0
+    oldest_timestamp = time.time() - max_age if max_age is not None else 0
+
+    records_before = 0
+    bytes_before = 0
+    room_records = {}
+    for segment_path in segment_paths:
+        bytes_before += os.path.getsize(segment_path)
+        for record in read_segment(segment_path):
+            records_before += 1
+            if record[0] < oldest_timestamp: continue
+            if not(record[1] in room_records): room_records[record[1]] = deque(maxlen = messages_per_room)
+            room_records[record[1]].append(record)
+    records = sorted((record for records in room_records.values() for record in records), key = lambda record: record[0])
+
+    # The compacted segments are written with temporary names first, so that nothing is lost if this fails midway.
+    compacted_paths = []
+    segment_data = bytearray()
+    for record in records:
+        data = encode_record(*record)
+        if segment_data and len(segment_data) + len(data) > segment_size:
+            compacted_paths.append(write_compacted_segment(directory, len(compacted_paths) + 1, segment_data))
+            segment_data = bytearray()
+        segment_data += data
+    if segment_data: compacted_paths.append(write_compacted_segment(directory, len(compacted_paths) + 1, segment_data))
+
+    # Each compacted segment atomically replaces the original of its no. (if any), and only then are the originals
+    # left over (the higher numbered ones) removed, so that a failure midway at worst repeats some records.
+    bytes_after = 0
+    for compacted_path in compacted_paths:
+        bytes_after += os.path.getsize(compacted_path)
+        os.replace(compacted_path, compacted_path[:-len(".compact")])
+    for segment_path in segment_paths:
+        if segment_number_of(segment_path) > len(compacted_paths): os.remove(segment_path)
+    return records_before, len(records), bytes_before, bytes_after
+
+
+def write_compacted_segment(directory, segment_number, segment_data):
+    """Writes the given data as a compacted segment (with a temporary name) and returns its path."""
+
+    compacted_path = os.path.join(directory, SEGMENT_NAME_FORMAT.format(segment_number) + ".compact")
+    with open(compacted_path, "wb") as compacted_file:
+        compacted_file.write(segment_data)
+        compacted_file.flush()
+        os.fsync(compacted_file.fileno())
+    return compacted_path
+
+
+if __name__ == '__main__':
+    directory = sys.argv[1] if len(sys.argv) > 1 else CHAT_HISTORY_DIRECTORY
+    messages_per_room = int(sys.argv[2]) if len(sys.argv) > 2 else CHAT_HISTORY_RING_BUFFER_SIZE
+    max_age = float(sys.argv[3]) * 24 * 60 * 60 if len(sys.argv) > 3 else None
+
+    records_before, records_after, bytes_before, bytes_after = compact(directory, messages_per_room, max_age)
+    print(f"\nCompacted '{directory}': {records_before} -> {records_after} messages, {bytes_before} -> {bytes_after} bytes\n")
+
+
+# END
@@ -0,0 +1,81 @@
+"""
+---------------------
+COMPRESSION BENCHMARK
+---------------------
+
+* Measures the bandwidth saved by the negotiated compression against the CPU spent on it (no network involved).
+* For typical messages (short and long chats, client list snapshots and room lists) reports the bytes on the wire
+    without and with compression, the time to compress (once per broadcast) and to inflate (once per client).
+* Also compares compressing a broadcast once with compressing it for every recipient.
+* Usage: python compression_benchmark.py [<no. of recipients> [<no. of repetitions>]]
+
+"""
+
+
+import json
+import random
+import sys
+import time
+#from ... import ...
+
+from server_config import *
+from message_framing import FrameDecoder, encode_frame
+
+
+DEFAULT_RECIPIENTS                  = 100
+DEFAULT_REPETITIONS                 = 200
+CHAT_WORDS = ("the meeting is moved to tomorrow, please check the room list and join the project room "
+    "when you are free. I have pushed the changes for the release, let me know if the build fails again").split()
+
+
+def sample_messages():
+    """Returns a list of tuples like this: (<Description>, <Message>)"""
+
+    random.seed(1)
+    long_chat = " ".join(random.choice(CHAT_WORDS) for n in range(150))[:MAX_MESSAGE_LENGTH - 100]
+    return [
+        ("chat (short)", CHAT_MESSAGE_PREFIX + "alice> see you at 5"),
+        ("chat (long)", CHAT_MESSAGE_PREFIX + "alice> " + long_chat),
+        ("snapshot (50 clients)", CLIENT_LIST_SNAPSHOT_MESSAGE_PREFIX + json.dumps({"room": DEFAULT_ROOM_NAME,\
+            "clients": [[n + 1, f"user{n:04d}"] for n in range(50)]})),
+        ("snapshot (500 clients)", CLIENT_LIST_SNAPSHOT_MESSAGE_PREFIX + json.dumps({"room": DEFAULT_ROOM_NAME,\
+            "clients": [[n + 1, f"user{n:04d}"] for n in range(500)]})),
+        ("room list (100 rooms)", ROOM_LIST_MESSAGE_PREFIX + json.dumps([[f"room-{n}", n % 7] for n in range(100)])),
+    ]
+
+
+def time_per_call(function, repetitions):
+    """Returns the average CPU time (in seconds) of calling the given function."""
+
+    start = time.process_time()
+    for n in range(repetitions): function()
+    return (time.process_time() - start) / repetitions
+
+
+if __name__ == '__main__':
+    no_of_recipients = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RECIPIENTS
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_REPETITIONS
+
+    print(f"\nThreshold: {COMPRESSION_THRESHOLD} bytes    Level: {COMPRESSION_LEVEL}    Recipients: {no_of_recipients}\n")
+    print(f"{'Message':<24}{'Plain (B)':>11}{'Wire (B)':>10}{'Saved':>8}{'Compress (us)':>15}{'Inflate (us)':>14}\
+{'Saved/broadcast (KB)':>22}")
+    for description, message in sample_messages():
+        plain_frame = encode_frame(message)
+        wire_frame = encode_frame(message, True)
+        compress_time = time_per_call(lambda: encode_frame(message, True), repetitions)
+        inflate_time = time_per_call(lambda: FrameDecoder().feed(wire_frame), repetitions)
+        saved = 1 - len(wire_frame) / len(plain_frame)
+        print(f"{description:<24}{len(plain_frame):>11}{len(wire_frame):>10}{saved:>8.0%}\
+{compress_time * 1e6:>15.1f}{inflate_time * 1e6:>14.1f}\
+{(len(plain_frame) - len(wire_frame)) * no_of_recipients / 1024:>22.1f}")
+
+    # A broadcast compressed for every recipient costs the compression that many times.
+    message = sample_messages()[1][1]
+    once_time = time_per_call(lambda: [encode_frame(message, True)] * no_of_recipients, repetitions)
+    per_recipient_time = time_per_call(lambda: [encode_frame(message, True) for n in range(no_of_recipients)],\
+        max(1, repetitions // 10))
+    print(f"\nLong chat to {no_of_recipients} recipients: compressed once {once_time * 1e6:.1f} us,\
+ per recipient {per_recipient_time * 1e6:.1f} us ({per_recipient_time / once_time:.0f}x)\n")
+
+
+# END
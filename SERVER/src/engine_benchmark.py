@@ -0,0 +1,152 @@
+"""
+----------------
+ENGINE BENCHMARK
+----------------
+
+* Compares the threaded and the asyncio server engines on the loopback interface.
+* Measures the connections per second and the broadcast (fan-out) latency of 'Chat:' messages.
+* Usage: python engine_benchmark.py [<no. of clients> [<no. of broadcast rounds>]]
+
+"""
+
+
+import asyncio
+import contextlib
+import io
+import statistics
+import sys
+import time
+from threading import Thread
+
+from server_config import *
+from group_chat_server import create_server
+from message_framing import encode_frame
+
+
+BENCHMARK_HOST                      = "127.0.0.1"
+DEFAULT_CLIENTS                     = 200
+DEFAULT_ROUNDS                      = 50
+CONNECT_CONCURRENCY                 = 100
+
+
+class BenchmarkClient(object):
+    """A minimal headless client which speaks the chat protocol.
+    Keeps reading from the server in the background and resolves the registered markers when they arrive."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.tail = ""
+        self.waiters = {}
+        self.read_task = asyncio.ensure_future(self.read_forever())
+
+    async def read_forever(self):
+        """Reads everything the server sends (so that the server never blocks on us) and resolves the markers."""
+
+        while 1:
+            try: data = await self.reader.read(65536)
+            except: data = b""
+            if not(data): break
+            self.tail += data.decode(errors = "ignore")
+            for marker in [marker for marker in self.waiters if marker in self.tail]:
+                self.waiters.pop(marker).set_result(time.perf_counter())
+            self.tail = self.tail[-64:]         # Enough to match a marker split between two reads
+
+    def expect(self, marker):
+        """Returns a future resolved with the arrival time of the given marker."""
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[marker] = future
+        return future
+
+    def send(self, message):
+        self.writer.write(encode_frame(message))
+
+    async def close(self):
+        self.send(SHUTDOWN_MESSAGE_PREFIX + "ClientTerminated")
+        self.writer.close()
+        self.read_task.cancel()
+
+
+async def open_client(port, name):
+    """Connects with the server and does the handshake.
+    Returns a 'BenchmarkClient' instance."""
+
+    reader, writer = await asyncio.open_connection(BENCHMARK_HOST, port)
+    permission = (await reader.read(MAX_MESSAGE_LENGTH)).decode()
+    if not(ACCEPT_MESSAGE in permission): raise ConnectionRefusedError(permission)
+    writer.write(FRAMING_REQUEST.encode() + encode_frame(name))
+    return BenchmarkClient(reader, writer)
+
+
+async def run_clients(port, no_of_clients, no_of_rounds):
+    """Connects the clients, runs the broadcast rounds and,
+    Returns the results as a dictionary."""
+
+    semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect(n):
+        async with semaphore: return await open_client(port, f"bot{n}")
+
+    start = time.perf_counter()
+    clients = await asyncio.gather(*[connect(n) for n in range(no_of_clients)])
+    connect_time = time.perf_counter() - start
+
+    # Waits until the roster updates of all the joins had settled
+    marker = "<settled>"
+    arrivals = [client.expect(marker) for client in clients]
+    clients[-1].send(CHAT_MESSAGE_PREFIX + marker)
+    await asyncio.gather(*arrivals)
+
+    fan_out_latencies = []
+    for round_no in range(no_of_rounds):
+        marker = f"<ping{round_no}>"
+        arrivals = [client.expect(marker) for client in clients]
+        start = time.perf_counter()
+        clients[round_no % no_of_clients].send(CHAT_MESSAGE_PREFIX + marker)
+        fan_out_latencies.append(max(await asyncio.gather(*arrivals)) - start)
+
+    for client in clients: await client.close()
+    await asyncio.sleep(0.2)
+
+    fan_out_latencies.sort()
+    return {
+        "connects_per_second": no_of_clients / connect_time,
+        "fan_out_p50_ms": statistics.median(fan_out_latencies) * 1000,
+        "fan_out_max_ms": fan_out_latencies[-1] * 1000,
+    }
+
+
+def benchmark_engine(engine, no_of_clients, no_of_rounds):
+    """Starts a server with the given engine on loopback, benchmarks it and,
+    Returns the results as a dictionary."""
+
+    # The server logs every connection to the console, which is not what is measured here.
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = create_server(engine, 0, BENCHMARK_HOST, event_log_path = None)
+        server.max_clients = no_of_clients
+        server.flood_control.enabled = False      # The clients send faster than the chat rate limits
+        server_thread = Thread(target = server.start_listening)
+        server_thread.start()
+        server.listening_event.wait()
+        try: results = asyncio.run(run_clients(server.server_port, no_of_clients, no_of_rounds))
+        finally:
+            server.shutdown()
+            server_thread.join()
+    return results
+
+
+if __name__ == '__main__':
+    no_of_clients = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CLIENTS
+    no_of_rounds = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ROUNDS
+
+    print(f"\nClients: {no_of_clients}    Broadcast rounds: {no_of_rounds}\n")
+    print(f"{'Engine':<10}{'Connects/s':>14}{'Fan-out p50 (ms)':>20}{'Fan-out max (ms)':>20}")
+    for engine in ("threaded", "asyncio"):
+        results = benchmark_engine(engine, no_of_clients, no_of_rounds)
+        print(f"{engine:<10}{results['connects_per_second']:>14.1f}\
+{results['fan_out_p50_ms']:>20.2f}{results['fan_out_max_ms']:>20.2f}")
+    print()
+
+
+# END
@@ -0,0 +1,196 @@
+"""
+---------
+EVENT LOG
+---------
+
+* The structured log of the events of the Group Chat server (the clients connecting, being denied or accepted,
+    disconnecting, sending junk messages and so on), as JSON lines like this:
+    {"time": <Unix time>, "level": "info", "event": "accepted", "client_id": 5, "address": ["127.0.0.1", 50123], ...}
+* Contains the class called 'EventLog' which only queues the events (in a bounded queue) from the accepting,
+    receiving and writing threads (or the event loop); a background writer thread writes them to the file
+    and shows them on the console, so that a slow console (or pipe, or disk) never stalls the server.
+    The events over EVENT_LOG_QUEUE_SIZE are dropped (and counted) instead.
+* The events below the level (see EVENT_LOG_LEVEL and EVENT_LOG_CONSOLE_LEVEL) are dropped before being queued,
+    and only one of every N of the noisy events is logged (see EVENT_LOG_SAMPLE_EVERY), with the N as "sampled".
+* The file is rotated based on its size, keeping EVENT_LOG_BACKUP_COUNT older files.
+
+"""
+
+
+import json
+import os
+import queue
+import sys
+import time
+from threading import Thread
+
+from server_config import *
+
+
+LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+NO_LEVEL = 100                      # Above all the levels (nothing is logged)
+
+# What is shown on the console for each event (the events not listed are only written to the file)
+CONSOLE_MESSAGES = {
+    "request": "\nRequest received from {address}",
+    "rate_limited": "Request denied for {address} as it connects too often\n",
+    "denied": "Request denied for {address} as max. no. of clients are connected\n",
+    "waiting": "Request from {address} is waiting for a free slot\n",
+    "accepted": "Request accepted for {address}\n",
+    "left": "\n{address} volunteerly got disconnected\n",
+    "flooding": "\n{address} was flooding the chat... Disconnected it\n",
+    "unresponsive": "\n{address} stopped responding... Disconnected it\n",
+    "too_slow": "\n{address} is too slow to receive the messages... Disconnected it\n",
+    "junk": "\n{address} had sent some junk message... Ignored it\n",
+    "room_name_too_long": "\n{address} had asked for a room with a too lengthy name... Ignored it\n",
+    "file_shared": "\n{address} shared '{file_name}' ({size} bytes in {seconds} s, {bytes_per_second} bytes/s)\n",
+}
+
+
+class EventLog(object):
+    """Logs the events of a server to a file (of JSON lines) and the console, from a background writer thread.
+    The path of the file (None for no file) should be given when instance of the class is created."""
+
+    def __init__(self, path, level = EVENT_LOG_LEVEL, console_level = EVENT_LOG_CONSOLE_LEVEL,\
+        sample_every = EVENT_LOG_SAMPLE_EVERY, max_file_size = EVENT_LOG_MAX_FILE_SIZE, backup_count = EVENT_LOG_BACKUP_COUNT):
+        self.path = path
+        self.level_number = NO_LEVEL
+        self.console_level_number = NO_LEVEL
+        self.set_levels(level, console_level)
+        self.sample_every = dict(sample_every)
+        self.max_file_size = max_file_size
+        self.backup_count = backup_count
+
+        self.event_queue = queue.Queue(EVENT_LOG_QUEUE_SIZE)
+        self.event_counts = {}          # Will contain items like this: <Event>: <No. of times it happened> (for the sampling)
+        self.dropped_events = 0
+        self.sampled_out_events = 0
+        self.reported_dropped_events = 0
+
+        self.log_file = None
+        self.file_size = 0
+        self.writer_thread = Thread(target = self.write_events)
+        self.writer_thread.start()
+
+    def set_levels(self, level, console_level):
+        """Gets the lowest levels of the events to be written to the file and shown on the console (None for nothing)."""
+
+        self.level_number = LOG_LEVELS[level] if self.path is not None and level is not None else NO_LEVEL
+        self.console_level_number = LOG_LEVELS[console_level] if console_level is not None else NO_LEVEL
+
+    def log(self, level, event, client_id = None, address = None, **fields):
+        """Gets the level and the name of an event, the id number and the address of the client
+            (if it is about a client) and any other fields of the event and,
+        Queues it to be logged (unless it is below the levels or not sampled).
+        This is a non-blocking call (the event is dropped if the writer is too far behind)."""
+
+        level_number = LOG_LEVELS[level]
+        if level_number < self.level_number and level_number < self.console_level_number: return
+        sample_every = self.sample_every.get(event)
+        if sample_every:
+            event_count = self.event_counts[event] = self.event_counts.get(event, 0) + 1
+            if (event_count - 1) % sample_every:
+                self.sampled_out_events += 1
+                return
+            fields["sampled"] = sample_every
+        try: self.event_queue.put_nowait((time.time(), level_number, level, event, client_id, address, fields))
+        except queue.Full: self.dropped_events += 1
+
+    def write_events(self):
+        """Writes the queued events (up to EVENT_LOG_BATCH_SIZE at a time) until 'close' is called.
+        Note: This function is a blocking call."""
+
+        closing = False
+        while not(closing):
+            events = [self.event_queue.get()]
+            while len(events) < EVENT_LOG_BATCH_SIZE:
+                try: events.append(self.event_queue.get_nowait())
+                except queue.Empty: break
+            if events[-1] is None:
+                closing = True
+                events.pop()
+            try: self.write_batch(events)
+            except (OSError, ValueError) as error: print(f"\nCould not write the event log: {error}\n")
+        if self.log_file is not None: self.log_file.close()
+
+    def write_batch(self, events):
+        """Gets some queued events and writes them to the file and the console (as per their levels)."""
+
+        lines, console_messages = [], []
+        dropped_events = self.dropped_events
+        if dropped_events != self.reported_dropped_events:
+            lines.append(json.dumps({"time": time.time(), "level": "warning", "event": "events_dropped",\
+                "count": dropped_events - self.reported_dropped_events}) + "\n")
+            self.reported_dropped_events = dropped_events
+        for timestamp, level_number, level, event, client_id, address, fields in events:
+            if level_number >= self.console_level_number and event in CONSOLE_MESSAGES:
+                console_messages.append(CONSOLE_MESSAGES[event].format(address = address, **fields))
+            if level_number < self.level_number: continue
+            record = {"time": round(timestamp, 6), "level": level, "event": event}
+            if client_id is not None: record["client_id"] = client_id
+            if address is not None: record["address"] = address
+            record.update(fields)
+            lines.append(json.dumps(record, ensure_ascii = False, default = str) + "\n")
+
+        if console_messages:
+            sys.stdout.write("\n".join(console_messages) + "\n")
+            sys.stdout.flush()
+        if lines and self.level_number != NO_LEVEL: self.write_lines(lines)
+
+    def write_lines(self, lines):
+        """Gets some lines and appends them to the file, rotating the file whenever the next line does not fit in it."""
+
+        if self.log_file is None:
+            self.log_file = open(self.path, "ab")
+            self.file_size = self.log_file.tell()
+        chunk = []
+        for line in lines:
+            data = line.encode()
+            if self.file_size and self.file_size + len(data) > self.max_file_size:
+                self.log_file.write(b"".join(chunk))
+                self.log_file.close()
+                self.rotate_files()
+                self.log_file = open(self.path, "ab")
+                self.file_size, chunk = 0, []
+            chunk.append(data)
+            self.file_size += len(data)
+        self.log_file.write(b"".join(chunk))
+        self.log_file.flush()
+
+    def rotate_files(self):
+        """Renames the file to '<Path>.1' (and so on for the older ones), deleting the ones over 'backup_count'."""
+
+        if not(self.backup_count):
+            os.remove(self.path)
+            return
+        for backup_number in range(self.backup_count - 1, 0, -1):
+            backup_path = f"{self.path}.{backup_number}"
+            if os.path.exists(backup_path): os.replace(backup_path, f"{self.path}.{backup_number + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def close(self):
+        """Writes the queued events, closes the file and stops the writer thread."""
+
+        self.event_queue.put(None)
+        self.writer_thread.join()
+
+
+def fetch_worker_log_path(path, worker_index):
+    """Gets the path of the event log and the no. of a worker of a cluster (see 'server_cluster.py') and,
+    Returns the path of the event log of the worker (like 'server_events-worker-0.log')."""
+
+    if path is None: return None
+    root, extension = os.path.splitext(path)
+    return f"{root}-worker-{worker_index}{extension}"
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the event log of the server.\n\
+Run 'group_chat_server.py' to start the server-side application.\n\
+")
+
+
+# END
@@ -0,0 +1,117 @@
+"""
+----------------
+FANOUT BENCHMARK
+----------------
+
+* Micro-benchmark of the broadcast fan-out of the threaded server engine (no network handshake involved).
+* Compares the per-recipient fan-out (encode and write every message for every client) with
+    the encode-once fan-out whose writers coalesce the queued messages into vectored writes.
+* Reports the write system calls, the CPU time and the wall time for 5, 50 and 500 clients.
+* Usage: python fanout_benchmark.py [<no. of messages> [<messages per second>]]
+
+"""
+
+
+import contextlib
+import io
+import selectors
+import socket
+import sys
+import time
+from threading import Thread
+
+from server_config import *
+from group_chat_server import GroupChatServer, ClientInterface
+from server_settings import fetch_default_settings
+
+
+CLIENT_COUNTS                       = (5, 50, 500)
+DEFAULT_MESSAGES                    = 1000
+DEFAULT_MESSAGE_RATE                = 1000      # Messages per second
+MESSAGE_CONTENT                     = "bot> " + "x" * 80
+
+
+def drain_sockets(sockets, expected_bytes, results):
+    """Reads from all the given sockets until the expected no. of bytes had arrived.
+    Stores the time of completion in the results."""
+
+    selector = selectors.DefaultSelector()
+    for sock in sockets: selector.register(sock, selectors.EVENT_READ)
+    received_bytes = 0
+    while received_bytes < expected_bytes:
+        for key, events in selector.select(timeout = 5):
+            received_bytes += len(key.fileobj.recv(RECEIVE_BUFFER_SIZE))
+    results["end"] = time.perf_counter()
+    selector.close()
+
+
+def run_fan_out(no_of_clients, no_of_messages, message_rate, coalesced):
+    """Fans out the messages to the given no. of clients over socket pairs and,
+    Returns the results as a dictionary."""
+
+    # The per-recipient fan-out writes every message on its own (no batching of the outbound messages).
+    settings = fetch_default_settings() if coalesced else dict(fetch_default_settings(), OUTBOUND_BATCH_WINDOW = 0,\
+        OUTBOUND_BATCH_SIZE = 1)
+    with contextlib.redirect_stdout(io.StringIO()): server = GroupChatServer(0, "127.0.0.1", settings = settings,\
+        event_log_path = None)
+    peer_sockets = []
+    for n in range(no_of_clients):
+        server_side, peer_side = socket.socketpair()
+        client_interface = ClientInterface(n + 1, server_side, ("socketpair", n + 1))
+        client_interface.framed = True
+        client_interface.set_client_name(f"bot{n}")
+        client_interface.configured = True
+        client_interface.outbound_queue_size = no_of_messages
+        server.add_client_entity(client_interface)      # Sets the batching of its writer as per the settings
+        client_interface.start_writer()
+        peer_sockets.append(peer_side)
+
+    message = CHAT_MESSAGE_PREFIX + MESSAGE_CONTENT
+    expected_bytes = no_of_clients * no_of_messages * len(client_interface.encode_message(message))
+    results = {}
+    drain_thread = Thread(target = drain_sockets, args = (peer_sockets, expected_bytes, results))
+    drain_thread.start()
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for n in range(no_of_messages):
+        if coalesced: server.broadcast(message)
+        else:
+            for client_interface in server.live_connections.values(): client_interface.send_message(message)
+        # Paces the messages to the given rate
+        delay = start + (n + 1) / message_rate - time.perf_counter()
+        if delay > 0: time.sleep(delay)
+    drain_thread.join()
+    cpu_time = time.process_time() - cpu_start
+
+    write_calls = sum(client_interface.write_calls for client_interface in server.live_connections.values())
+    for client_interface in server.live_connections.values(): client_interface.close()
+    for client_interface in server.live_connections.values(): client_interface.wait_finished(None)
+    for sock in peer_sockets: sock.close()
+    if server.chat_history is not None: server.chat_history.close()
+    server.event_log.close()
+    server.server_socket.close()
+    return {
+        "write_calls": write_calls,
+        "writes_per_delivery": write_calls / (no_of_clients * no_of_messages),
+        "cpu_seconds": cpu_time,
+        "wall_seconds": results["end"] - start,
+    }
+
+
+if __name__ == '__main__':
+    no_of_messages = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_MESSAGES
+    message_rate = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_MESSAGE_RATE
+
+    print(f"\nMessages: {no_of_messages}    Rate: {message_rate} messages/s\n")
+    print(f"{'Clients':<9}{'Fan-out':<15}{'Write calls':>13}{'Writes/delivery':>17}{'CPU (s)':>10}{'Wall (s)':>10}")
+    for no_of_clients in CLIENT_COUNTS:
+        for coalesced in (False, True):
+            results = run_fan_out(no_of_clients, no_of_messages, message_rate, coalesced)
+            print(f"{no_of_clients:<9}{'encode-once' if coalesced else 'per-recipient':<15}\
+{results['write_calls']:>13}{results['writes_per_delivery']:>17.3f}\
+{results['cpu_seconds']:>10.2f}{results['wall_seconds']:>10.2f}")
+    print()
+
+
+# END
@@ -0,0 +1,281 @@
+"""
+--------------
+FILE TRANSFERS
+--------------
+
+* Lets the clients share files (attachments) with their room, sent in chunks which are interleaved with the chat.
+* An upload is spooled to a file (see FILE_SPOOL_DIRECTORY) chunk by chunk, as the very frames which are relayed to
+    the recipients, so that the server relays them with 'sendfile' (zero-copy where the platform has it) and
+    never holds a file in the memory, however many recipients it has.
+* The writer of each recipient relays the spooled frames only while no message is waiting in its outbound queue,
+    a slice of whole frames at a time (see FILE_SEND_SLICE), so that a large file never holds up the chat.
+* The uploads and the downloads can be resumed from an offset (after a reconnection, see 'client_core.py').
+* Contains the class called 'FileTransfer' (a file and its spool), the class called 'FileDownload' (the relaying of
+    a file to a client) and the class called 'FileTransferRegistry' (all the files of a server).
+
+Protocol (for the framed clients only):
+    The uploader sends FileOffer:{"name": name, "size": bytes, "ref": its own reference} (or {"id": id, "key": key} to
+    resume an upload) and gets FileAccepted:{"ref": ref, "id": id, "key": key, "offset": bytes received so far} or
+    FileRejected:{"ref": ref, "reason": reason}. Then it sends FileChunk:<id>:<offset>:<base64 data> frames and,
+    once all of them are received, gets FileComplete:{"id": id, "size": bytes, "seconds": s, "bytes_per_second": rate}.
+    The other members of the room get FileOffered:{"id": id, "from": name, "name": name, "size": bytes} and
+    ask for the file with FileRequest:{"id": id, "offset": bytes already received}, getting the FileChunk frames as is.
+
+"""
+
+
+import bisect
+import os
+import secrets
+import time
+#import ...
+from threading import Lock
+
+from server_config import *
+
+
+SPOOL_FILE_EXTENSION = ".spool"
+
+
+class FileTransfer(object):
+    """A file uploaded (or being uploaded) by a client, spooled as the frames to be relayed to the recipients.
+    The spool is appended by the thread (or coroutine) which serves the uploader and read by the writers of
+        the recipients, which only read the frames listed in 'frame_ends' (a frame is listed once it is written)."""
+
+    def __init__(self, transfer_id, key, file_name, size, sender_name, room_name, spool_path):
+        self.id = transfer_id
+        self.key = key                  # Known to the uploader only (needed to resume the upload)
+        self.file_name = file_name
+        self.size = size
+        self.sender_name = sender_name
+        self.room_name = room_name
+        self.spool_path = spool_path
+        self.uploader_id = None         # Id no. of the client uploading it now
+        self.received = 0               # Bytes of the file received so far
+        self.chunk_offsets = []         # File offset of every chunk spooled
+        self.frame_ends = []            # Spool offset where the frame of every chunk ends
+        self.spool_file = open(spool_path, "ab") if size else None
+        self.started_at = time.monotonic()
+        self.completed_at = self.started_at if not(size) else None
+        self.last_active_at = self.started_at
+        self.bytes_relayed = 0
+        self.downloads_completed = 0
+        self.downloaders = set()        # Client interfaces relaying it now (woken up when a chunk is spooled)
+
+    def append_chunk(self, offset, data_length, frame):
+        """Gets the file offset and data length of a chunk received from the uploader and its frame (bytes) and,
+        Spools the frame and wakes up the writers of the recipients.
+        Returns False if it is not the next chunk of the file (it is ignored then), else True."""
+
+        if offset != self.received or not(data_length) or self.received + data_length > self.size: return False
+        self.spool_file.write(frame)
+        self.spool_file.flush()         # The writers read the spool through their own file objects
+        self.chunk_offsets.append(offset)
+        self.frame_ends.append((self.frame_ends[-1] if self.frame_ends else 0) + len(frame))
+        self.received += data_length
+        self.last_active_at = time.monotonic()
+        if self.received == self.size:
+            self.completed_at = self.last_active_at
+            self.spool_file.close()
+        for client_interface in list(self.downloaders): client_interface.wake_writer()
+        return True
+
+    def find_spool_offset(self, offset):
+        """Gets a file offset (the bytes a recipient already has) and,
+        Returns the spool offset of the frame to resume the relaying from.
+        The chunk which has the offset is relayed again (the recipient writes every chunk at its own offset)."""
+
+        no_of_frames = len(self.frame_ends)
+        chunk_index = bisect.bisect_right(self.chunk_offsets, offset, 0, no_of_frames) - 1
+        return self.frame_ends[chunk_index - 1] if chunk_index > 0 else 0
+
+    def fetch_stats(self):
+        """Returns the stats of the transfer as a dictionary (the throughput is of the upload, in bytes per second)."""
+
+        seconds = (self.completed_at or time.monotonic()) - self.started_at
+        return {"id": self.id, "name": self.file_name, "from": self.sender_name, "size": self.size,\
+            "received": self.received, "seconds": round(seconds, 3),\
+            "bytes_per_second": round(self.received / seconds) if seconds > 0 else self.received,\
+            "bytes_relayed": self.bytes_relayed, "downloads_active": len(self.downloaders),\
+            "downloads_completed": self.downloads_completed}
+
+    def close(self):
+        """Closes the spool (it is still read by the downloads in progress)."""
+
+        if self.spool_file is not None: self.spool_file.close()
+
+
+class FileDownload(object):
+    """The relaying of a file to a client, from a spool offset (always at the start of a frame).
+    It has its own file object for the spool, as 'sendfile' moves the file position."""
+
+    def __init__(self, transfer, spool_offset = 0):
+        self.transfer = transfer
+        self.spool_offset = spool_offset
+        self.spool_file = None
+
+    def fetch_slice_length(self, max_length = FILE_SEND_SLICE):
+        """Returns the length of the whole frames spooled after the offset (at least one frame, and
+            up to the given max. length if there are more), 0 if nothing more is spooled yet."""
+
+        frame_ends = self.transfer.frame_ends
+        no_of_frames = len(frame_ends)
+        if not(no_of_frames) or frame_ends[no_of_frames - 1] <= self.spool_offset: return 0
+        next_frame_index = bisect.bisect_right(frame_ends, self.spool_offset, 0, no_of_frames)
+        last_frame_index = bisect.bisect_right(frame_ends, self.spool_offset + max_length, 0, no_of_frames) - 1
+        return frame_ends[max(next_frame_index, last_frame_index)] - self.spool_offset
+
+    def open_spool(self):
+        """Returns the file object of the spool (opens it on the first call)."""
+
+        if self.spool_file is None: self.spool_file = open(self.transfer.spool_path, "rb")
+        return self.spool_file
+
+    def advance(self, length):
+        """Gets the length of the frames which were relayed and moves the offset past them."""
+
+        self.spool_offset += length
+        self.transfer.bytes_relayed += length
+
+    def is_done(self):
+        """Returns True if the whole file was relayed, else False."""
+
+        frame_ends = self.transfer.frame_ends
+        return self.transfer.completed_at is not None and self.spool_offset >= (frame_ends[-1] if frame_ends else 0)
+
+    def close(self):
+        """Closes the file object of the spool."""
+
+        if self.spool_file is not None: self.spool_file.close()
+
+
+class FileTransferRegistry(object):
+    """Keeps the files shared by the clients and their spools in the given directory.
+    A file is forgotten (and its spool deleted) FILE_SPOOL_TIMEOUT seconds after its last chunk, unless it is being
+        relayed then (checked every FILE_SPOOL_PRUNE_INTERVAL by the server, see 'prune_if_due').
+    At most MAX_FILE_TRANSFERS files are kept. Can be called from many threads."""
+
+    def __init__(self, directory = FILE_SPOOL_DIRECTORY, max_transfers = MAX_FILE_TRANSFERS,\
+        max_file_size = MAX_FILE_SIZE, spool_timeout = FILE_SPOOL_TIMEOUT):
+        self.directory = directory
+        self.max_transfers = max_transfers
+        self.max_file_size = max_file_size
+        self.spool_timeout = spool_timeout
+        self.transfers = {}             # Will contain items like this: <Transfer-id>: <FileTransfer>
+        self.lock = Lock()
+        self.pruned_at = time.monotonic()
+        os.makedirs(directory, exist_ok = True)
+
+    def offer(self, file_name, size, sender_name, room_name):
+        """Gets the name and size of a file offered by a client and the client's name and room and,
+        Returns a tuple like this: (<New FileTransfer (None if rejected)>, <Reason of the rejection>)"""
+
+        if not(0 <= size <= self.max_file_size): return None, "too_large"
+        with self.lock:
+            if len(self.transfers) >= self.max_transfers: self.prune(time.monotonic())
+            if len(self.transfers) >= self.max_transfers: return None, "busy"
+            transfer_id = secrets.token_hex(8)     # Unguessable, knowing the id is what lets a client download it
+            transfer = FileTransfer(transfer_id, secrets.token_urlsafe(16), file_name, size, sender_name, room_name,\
+                os.path.join(self.directory, transfer_id + SPOOL_FILE_EXTENSION))
+            self.transfers[transfer_id] = transfer
+        return transfer, ""
+
+    def get(self, transfer_id):
+        """Returns the file transfer with the given id (None if there is no such file)."""
+
+        return self.transfers.get(transfer_id)
+
+    def prune_if_due(self, now):
+        """Prunes the files (see 'prune') if FILE_SPOOL_PRUNE_INTERVAL has passed since the last time."""
+
+        if now - self.pruned_at < FILE_SPOOL_PRUNE_INTERVAL: return
+        try:
+            with self.lock: self.prune(now)
+        except OSError as error: print(f"\nCould not prune the file spool: {error}\n")
+
+    def prune(self, now):
+        """Forgets the files not active for FILE_SPOOL_TIMEOUT (and not being relayed) and deletes their spools,
+        Along with the spools left behind by a server which had crashed.
+        Must be called with the lock held."""
+
+        self.pruned_at = now
+        for transfer_id, transfer in list(self.transfers.items()):
+            if transfer.downloaders or now - transfer.last_active_at < self.spool_timeout: continue
+            del self.transfers[transfer_id]
+            transfer.close()
+            remove_file(transfer.spool_path)
+        for file_name in os.listdir(self.directory):
+            spool_path = os.path.join(self.directory, file_name)
+            if not(file_name.endswith(SPOOL_FILE_EXTENSION)) or file_name[:-len(SPOOL_FILE_EXTENSION)] in self.transfers:
+                continue
+            try:
+                if time.time() - os.path.getmtime(spool_path) >= self.spool_timeout: remove_file(spool_path)
+            except OSError: pass
+
+    def fetch_stats(self):
+        """Returns the stats of all the files as a list (see 'FileTransfer.fetch_stats')."""
+
+        return [transfer.fetch_stats() for transfer in list(self.transfers.values())]
+
+    def fetch_state(self):
+        """Returns the whole state as a dictionary which can be serialized as JSON (for 'server_handoff.py').
+        The spools stay where they are, the new server process carries on with them."""
+
+        with self.lock:
+            now = time.monotonic()
+            return {"transfers": [{"id": transfer.id, "key": transfer.key, "name": transfer.file_name,\
+                "size": transfer.size, "from": transfer.sender_name, "room": transfer.room_name,\
+                "uploader_id": transfer.uploader_id, "received": transfer.received,\
+                "chunk_offsets": transfer.chunk_offsets, "frame_ends": transfer.frame_ends,\
+                "age": now - transfer.started_at, "idle": now - transfer.last_active_at,\
+                "completed_ago": None if transfer.completed_at is None else now - transfer.completed_at,\
+                "bytes_relayed": transfer.bytes_relayed, "downloads_completed": transfer.downloads_completed}\
+                for transfer in self.transfers.values()]}
+
+    def restore_state(self, state):
+        """Gets a state returned by 'fetch_state' (in another process) and restores it."""
+
+        with self.lock:
+            now = time.monotonic()
+            for record in state["transfers"]:
+                transfer = FileTransfer(record["id"], record["key"], record["name"], record["size"], record["from"],\
+                    record["room"], os.path.join(self.directory, record["id"] + SPOOL_FILE_EXTENSION))
+                transfer.uploader_id = record["uploader_id"]
+                transfer.received = record["received"]
+                transfer.chunk_offsets = record["chunk_offsets"]
+                transfer.frame_ends = record["frame_ends"]
+                transfer.started_at = now - record["age"]
+                transfer.last_active_at = now - record["idle"]
+                if record["completed_ago"] is not None:
+                    transfer.completed_at = now - record["completed_ago"]
+                    transfer.close()
+                transfer.bytes_relayed = record["bytes_relayed"]
+                transfer.downloads_completed = record["downloads_completed"]
+                self.transfers[transfer.id] = transfer
+
+    def close(self):
+        """Forgets all the files and deletes their spools (as the server shuts down)."""
+
+        with self.lock:
+            for transfer in self.transfers.values():
+                transfer.close()
+                remove_file(transfer.spool_path)
+            self.transfers = {}
+
+
+def remove_file(path):
+    """Deletes the file at the given path (if it exists)."""
+
+    try: os.remove(path)
+    except OSError: pass
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the file transfers.\n\
+")
+
+
+# END
@@ -0,0 +1,96 @@
+"""
+-------------
+FLOOD CONTROL
+-------------
+
+* Limits the rate of the chat messages, as every 'Chat:' message is fanned out to the whole room
+    (a single flooding client multiplies its load by the room size). The direct messages count too.
+* Contains the class called 'TokenBucket' (a rate and a burst, of messages or bytes).
+* Contains the class called 'FloodControl' which checks every chat message against the buckets of its client
+    (messages and bytes per second) and the global buckets of the server (shared by all the clients).
+* What happens to a client over the limit is decided by FLOOD_POLICY (see 'police_client_message' in
+    'group_chat_server.py'): its reads are delayed ("throttle"), its message is dropped ("drop")
+    or it is disconnected ("disconnect").
+
+"""
+
+
+import time
+#import ...
+from threading import Lock
+
+from server_config import *
+
+
+class TokenBucket(object):
+    """A token bucket which refills 'rate' tokens a second up to 'burst' tokens.
+    The tokens can be borrowed (going below zero), then the bucket is in debt until it refills."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def refill(self, now):
+        """Gets the current time (by 'time.monotonic') and adds the tokens earned since the last refill."""
+
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_for(self, amount):
+        """Returns the seconds until the given amount of tokens is available (0 if it is available now)."""
+
+        return max(0, (min(amount, self.burst) - self.tokens) / self.rate)
+
+    def take(self, amount):
+        """Takes the given amount of tokens (even if not available, borrowing them)."""
+
+        self.tokens -= min(amount, self.burst)     # A message larger than the burst costs just the burst
+
+
+class FloodControl(object):
+    """Checks the chat messages of the clients against the per-client and the global rate limits.
+    A rate of 0 disables the respective limit. Can be called from many threads."""
+
+    def __init__(self, policy = FLOOD_POLICY):
+        self.enabled = FLOOD_CONTROL_ENABLED
+        self.policy = policy
+        self.client_limits = ((CHAT_RATE_PER_CLIENT, CHAT_BURST_PER_CLIENT),\
+            (CHAT_BYTE_RATE_PER_CLIENT, CHAT_BYTE_BURST_PER_CLIENT))       # (<Rate>, <Burst>) of messages, bytes
+        self.global_buckets = tuple(TokenBucket(rate, burst) if rate else None for rate, burst in\
+            ((CHAT_RATE_GLOBAL, CHAT_BURST_GLOBAL), (CHAT_BYTE_RATE_GLOBAL, CHAT_BYTE_BURST_GLOBAL)))
+        self.lock = Lock()
+
+    def check(self, client_interface, client_message):
+        """Gets the client interface and a message received from it and,
+        Returns 0 if the message is within the limits (or not a chat message),
+        Else returns the seconds until it would be within the limits.
+        With the "throttle" policy, the message is always counted (the client is delayed instead),
+        With the others, a message over the limit is not counted."""
+
+        if not(self.enabled) or not(client_message.startswith((CHAT_MESSAGE_PREFIX, DIRECT_MESSAGE_PREFIX))): return 0
+        if client_interface.flood_buckets is None:
+            client_interface.flood_buckets = tuple(TokenBucket(rate, burst) if rate else None\
+                for rate, burst in self.client_limits)
+        amounts = (1, len(client_message.encode()))      # The message and its bytes (not characters)
+        buckets = [(bucket, amount) for bucket, amount in zip(client_interface.flood_buckets + self.global_buckets,\
+            amounts + amounts) if bucket is not None]
+        with self.lock:
+            now = time.monotonic()
+            for bucket, amount in buckets: bucket.refill(now)
+            wait = max([bucket.wait_for(amount) for bucket, amount in buckets], default = 0)
+            if wait and self.policy != "throttle": return wait
+            for bucket, amount in buckets: bucket.take(amount)
+        return wait
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the flood control of the chat messages.\n\
+")
+
+
+# END
@@ -7,31 +7,128 @@ GROUP CHAT SERVER
 * Console based module.
 * Contains the class called 'GroupChatServer' which contains the methods for the required server tasks.
 * Also contains a class called 'ClientInterface' to cater the 'GroupChatServer' class.
+* When max. no. of clients are connected, the new clients wait (in order) in a bounded waiting room
+    and are told their position, until a slot is free (see 'WaitingClient').
+* The connections from each address are rate limited (see 'AcceptRateLimiter'), so that a reconnect flood
+    cannot starve the accepting of the other clients.
+* The chat messages of each client (and of all the clients together) are rate limited, see 'flood_control.py'.
+* A client can send a direct (private) message to another client, addressed by its id number or name,
+    which is looked up in an index of the client names (see 'send_direct_message').
+* The clients can search the recent chat messages (by words, sender and time), see 'chat_search.py'.
+* The clients can share files with their room, relayed from a spool while the chat goes on, see 'file_transfers.py'.
+* The chat messages are sequenced, so that a client which lost its connection can resume its session
+    without missing anything, see 'client_sessions.py'.
+* The clients which ask for heartbeats are pinged when silent and reaped if they stop answering
+    (the handshakes which stall are reaped too), see 'check_heartbeats'. TCP keepalive covers the rest.
+* The server engine can be selected at startup (threaded or asyncio), 
+    see 'SERVER_ENGINE' in 'server_config.py' and 'async_group_chat_server.py'.
+* A new server process can take over the running one without disconnecting its clients
+    (run 'group_chat_server.py <engine> takeover'), see 'server_handoff.py'.
+* The settings (the bind address, the socket tunables, the client limits and so on) can be given in a file,
+    the environment or the command line, and reloaded while running (see 'server_settings.py' and 'apply_settings').
+* The events (the clients connecting, being denied, disconnecting, sending junk and so on) are logged as JSON lines
+    and shown on the console by a background writer, never from the accepting or receiving threads, see 'event_log.py'.
+* The data the clients send can be captured (see WIRE_CAPTURE_PATH) to be replayed against another build
+    of the server, comparing what it delivers, see 'wire_capture.py' and 'wire_replay.py'.
 
 """
 
 
+import argparse
+import base64
+import binascii
+import json
+import os
+import signal
 import socket
-#import ...
-from threading import Thread
+import time
+from collections import deque
+from threading import Thread, Event, Condition, RLock
 
 from server_config import *
+from message_framing import FrameDecoder, encode_frame
+from chat_history import ChatHistory
+from chat_search import ChatSearch
+from server_metrics import ServerMetrics, MetricsEndpoint
+from event_log import EventLog
+from wire_capture import WireCapture
+from flood_control import FloodControl
+from client_sessions import SessionRegistry
+from file_transfers import FileTransferRegistry, FileDownload
+from server_settings import RESTART_SETTINGS, fetch_default_settings, load_settings, reload_settings,\
+    add_setting_arguments, fetch_argument_settings
+from server_handoff import HandoffGate, HandoffListener, capture_client, restore_client, send_record, receive_handover
 
 
 class GroupChatServer(object):
     """Acts as the server for Group Chat application.
     The port in which the server should listen for clients should be given 
-        when instance of the class is created."""
+        when instance of the class is created.
+    The host to bind to can optionally be given (defaults to SERVER_BIND_ADDRESS, or the host name of this computer).
+    The runtime settings can be given as 'settings' (see 'server_settings.py', defaults to those of 'server_config.py').
+    'reuse_port' lets many server processes listen on the same port (see 'server_cluster.py').
+    The metrics are served on localhost at 'metrics_port' (see 'server_metrics.py').
+    A new server process can take over this one through the Unix socket at 'handoff_path' (see 'server_handoff.py'),
+        it passes the listening socket it took over as 'listening_socket' (the port and host are ignored then)."""
 
-    def __init__(self, server_port):
-        self.server_socket = socket.socket()
-        self.server_port = server_port
-        self.host = socket.gethostname()
-        self.server_socket.bind((self.host, self.server_port))
+    def __init__(self, server_port, host = None, reuse_port = False, chat_history_directory = CHAT_HISTORY_DIRECTORY,\
+        metrics_port = METRICS_PORT, handoff_path = None, listening_socket = None, file_spool_directory = FILE_SPOOL_DIRECTORY,\
+        settings = None, event_log_path = EVENT_LOG_PATH):
+        if settings is None: settings = fetch_default_settings()
+        if listening_socket is None:
+            self.server_socket = socket.socket()
+            # Restarts at once on the same port, even while the connections closed before are in TIME_WAIT
+            # (not on Windows, where it would let another process steal the port).
+            if os.name != "nt": self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port: self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            if host is None: host = settings["SERVER_BIND_ADDRESS"]
+            self.host = host if host is not None else socket.gethostname()
+            self.server_socket.bind((self.host, server_port))
+        else:
+            self.server_socket = listening_socket
+            self.server_socket.setblocking(True)       # The previous server process may have been of the asyncio engine
+            self.host = self.server_socket.getsockname()[0]
+        self.server_port = self.server_socket.getsockname()[1]     # Resolves the port if 0 was given
+        self.settings = None            # The settings applied (see 'apply_settings')
 
         self.next_client_id_number = 1
-        self.live_connections = []      # Will contain tuples like this: (<Client-id-no.>, <ClientInterface>)
+        self.client_id_step = 1         # The workers of a cluster interleave their client id numbers
+        self.live_connections = {}      # Will contain items like this: <Client-id-no.>: <ClientInterface>
+        self.registry_lock = RLock()    # Keeps the client list changes and their broadcasts in order
+        self.rooms = {DEFAULT_ROOM_NAME: {}}    # Will contain items like this: <Room-name>: {<Client-id-no.>: <ClientInterface>}
+        self.client_names = {}          # Will contain items like this: <Client-name>: {<Client-id-no.>: <ClientInterface>}
         self.client_threads = {}
+        self.waiting_clients = deque()  # The clients waiting for a slot, in order (guarded by 'registry_lock')
+        self.accept_rate_limiter = AcceptRateLimiter()
+        self.heartbeat_check_interval = HEARTBEAT_CHECK_INTERVAL
+        self.heartbeat_stop_event = Event()
+        self.event_log = EventLog(event_log_path)
+        self.flood_control = FloodControl()
+        self.apply_settings(settings)   # Sets 'max_clients', 'waiting_room_size', the heartbeat timings and so on
+        self.session_registry = SessionRegistry()
+        self.file_transfers = FileTransferRegistry(file_spool_directory) if FILE_TRANSFERS_ENABLED else None
+        self.handoff_path = handoff_path
+        self.handoff_listener = None
+        self.handoff_gate = HandoffGate()   # Keeps the sockets alone while the clients are handed over
+        self.heartbeat_thread = None
+        self.listening_event = Event()     # Set once the server is ready to accept clients
+        self.chat_history = ChatHistory(chat_history_directory) if CHAT_HISTORY_ENABLED else None
+        self.wire_capture = WireCapture(settings["WIRE_CAPTURE_PATH"]) if settings["WIRE_CAPTURE_PATH"] is not None else None
+        self.chat_search = ChatSearch(chat_history_directory if CHAT_HISTORY_ENABLED else None)\
+            if CHAT_SEARCH_ENABLED else None
+        self.metrics = ServerMetrics()
+        self.metrics_endpoint = None
+        if metrics_port is not None:
+            try: self.metrics_endpoint = MetricsEndpoint(self, metrics_port)
+            except OSError as error: print(f"\nCould not serve the metrics on the port {metrics_port}: {error}\n")
+
+        # Set only when the server runs as a worker of a cluster (see 'server_cluster.py')
+        self.cluster_bus = None
+        self.cluster_client_counts = None   # Shared no. of clients of each worker (for the global MAX_CLIENTS)
+        self.worker_index = 0
+        self.remote_rooms = {}          # Will contain items like this: <Room-name>: {<Client-id-no.>: <Client-name>}
+        self.remote_clients = {}        # Will contain items like this: <Client-id-no.>: <Client-name>
+        self.remote_client_names = {}   # Will contain items like this: <Client-name>: {<Client-id-no.>, ...}
 
         print("\n\
 ------------------\n\
@@ -47,112 +144,844 @@ STATE: Idle\n")
         Note: This function is a blocking call."""
 
         print("STATE: Listening...\n")
-        self.server_socket.listen(MAX_CLIENTS + 1)
+        self.server_socket.listen(self.settings["LISTEN_BACKLOG"])
+        self.event_log.log("info", "listening", host = self.host, port = self.server_port, engine = "threaded")
+        self.heartbeat_thread = Thread(target = self.monitor_heartbeats, daemon = True)
+        self.heartbeat_thread.start()
+        self.start_handoff_listener()
+        self.listening_event.set()
         while 1:
+            self.handoff_gate.wait_readable(self.server_socket)
+            if not(self.handoff_gate.enter()): break        # The listening socket is being handed over
             try: client_connection, client_address = self.server_socket.accept()
-            except: break
+            except:
+                self.handoff_gate.leave()
+                break
 
             self.configure_client(client_connection, client_address)
+            self.handoff_gate.leave()
 
     def configure_client(self, client_connection, client_address):
         """Gets the client connection and client address,
         Accepts or Denies the client and if accepts,
         Configures the client."""
 
-        print(f"\nRequest received from {client_address}")
-        if len(self.live_connections) == MAX_CLIENTS:
-            client_connection.send(DENY_MESSAGE.encode())
+        self.event_log.log("info", "request", address = client_address)
+        if not(self.accept_rate_limiter.allow(client_address[0])):
+            self.metrics.rate_limited_clients += 1
+            try: client_connection.send(DENY_MESSAGE.encode())
+            except: pass
             client_connection.close()
-            print(f"Request denied for {client_address} as max. no. of clients are connected\n")
-        else:
-            client_interface = ClientInterface(self.next_client_id_number,\
-                client_connection, client_address)
-            self.live_connections.append((self.next_client_id_number, client_interface))
-            client_connection.send(ACCEPT_MESSAGE.encode())
+            self.event_log.log("warning", "rate_limited", address = client_address)
+            return
+
+        admission = self.request_admission(WaitingClient(client_connection, client_address))
+        if admission is None:
+            self.metrics.denied_clients += 1
+            try: client_connection.send(DENY_MESSAGE.encode())
+            except: pass
+            client_connection.close()
+            self.event_log.log("warning", "denied", address = client_address)
+        elif not(admission): self.event_log.log("info", "waiting", address = client_address)
 
-            new_client_thread = Thread(target = self.start_receiving_messages)
-            new_client_thread.start()
-            self.client_threads[self.next_client_id_number] = new_client_thread
-            self.next_client_id_number += 1
+    def accept_client(self, waiting_client):
+        """Gets a client which was admitted (see 'request_admission') and,
+        Accepts and configures the client.
+        Must be called with 'registry_lock' held."""
 
-            print(f"Request accepted for {client_address}\n")
+        self.metrics.accepted_clients += 1
+        client_connection = waiting_client.connection
+        client_interface = ClientInterface(self.next_client_id_number,\
+            client_connection, waiting_client.address)
+        self.add_client_entity(client_interface)
+        if self.wire_capture is not None: self.wire_capture.record_open(client_interface.id_no, waiting_client.address)
+        try: client_connection.send(ACCEPT_MESSAGE.encode())     # Always unframed, framing is negotiated after this
+        except: pass        # The receiving thread finds the connection lost and removes the client
 
-    def start_receiving_messages(self):
-        """Finishes configuring the client and,
+        self.start_serving_client(client_interface)
+        self.next_client_id_number += self.client_id_step
+
+        self.event_log.log("info", "accepted", client_interface.id_no, waiting_client.address)
+
+    def start_serving_client(self, client_interface):
+        """Gets the client interface of an accepted (or adopted) client and,
+        Starts its writer and the thread which receives its messages."""
+
+        client_interface.start_writer()
+        new_client_thread = Thread(target = self.start_receiving_messages, args = (client_interface,))
+        self.client_threads[client_interface.id_no] = new_client_thread    # Before it can finish and unlist itself
+        new_client_thread.start()
+
+    def start_receiving_messages(self, client_interface):
+        """Gets the client interface,
+        Finishes configuring the client (unless it was configured before it was handed over) and,
         Start waiting for messages from the client.
+        Every message is processed inside the handoff gate (see 'get_client_message_wait').
         Note: This function is a blocking call."""
 
-        client_id_number, client_interface = self.live_connections[-1]
-        client_name = client_interface.connection.recv(MAX_MESSAGE_LENGTH).decode()
-        client_interface.set_client_name(client_name)
-        client_list = self.fetch_client_list()
-        client_list_update_message = CLIENT_LIST_UPDATE_MESSAGE_PREFIX + str(client_list)
-        self.broadcast(client_list_update_message)
+        if not(client_interface.configured):
+            client_name = client_interface.get_client_message_wait()
+            if client_name: self.configure_client_name(client_interface, client_name)
+            elif client_name is not None:
+                self.process_client_message(client_interface, client_name)     # Lost (or reaped) in the handshake
+            if client_name is not None: self.handoff_gate.leave()
+        if client_interface.configured and not(client_interface.closed): self.receive_client_messages(client_interface)
+        self.client_threads.pop(client_interface.id_no, None)
+
+    def receive_client_messages(self, client_interface):
+        """Gets the client interface of a configured client and,
+        Processes the messages from the client until its session is over (or the client is handed over).
+        Note: This function is a blocking call."""
 
         while 1:
-            try: client_message = client_interface.get_client_message_wait()
-            except: client_message = ""
-            if not(client_message):
+            client_message = client_interface.get_client_message_wait()
+            if client_message is None: break       # Handed over to a new server process
+            client_message, delay = self.police_client_message(client_interface, client_message)
+            if delay:       # Throttles the client (its data waits in the socket meanwhile)
+                client_interface.held_message = client_message     # Handed over with the rest if it comes to that
+                self.handoff_gate.leave()
+                time.sleep(delay)
+                if not(self.handoff_gate.enter()): break
+                client_interface.held_message = None
+            if client_message is None:
+                self.handoff_gate.leave()
+                if client_interface.finishing:      # Disconnected for flooding, closes once the notice is sent
+                    client_interface.wait_finished(SHUTDOWN_FLUSH_TIMEOUT)
+                    client_interface.close()
+                    break
+                continue
+            session_on = self.metrics.profiler.run(self.process_client_message, client_interface, client_message)
+            self.handoff_gate.leave()
+            if not(session_on): break
+
+    def configure_client_name(self, client_interface, client_name):
+        """Gets the client interface and the name sent by the client (or its request to resume its session) and,
+        Binds the name and makes the client join the default room,
+        Or if it resumes its session, the room it was in, sending the chat messages it had missed
+            (in place of the recent messages, see 'client_sessions.py').
+        The clients which asked for the sessions are then told their session token."""
+
+        resume_request = None
+        if client_interface.resumable and client_name.startswith(RESUME_MESSAGE_PREFIX):
+            try:
+                resume_request = json.loads(client_name[len(RESUME_MESSAGE_PREFIX):])
+                token, last_sequence_number = str(resume_request["token"]), int(resume_request["last_seq"])
+                client_name = str(resume_request["name"])
+            except (ValueError, TypeError, KeyError): resume_request = None
+
+        with self.registry_lock:
+            session = self.session_registry.resume(token) if resume_request is not None else None
+            room_name, complete = DEFAULT_ROOM_NAME, True
+            if session is not None:
+                client_name, room_name = session
+                client_interface.session_token = token
+                for other_client_interface in list(self.live_connections.values()):
+                    if other_client_interface.session_token == token and other_client_interface is not client_interface:
+                        # The old connection of the client, which the server had not found lost yet.
+                        other_client_interface.session_token = None
+                        self.remove_client_entity(other_client_interface.id_no)
+                        other_client_interface.abort()
+            self.set_client_name(client_interface, client_name)
+            # The full client list of the room must be the first message the client gets after the handshake.
+            self.join_room(client_interface, room_name, replay_history = session is None)
+            if session is not None:
+                # Under 'registry_lock' (like the sequencing and broadcasting of the chat messages), so that
+                # Each message comes exactly once, either from here or as a member of the room.
+                missed_messages, complete = self.session_registry.fetch_missed(room_name, last_sequence_number)
+                if missed_messages: client_interface.send_data(b"".join(client_interface.encode_message(\
+                    f"{SEQUENCED_MESSAGE_PREFIX}{sequence_number}:{message}") for sequence_number, message in missed_messages))
+            client_interface.configured = True
+            if client_interface.resumable:
+                if session is None: client_interface.session_token = self.session_registry.open(client_name, room_name)
+                client_interface.send_message(SESSION_MESSAGE_PREFIX + json.dumps({"token": client_interface.session_token,\
+                    "seq": self.session_registry.last_sequence_number, "resumed": session is not None,\
+                    "complete": complete}))
+
+    def set_client_name(self, client_interface, client_name):
+        """Gets the client interface and its name and,
+        Binds the name to the client and indexes the client by it (see 'find_clients').
+        Names are not unique, the clients sharing a name are all indexed under it."""
+
+        with self.registry_lock:
+            self.unindex_client_name(client_interface)
+            client_interface.set_client_name(client_name)
+            self.client_names.setdefault(client_name, {})[client_interface.id_no] = client_interface
+
+    def unindex_client_name(self, client_interface):
+        """Gets the client interface and removes it from the index of the client names."""
+
+        with self.registry_lock:
+            namesakes = self.client_names.get(client_interface.name)
+            if namesakes is None or namesakes.get(client_interface.id_no) is not client_interface: return
+            del namesakes[client_interface.id_no]
+            if not(namesakes): del self.client_names[client_interface.name]
+
+    def find_clients(self, recipient):
+        """Gets a client id number (int) or name (str) and,
+        Returns the matching clients (of all the workers) as a list of tuples like this:
+            (<Client-id-no.>, <Client-name>, <ClientInterface (None if the client is at another worker)>)
+        The names are looked up in the indexes, so it costs the same however many clients there are."""
+
+        with self.registry_lock:
+            if isinstance(recipient, int):
+                client_interface = self.live_connections.get(recipient)
+                if client_interface is not None and client_interface.configured:
+                    return [(recipient, client_interface.name, client_interface)]
+                if recipient in self.remote_clients: return [(recipient, self.remote_clients[recipient], None)]
+                return []
+            matching_clients = [(client_id_number, recipient, client_interface) for client_id_number, client_interface\
+                in self.client_names.get(recipient, {}).items() if client_interface.configured]
+            matching_clients.extend((client_id_number, recipient, None)\
+                for client_id_number in self.remote_client_names.get(recipient, ()))
+            return matching_clients
+
+    def send_direct_message(self, client_interface, message_content):
+        """Gets the client interface of the sender and the content of its direct message and,
+        Sends the message to the client it is addressed to (by id number, or by name if no one else has it)
+            and back to the sender,
+        Or tells the sender why it could not be sent (the unframed clients can neither send nor get them)."""
+
+        try:
+            direct_request = json.loads(message_content)
+            recipient, message = direct_request["to"], str(direct_request["message"])
+            if not(client_interface.framed) or isinstance(recipient, bool) or not(isinstance(recipient, (int, str))):
+                raise TypeError(recipient)
+        except (ValueError, TypeError, KeyError):
+            self.metrics.junk_messages += 1
+            self.event_log.log("warning", "junk", client_interface.id_no, client_interface.address)
+            return
+
+        self.metrics.direct_messages += 1
+        with self.registry_lock:
+            matching_clients = self.find_clients(recipient)
+            if not(matching_clients): failure_reason = "unknown"
+            elif len(matching_clients) > 1: failure_reason = "ambiguous"
+            elif matching_clients[0][2] is not None and not(matching_clients[0][2].framed): failure_reason = "unsupported"
+            else: failure_reason = None
+            if failure_reason is not None:
+                client_interface.send_message(DIRECT_FAILED_MESSAGE_PREFIX + json.dumps({"to": recipient,\
+                    "reason": failure_reason}))
+                return
+            recipient_id_number, recipient_name, recipient_interface = matching_clients[0]
+            direct_message = DIRECT_MESSAGE_PREFIX + json.dumps({"from": [client_interface.id_no, client_interface.name],\
+                "to": [recipient_id_number, recipient_name], "message": message})
+            if recipient_interface is not None: recipient_interface.send_message(direct_message)
+            else: self.cluster_bus.publish({"type": "direct", "id": recipient_id_number, "message": direct_message})
+            if recipient_interface is not client_interface: client_interface.send_message(direct_message)
+
+    def search_chat(self, client_interface, message_content):
+        """Gets the client interface and the content of its search request (see 'chat_search.py') and,
+        Queues the search, whose results are sent to the client from the indexing thread once it is run."""
+
+        try:
+            search_request = json.loads(message_content)
+            if not(client_interface.framed) or not(isinstance(search_request, dict)): raise TypeError(search_request)
+        except (ValueError, TypeError):
+            self.metrics.junk_messages += 1
+            self.event_log.log("warning", "junk", client_interface.id_no, client_interface.address)
+            return
+
+        self.metrics.searches += 1
+        search_request.setdefault("room", client_interface.room)
+        reply_function = lambda search_results: self.run_in_server_context(client_interface.send_message,\
+            SEARCH_RESULTS_MESSAGE_PREFIX + json.dumps(search_results))
+        if self.chat_search is None: reply_function({"query": search_request.get("query"), "error": "disabled"})
+        elif not(self.chat_search.search(search_request, reply_function)):
+            reply_function({"query": search_request.get("query"), "error": "busy"})
+
+    def offer_file(self, client_interface, file_offer):
+        """Gets the client interface and the file it offers (see 'file_transfers.py') and,
+        Accepts the upload (or its resumption) and tells the other members of the room about the file,
+        Or rejects it.
+        Raises ValueError, TypeError or KeyError if the offer is invalid."""
+
+        reference = file_offer.get("ref")
+        if self.file_transfers is None: transfer, reason = None, "disabled"
+        elif "id" in file_offer:
+            transfer, reason = self.file_transfers.get(str(file_offer["id"])), "unknown"
+            if transfer is not None and transfer.key != file_offer.get("key"): transfer = None
+        else:
+            file_name = os.path.basename(str(file_offer["name"]).replace("\\", "/"))[:MAX_FILE_NAME_LENGTH]
+            if not(file_name): raise ValueError("No file name")
+            transfer, reason = self.file_transfers.offer(file_name, int(file_offer["size"]), client_interface.name,\
+                client_interface.room)
+            if transfer is not None:
+                self.metrics.file_transfers += 1
+                with self.registry_lock:
+                    file_offered_message = FILE_OFFERED_MESSAGE_PREFIX + json.dumps({"id": transfer.id,\
+                        "from": client_interface.name, "name": transfer.file_name, "size": transfer.size})
+                    self.broadcast(file_offered_message, [other_client_interface for other_client_interface\
+                        in list(self.rooms.get(client_interface.room, {}).values())\
+                        if other_client_interface.framed and other_client_interface is not client_interface])
+        if transfer is None:
+            client_interface.send_message(FILE_REJECTED_MESSAGE_PREFIX + json.dumps({"ref": reference, "reason": reason}))
+            return
+        transfer.uploader_id = client_interface.id_no
+        client_interface.send_message(FILE_ACCEPTED_MESSAGE_PREFIX + json.dumps({"ref": reference, "id": transfer.id,\
+            "key": transfer.key, "offset": transfer.received}))
+        if transfer.completed_at is not None: self.complete_file_upload(client_interface, transfer)
+
+    def receive_file_chunk(self, client_interface, message_content):
+        """Gets the client interface of the uploader and the content of a chunk of its file and,
+        Spools the chunk to be relayed to the recipients (the chunks which are not the next one are ignored)."""
+
+        transfer_id, separator, chunk = message_content.partition(":")
+        offset, separator, data = chunk.partition(":")
+        transfer = self.file_transfers.get(transfer_id) if self.file_transfers is not None else None
+        # A chunk sent before a resumption (or after the file was forgotten) is not worth reporting.
+        if transfer is None or transfer.uploader_id != client_interface.id_no or transfer.completed_at is not None: return
+        try: offset, data_length = int(offset), len(base64.b64decode(data, validate = True))
+        except (ValueError, binascii.Error):
+            self.metrics.junk_messages += 1
+            self.event_log.log("warning", "junk", client_interface.id_no, client_interface.address)
+            return
+        # The frame is spooled exactly as the recipients get it.
+        if not(transfer.append_chunk(offset, data_length, encode_frame(FILE_CHUNK_MESSAGE_PREFIX + message_content))): return
+        self.metrics.file_bytes_received += data_length
+        if transfer.completed_at is not None: self.complete_file_upload(client_interface, transfer)
+
+    def complete_file_upload(self, client_interface, transfer):
+        """Gets the client interface of the uploader and its file which was received completely and,
+        Tells the uploader the stats of the upload."""
+
+        file_stats = transfer.fetch_stats()
+        client_interface.send_message(FILE_COMPLETE_MESSAGE_PREFIX + json.dumps({"id": transfer.id,\
+            "size": transfer.size, "seconds": file_stats["seconds"], "bytes_per_second": file_stats["bytes_per_second"]}))
+        self.event_log.log("info", "file_shared", client_interface.id_no, client_interface.address, file_id = transfer.id,\
+            file_name = transfer.file_name, size = transfer.size, seconds = file_stats["seconds"],\
+            bytes_per_second = file_stats["bytes_per_second"])
+
+    def request_file(self, client_interface, transfer_id, offset):
+        """Gets the client interface, the id of a file the client asks for and the bytes of it which it already has and,
+        Starts relaying the rest of the file to the client (see 'file_transfers.py')."""
+
+        transfer = self.file_transfers.get(transfer_id) if self.file_transfers is not None else None
+        if transfer is None:
+            client_interface.send_message(FILE_REJECTED_MESSAGE_PREFIX + json.dumps({"id": transfer_id, "reason": "unknown"}))
+            return
+        client_interface.start_download(FileDownload(transfer, transfer.find_spool_offset(offset)))
+
+    def join_room(self, client_interface, room_name, replay_history = True):
+        """Gets the client interface and a room name and,
+        Moves the client from its current room (if any) to the given room (creates it if needed),
+        Sends the full client list of the room (and the list of rooms and the recent messages) to the client and,
+        Broadcasts the change in the client list to the other members of the room."""
+
+        with self.registry_lock:
+            if client_interface.room is not None: self.leave_room(client_interface)
+            self.rooms.setdefault(room_name, {})[client_interface.id_no] = client_interface
+            client_interface.room = room_name
+            client_interface.send_message(self.fetch_client_list_message(client_interface.framed, room_name))
+            if client_interface.framed:
+                client_interface.send_message(self.fetch_room_list_message())
+                if replay_history: self.replay_chat_history(client_interface, room_name)
+            self.broadcast_client_list_change(client_interface.id_no, client_interface.name, room_name, joined = True)
+            if self.cluster_bus is not None: self.cluster_bus.publish({"type": "join", "room": room_name,\
+                "id": client_interface.id_no, "name": client_interface.name})
+
+    def replay_chat_history(self, client_interface, room_name):
+        """Gets the client interface and a room name and,
+        Sends the recent chat messages of the room to the client in one bulk write."""
+
+        if self.chat_history is None: return
+        recent_messages = self.chat_history.fetch_recent(room_name, CHAT_HISTORY_REPLAY_COUNT)
+        if recent_messages: client_interface.send_data(b"".join(client_interface.encode_message(message)\
+            for message in recent_messages))
+
+    def leave_room(self, client_interface):
+        """Gets the client interface and,
+        Removes the client from its current room (deletes the room if it becomes empty) and,
+        Broadcasts the change in the client list to the other members of the room."""
+
+        with self.registry_lock:
+            room_name = client_interface.room
+            room_members = self.rooms.get(room_name)
+            client_interface.room = None
+            if room_members is None or room_members.pop(client_interface.id_no, None) is None: return
+            if not(room_members) and room_name != DEFAULT_ROOM_NAME: del self.rooms[room_name]
+            self.broadcast_client_list_change(client_interface.id_no, client_interface.name, room_name, joined = False)
+            if self.cluster_bus is not None:
+                self.cluster_bus.publish({"type": "leave", "room": room_name, "id": client_interface.id_no})
+
+    def police_client_message(self, client_interface, client_message):
+        """Gets the client interface and a message received from it and,
+        Applies the flood control to it (see 'flood_control.py' and FLOOD_POLICY).
+        Returns a tuple like this: (<Message to be processed (None to skip it)>, <Seconds to delay it>)
+        A client disconnected for flooding is removed here and its connection is closed once the notice is sent.
+        Common for all the server engines."""
+
+        delay = self.flood_control.check(client_interface, client_message)
+        if not(delay): return client_message, 0
+        policy = self.flood_control.policy
+        self.metrics.flood_limit_hits[policy] += 1
+        client_interface.flood_limit_hits += 1
+        now = time.monotonic()
+        if client_interface.framed and (now - client_interface.rate_limit_notified_at >= RATE_LIMIT_NOTICE_INTERVAL\
+            or policy == "disconnect"):
+            client_interface.rate_limit_notified_at = now
+            client_interface.send_message(RATE_LIMITED_MESSAGE_PREFIX + json.dumps({"action": policy,\
+                "retry_after": round(delay, 3)}))
+        if policy == "throttle": return client_message, delay
+        if policy == "disconnect":
+            if client_interface.session_token is not None: self.session_registry.end(client_interface.session_token)
+            self.remove_client_entity(client_interface.id_no)
+            client_interface.finish()
+            self.event_log.log("warning", "flooding", client_interface.id_no, client_interface.address,\
+                name = client_interface.name)
+        return None, 0
+
+    def process_client_message(self, client_interface, client_message):
+        """Gets the client interface and a message received from it and does the needful.
+        Common for all the server engines.
+        Returns False if the client session is over, else True."""
+
+        if not(client_message):
+            client_address = client_interface.address
+            client_id_number = client_interface.id_no
+            # The client can resume its session if it reconnects soon (see 'client_sessions.py').
+            if client_interface.session_token is not None:
+                self.session_registry.suspend(client_interface.session_token, client_interface.room)
+            self.remove_client_entity(client_id_number)
+            client_interface.close()
+            # The code comes here both when the client get disconnected unexpectedly and the server shutdowns,
+            # So it is not shown on the console.
+            self.event_log.log("info", "lost", client_id_number, client_address, name = client_interface.name)
+            return False
+        # Only the first colon separates the message type, the content may have colons when framed.
+        message_type, separator, message_content = client_message.partition(":")
+        if separator:
+
+            if message_type + ":" == CHAT_MESSAGE_PREFIX:
+                self.metrics.chat_messages += 1
+                chat_message = message_type + ":" + client_interface.name + "> " + message_content
+                # Sequenced and queued under 'registry_lock', so that all the clients get the messages in the order
+                # Of their sequence numbers (see 'configure_client_name' for the resuming clients).
+                with self.registry_lock:
+                    sequence_number = self.session_registry.sequence(client_interface.room, chat_message)
+                    # Only the members of the room get the message, so the fan-out scales with the room size.
+                    room_members = list(self.rooms.get(client_interface.room, {}).values())
+                    self.broadcast(chat_message, room_members, sequence_number)
+                if self.chat_history is not None: self.chat_history.append(client_interface.room, chat_message)
+                if self.chat_search is not None: self.chat_search.append(client_interface.room, chat_message)
+                if self.cluster_bus is not None:
+                    self.cluster_bus.publish({"type": "chat", "room": client_interface.room, "message": chat_message})
+
+            elif message_type + ":" == DIRECT_MESSAGE_PREFIX: self.send_direct_message(client_interface, message_content)
+
+            elif message_type + ":" == SEARCH_MESSAGE_PREFIX: self.search_chat(client_interface, message_content)
+
+            elif message_type + ":" == FILE_CHUNK_MESSAGE_PREFIX: self.receive_file_chunk(client_interface, message_content)
+
+            elif message_type + ":" in (FILE_OFFER_MESSAGE_PREFIX, FILE_REQUEST_MESSAGE_PREFIX):
+                try:
+                    file_request = json.loads(message_content)
+                    if not(client_interface.framed) or not(isinstance(file_request, dict)): raise TypeError(file_request)
+                    if message_type + ":" == FILE_OFFER_MESSAGE_PREFIX: self.offer_file(client_interface, file_request)
+                    else: self.request_file(client_interface, str(file_request["id"]), int(file_request.get("offset", 0)))
+                except (ValueError, TypeError, KeyError):
+                    self.metrics.junk_messages += 1
+                    self.event_log.log("warning", "junk", client_interface.id_no, client_interface.address)
+
+            elif message_type + ":" in (JOIN_ROOM_MESSAGE_PREFIX, LEAVE_ROOM_MESSAGE_PREFIX):
+                room_name = message_content.strip() if message_type + ":" == JOIN_ROOM_MESSAGE_PREFIX else ""
+                if not(room_name): room_name = DEFAULT_ROOM_NAME
+                if len(room_name) > MAX_ROOM_NAME_LENGTH:
+                    self.event_log.log("warning", "room_name_too_long", client_interface.id_no, client_interface.address)
+                elif room_name != client_interface.room: self.join_room(client_interface, room_name)
+
+            elif message_type + ":" == PONG_MESSAGE_PREFIX: pass      # Only being heard from matters (see 'check_heartbeats')
+
+            elif message_type + ":" == LIST_ROOMS_MESSAGE_PREFIX:
+                if client_interface.framed: client_interface.send_message(self.fetch_room_list_message())
+
+            elif message_type + ":" == SHUTDOWN_MESSAGE_PREFIX:
                 client_address = client_interface.address
                 client_id_number = client_interface.id_no
+                if client_interface.session_token is not None:
+                    self.session_registry.end(client_interface.session_token)
                 self.remove_client_entity(client_id_number)
                 client_interface.close()
-                # The code comes here both when the client get disconnected unexpectedly and the server shutdowns.
-                #print(f"\n{client_address} got disconnected unexpectedly!\n")
-                break
-            #message_type, message_content = client_message.split(":")
-            message_list = client_message.split(":")
-            if len(message_list) == 2:
-                message_type, message_content = message_list
-
-                if message_type + ":" == CHAT_MESSAGE_PREFIX:
-                    self.broadcast(message_type + ":" + client_interface.name + "> " + message_content)
-
-                elif message_type + ":" == SHUTDOWN_MESSAGE_PREFIX:
-                    client_address = client_interface.address
-                    client_id_number = client_interface.id_no
-                    self.remove_client_entity(client_id_number)
-                    client_interface.close()
 
-                    client_list = self.fetch_client_list()
-                    client_list_update_message = CLIENT_LIST_UPDATE_MESSAGE_PREFIX + str(client_list)
-                    self.broadcast(client_list_update_message)
+                self.event_log.log("info", "left", client_id_number, client_address, name = client_interface.name)
+                return False
 
-                    print(f"\n{client_address} volunteerly got disconnected\n")
-                    break
+            else:
+                self.metrics.junk_messages += 1
+                self.event_log.log("warning", "junk", client_interface.id_no, client_interface.address)
 
-                else:
-                    client_address = client_interface.address
-                    print(f"\n{client_address} had sent some junk message... Ignored it\n")
+        else:
+            self.metrics.junk_messages += 1
+            self.event_log.log("warning", "junk", client_interface.id_no, client_interface.address)
 
-            else:
-                client_address = client_interface.address
-                print(f"\n{client_address} had sent some junk message... Ignored it\n")
+        return True
+
+    def monitor_heartbeats(self):
+        """Checks the heartbeats of the clients every 'heartbeat_check_interval' seconds until the server shuts down.
+        Note: This function is a blocking call."""
+
+        while not(self.heartbeat_stop_event.wait(self.heartbeat_check_interval)): self.check_heartbeats()
+
+    def check_heartbeats(self):
+        """Pings the clients (which asked for heartbeats) silent for 'heartbeat_interval' seconds and,
+        Reaps the ones silent for 'heartbeat_timeout' seconds, along with the clients stalled in the handshake.
+        The receiving side of a reaped client then removes it from its room like for any lost connection.
+        Also forgets the shared files which had expired (see 'file_transfers.py').
+        Common for all the server engines."""
 
-    def fetch_client_list(self):
-        """Returns the list of client names"""
+        now = time.monotonic()
+        for client_interface in list(self.live_connections.values()):
+            if client_interface.closed: continue
+            silent_for = now - client_interface.last_received_at
+            if silent_for >= self.heartbeat_timeout and (client_interface.heartbeats or not(client_interface.configured)):
+                self.metrics.reaped_clients += 1
+                self.event_log.log("warning", "unresponsive", client_interface.id_no, client_interface.address,\
+                    name = client_interface.name, silent_for = round(silent_for, 3))
+                client_interface.abort()
+            elif client_interface.heartbeats and client_interface.configured and silent_for >= self.heartbeat_interval\
+                and now - client_interface.last_pinged_at >= self.heartbeat_interval:
+                client_interface.last_pinged_at = now
+                client_interface.send_message(PING_MESSAGE_PREFIX)
+        if self.file_transfers is not None: self.file_transfers.prune_if_due(now)
+
+    def fetch_client_list(self, room_name = DEFAULT_ROOM_NAME):
+        """Returns the list of client names in the given room (including the clients of the other workers)."""
 
         client_list = []
-        for client_info in self.live_connections: client_list.append(client_info[-1].name)
+        for client_interface in list(self.rooms.get(room_name, {}).values()): client_list.append(client_interface.name)
+        client_list.extend(self.remote_rooms.get(room_name, {}).values())
         return client_list
 
-    def broadcast(self, message):
-        """Broadcasts the given string message to all the clients."""
+    def fetch_client_list_message(self, framed, room_name = DEFAULT_ROOM_NAME):
+        """Returns the message with the full client list of the given room, 
+        As a snapshot of the room name and [<Client-id-no.>, <Client-name>] pairs for the framed clients and,
+        As a list of names for the unframed (legacy) clients."""
+
+        if not(framed): return CLIENT_LIST_UPDATE_MESSAGE_PREFIX + json.dumps(self.fetch_client_list(room_name))
+        client_snapshot = []
+        for client_interface in list(self.rooms.get(room_name, {}).values()):
+            client_snapshot.append([client_interface.id_no, client_interface.name])
+        client_snapshot.extend([client_id_number, client_name]\
+            for client_id_number, client_name in list(self.remote_rooms.get(room_name, {}).items()))
+        return CLIENT_LIST_SNAPSHOT_MESSAGE_PREFIX + json.dumps({"room": room_name, "clients": client_snapshot})
+
+    def fetch_room_list_message(self):
+        """Returns the message with the list of rooms as [<Room-name>, <No.-of-members>] pairs."""
+
+        room_sizes = {room_name: len(room_members) for room_name, room_members in list(self.rooms.items())}
+        for room_name, room_members in list(self.remote_rooms.items()):
+            room_sizes[room_name] = room_sizes.get(room_name, 0) + len(room_members)
+        return ROOM_LIST_MESSAGE_PREFIX + json.dumps(sorted([room_name, size] for room_name, size in room_sizes.items()))
+
+    def broadcast_client_list_change(self, client_id_number, client_name, room_name, joined):
+        """Gets the id number and name of the client which joined or left the given room and,
+        Broadcasts the change to the other members of the room.
+        The framed clients get just the change as a delta, the unframed ones get the full client list."""
+
+        framed_clients, unframed_clients = [], []
+        for other_client_interface in list(self.rooms.get(room_name, {}).values()):
+            if other_client_interface.id_no == client_id_number or not(other_client_interface.configured): continue
+            if other_client_interface.framed: framed_clients.append(other_client_interface)
+            else: unframed_clients.append(other_client_interface)
+
+        if framed_clients:
+            if joined: client_list_delta = {"added": [[client_id_number, client_name]]}
+            else: client_list_delta = {"removed": [client_id_number]}
+            self.broadcast(CLIENT_LIST_DELTA_MESSAGE_PREFIX + json.dumps(client_list_delta), framed_clients)
+        if unframed_clients: self.broadcast(self.fetch_client_list_message(False, room_name), unframed_clients)
+
+    def broadcast(self, message, recipients = None, sequence_number = None):
+        """Broadcasts the given string message to all the clients which had completed the handshake,
+        Or only to the given recipients (client interfaces).
+        A chat message can be given its sequence number (see 'client_sessions.py').
+        Records the time taken in the fan-out histogram (and profiles the fan-out if sampled)."""
+
+        start = time.perf_counter()
+        self.metrics.profiler.run(self.fan_out, message, recipients, sequence_number)
+        self.metrics.fan_out_seconds.observe(time.perf_counter() - start)
+
+    def fan_out(self, message, recipients = None, sequence_number = None):
+        """Does the broadcast (see 'broadcast').
+        The message is encoded (and compressed) only once per wire format (unframed / framed / compressed,
+            with or without the sequence number) and,
+        The same immutable bytes are queued for all the clients."""
+
+        if recipients is None: recipients = list(self.live_connections.values())
+        encoded_messages = {}
+        for client_interface in recipients:
+            if not(client_interface.configured): continue
+            sequenced = sequence_number is not None and client_interface.resumable
+            wire_format = (client_interface.framed, client_interface.compressed, sequenced)
+            data = encoded_messages.get(wire_format)
+            if data is None: data = encoded_messages[wire_format] = client_interface.encode_message(\
+                f"{SEQUENCED_MESSAGE_PREFIX}{sequence_number}:{message}" if sequenced else message)
+            client_interface.send_data(data)
+
+    def fetch_outbound_queue_stats(self):
+        """Returns a list of tuples like this for each client:
+        (<Client-id-no.>, <Client-name>, <Queue-depth>, <Peak-queue-depth>, <Dropped-messages>)"""
+
+        queue_stats = []
+        for client_id_number, client_interface in list(self.live_connections.items()):
+            queue_stats.append((client_id_number, client_interface.name, len(client_interface.outbound_queue),\
+                client_interface.peak_queue_depth, client_interface.dropped_messages))
+        return queue_stats
+
+    def apply_cluster_event(self, event):
+        """Gets an event (dictionary) published by another worker of the cluster and,
+        Applies it to the local clients.
+        Must be called in the server context (see 'run_in_server_context')."""
+
+        with self.registry_lock:
+            if event["type"] == "chat":
+                sequence_number = self.session_registry.sequence(event["room"], event["message"])
+                self.broadcast(event["message"], list(self.rooms.get(event["room"], {}).values()), sequence_number)
+                if self.chat_history is not None: self.chat_history.remember(event["room"], event["message"])
+                if self.chat_search is not None: self.chat_search.append(event["room"], event["message"])
+
+            elif event["type"] == "direct":
+                client_interface = self.live_connections.get(event["id"])
+                if client_interface is not None and client_interface.framed: client_interface.send_message(event["message"])
+
+            elif event["type"] == "join":
+                self.remote_rooms.setdefault(event["room"], {})[event["id"]] = event["name"]
+                self.remote_clients[event["id"]] = event["name"]
+                self.remote_client_names.setdefault(event["name"], set()).add(event["id"])
+                self.broadcast_client_list_change(event["id"], event["name"], event["room"], joined = True)
+
+            elif event["type"] == "leave":
+                room_members = self.remote_rooms.get(event["room"], {})
+                client_name = room_members.pop(event["id"], None)
+                if not(room_members): self.remote_rooms.pop(event["room"], None)
+                if client_name is not None:
+                    self.remote_clients.pop(event["id"], None)
+                    namesakes = self.remote_client_names.get(client_name, set())
+                    namesakes.discard(event["id"])
+                    if not(namesakes): self.remote_client_names.pop(client_name, None)
+                    self.broadcast_client_list_change(event["id"], client_name, event["room"], joined = False)
+                self.admit_waiting_clients()        # A slot might be free in the cluster now
+
+    def run_in_server_context(self, function, *args):
+        """Runs the given function with the given arguments in the context which handles the clients.
+        For the threaded engine, it is just a call (the state is guarded by 'registry_lock')."""
+
+        function(*args)
+
+    def apply_settings(self, settings):
+        """Gets the settings (see 'server_settings.py') and applies them to this server:
+        The client limits, the heartbeats and the flood control at once (the clients waiting for a slot are admitted if the limit was raised),
+        The socket tunables and the outbound batching to the clients accepted from now on.
+        The settings which are not reloadable keep the values this server was created with.
+        Must be called in the server context (see 'run_in_server_context')."""
+
+        if self.settings is not None: settings = dict(settings, **{name: self.settings[name] for name in RESTART_SETTINGS})
+        self.settings = settings
+        self.max_clients = settings["MAX_CLIENTS"]
+        self.waiting_room_size = settings["WAITING_ROOM_SIZE"]
+        self.accept_rate_limiter.rate = settings["ACCEPT_RATE_PER_IP"]
+        self.accept_rate_limiter.burst = settings["ACCEPT_BURST_PER_IP"]
+        self.heartbeat_interval = settings["HEARTBEAT_INTERVAL"]
+        self.heartbeat_timeout = settings["HEARTBEAT_TIMEOUT"]
+        self.flood_control.enabled = settings["FLOOD_CONTROL_ENABLED"]
+        self.event_log.set_levels(settings["EVENT_LOG_LEVEL"], settings["EVENT_LOG_CONSOLE_LEVEL"])
+        self.admit_waiting_clients()
+
+    def admit_client(self):
+        """Returns True if one more client can be accepted (counting it), else False.
+        In a cluster, the limit is enforced over the clients of all the workers."""
+
+        if self.cluster_client_counts is None: return len(self.live_connections) < self.max_clients
+        with self.cluster_client_counts.get_lock():
+            if sum(self.cluster_client_counts) >= self.max_clients: return False
+            self.cluster_client_counts[self.worker_index] += 1
+        return True
+
+    def release_client(self):
+        """Uncounts a client which was accepted through 'admit_client'."""
+
+        if self.cluster_client_counts is None: return
+        with self.cluster_client_counts.get_lock(): self.cluster_client_counts[self.worker_index] -= 1
+
+    def request_admission(self, waiting_client):
+        """Gets a new client (a 'WaitingClient') and,
+        Returns True if it was accepted at once (see 'accept_client'),
+        Returns False if it was put in the waiting room (it is told its position),
+        Returns None if it has to be denied (the waiting room is full too).
+        The clients which are already waiting are always admitted first."""
+
+        with self.registry_lock:
+            self.admit_waiting_clients()
+            if not(self.waiting_clients) and self.admit_client():
+                self.accept_client(waiting_client)
+                return True
+            waiting_room_full = len(self.waiting_clients) >= self.waiting_room_size
+            if waiting_room_full and not(self.drop_gone_waiting_clients()): return None
+            self.waiting_clients.append(waiting_client)
+            self.metrics.queued_clients += 1
+            if waiting_room_full: self.send_queue_positions()       # The positions had changed
+            else: waiting_client.send_queue_position(len(self.waiting_clients))
+            return False
+
+    def admit_waiting_clients(self):
+        """Accepts the clients at the front of the waiting room while there are free slots and,
+        Tells the rest of the waiting clients their new positions (dropping the ones which had left)."""
+
+        with self.registry_lock:
+            if not(self.waiting_clients): return
+            admitted = False
+            while self.waiting_clients and self.admit_client():
+                self.accept_client(self.waiting_clients.popleft())
+                admitted = True
+            if admitted: self.send_queue_positions()
+
+    def remove_waiting_client(self, waiting_client):
+        """Gets a client which left the waiting room and,
+        Removes it and tells the rest of the waiting clients their new positions."""
 
-        for client_info in self.live_connections:
-            client_connection = client_info[-1].connection
-            client_connection.send(message.encode())
+        with self.registry_lock:
+            try: self.waiting_clients.remove(waiting_client)
+            except ValueError: return
+            self.send_queue_positions()
+
+    def drop_gone_waiting_clients(self):
+        """Drops the clients which had left the waiting room.
+        Returns True if any client was dropped, else False."""
+
+        with self.registry_lock:
+            gone_clients = [waiting_client for waiting_client in self.waiting_clients if waiting_client.is_gone()]
+            for waiting_client in gone_clients:
+                self.waiting_clients.remove(waiting_client)
+                waiting_client.close()
+            return bool(gone_clients)
+
+    def send_queue_positions(self):
+        """Drops the clients which had left the waiting room and tells the rest their positions."""
+
+        with self.registry_lock:
+            self.drop_gone_waiting_clients()
+            for position, waiting_client in enumerate(self.waiting_clients, 1):
+                waiting_client.send_queue_position(position)
+
+    def close_waiting_clients(self):
+        """Closes the connections of all the clients in the waiting room."""
+
+        with self.registry_lock:
+            while self.waiting_clients: self.waiting_clients.popleft().close()
+
+    def add_client_entity(self, client_interface):
+        """Gets the client interface and adds it to 'live_connections'."""
+
+        client_interface.metrics = self.metrics
+        client_interface.event_log = self.event_log
+        client_interface.wire_capture = self.wire_capture
+        client_interface.handoff_gate = self.handoff_gate
+        client_interface.receive_buffer_size = self.settings["RECEIVE_BUFFER_SIZE"]
+        client_interface.batch_window = self.settings["OUTBOUND_BATCH_WINDOW"]
+        client_interface.batch_size = self.settings["OUTBOUND_BATCH_SIZE"]
+        tune_connection(client_interface.connection, self.settings)
+        with self.registry_lock: self.live_connections[client_interface.id_no] = client_interface
 
     def remove_client_entity(self, client_id_number):
         """Gets the client ID number and, 
-        Removes the respective tuple from the 'live_connections' list, if exists."""
+        Removes the respective client from 'live_connections', the index of the names and its room, if exists and,
+        Broadcasts the change in the client list of the room."""
 
-        n = 0
-        for client_connection in self.live_connections:
-            if client_connection[0] == client_id_number:
-                self.live_connections.pop(n)
-                break
-            n += 1
+        with self.registry_lock:
+            client_interface = self.live_connections.pop(client_id_number, None)
+            if client_interface is not None:
+                if self.wire_capture is not None: self.wire_capture.record_close(client_id_number)
+                self.unindex_client_name(client_interface)
+                self.leave_room(client_interface)
+                self.release_client()
+                self.admit_waiting_clients()
+
+    def start_handoff_listener(self):
+        """Starts waiting for a new server process to take over this one (see 'server_handoff.py'), if enabled."""
+
+        if self.handoff_path is None or not(hasattr(socket, "send_fds")): return
+        try: self.handoff_listener = HandoffListener(self, self.handoff_path)
+        except OSError as error: print(f"\nCould not wait for a takeover at {self.handoff_path}: {error}\n")
+
+    def hand_over(self, handoff_connection):
+        """Gets the connection of a new server process (see 'server_handoff.py') and,
+        Stops accepting, receiving, processing and sending (letting the work in progress finish) and,
+        Hands over the listening socket and the clients to the new server process.
+        The server must not be used after this (the process is meant to exit, without closing the connections).
+        Note: This function is a blocking call."""
+
+        self.heartbeat_stop_event.set()
+        if self.heartbeat_thread is not None: self.heartbeat_thread.join()
+        deadline = time.monotonic() + HANDOFF_DRAIN_TIMEOUT
+        self.handoff_gate.begin(HANDOFF_DRAIN_TIMEOUT)
+        client_interfaces = list(self.live_connections.values())
+        for client_interface in client_interfaces: client_interface.stop_writer()
+        for client_interface in client_interfaces: client_interface.wait_finished(max(0, deadline - time.monotonic()))
+        # A writer still blocked in sending (to a client which does not read) cannot be handed over consistently.
+        self.send_handover(handoff_connection, self.server_socket.fileno(), [client_interface\
+            for client_interface in client_interfaces if not(client_interface.writer_thread.is_alive())])
+
+    def send_handover(self, handoff_connection, listening_fd, client_interfaces):
+        """Gets the connection of the new server process, the file descriptor of the listening socket and
+            the client interfaces of the clients (which are neither processing nor sending anything) and,
+        Sends them (along with the clients in the waiting room) to the new server process and,
+        Closes the chat history and the metrics endpoint (the new server process opens them again).
+        Common for all the server engines."""
+
+        send_record(handoff_connection, {"type": "server", "next_client_id_number": self.next_client_id_number,\
+            "sessions": self.session_registry.fetch_state(), "file_transfers": self.file_transfers.fetch_state()\
+            if self.file_transfers is not None else None}, listening_fd)
+        handed_over = 0
+        for client_interface in client_interfaces:
+            if client_interface.closed or client_interface.finishing: continue
+            if self.live_connections.get(client_interface.id_no) is not client_interface: continue     # Left meanwhile
+            send_record(handoff_connection, capture_client(client_interface), client_interface.connection.fileno())
+            handed_over += 1
+        for waiting_client in list(self.waiting_clients):
+            if waiting_client.is_gone(): continue
+            send_record(handoff_connection, {"type": "waiting", "address": list(waiting_client.address)},\
+                waiting_client.connection.fileno())
+        if self.chat_history is not None: self.chat_history.close()
+        if self.wire_capture is not None: self.wire_capture.close()
+        if self.metrics_endpoint is not None: self.metrics_endpoint.close()
+        send_record(handoff_connection, {"type": "done"})
+        print(f"Handed over {handed_over} of {len(self.live_connections)} clients and\
+ {len(self.waiting_clients)} waiting clients\n")
+        self.event_log.log("info", "handed_over", clients = handed_over, waiting_clients = len(self.waiting_clients))
+        self.event_log.close()
+
+    def adopt_clients(self, handed_clients):
+        """Gets the clients handed over by the previous server process (see 'take_over_server'),
+            as a list of tuples like this: (<Record>, <Socket>) and,
+        Carries on serving them where the previous server process left off (nothing is broadcast,
+            as nothing had changed for the clients)."""
+
+        client_interfaces = []
+        with self.registry_lock:
+            for record, connection in handed_clients:
+                connection.setblocking(True)
+                client_address = tuple(record["address"])
+                if record["type"] == "waiting":
+                    self.waiting_clients.append(WaitingClient(connection, client_address))
+                    continue
+                client_interfaces.append(ClientInterface(record["id"], connection, client_address))
+                self.adopt_client(client_interfaces[-1], record)
+            # All the clients must be back in their rooms before any message is processed (and broadcast).
+            for client_interface in client_interfaces: self.start_serving_client(client_interface)
+
+    def adopt_client(self, client_interface, record):
+        """Gets the client interface of a client handed over by the previous server process and its record and,
+        Restores the client (with its room, pending messages and unsent data) in this server.
+        Common for all the server engines."""
+
+        restore_client(client_interface, record)
+        self.add_client_entity(client_interface)
+        if self.wire_capture is not None:
+            self.wire_capture.record_open(client_interface.id_no, client_interface.address, adopted = True)
+        if client_interface.configured: self.set_client_name(client_interface, client_interface.name)
+        for transfer_id, spool_offset in record.get("downloads", []):     # Not in the records of the older versions
+            transfer = self.file_transfers.get(transfer_id) if self.file_transfers is not None else None
+            if transfer is not None: client_interface.start_download(FileDownload(transfer, spool_offset))
+        if client_interface.room is not None:
+            self.rooms.setdefault(client_interface.room, {})[client_interface.id_no] = client_interface
 
     def shutdown(self):
         """Shuts down the server.
@@ -161,54 +990,504 @@ STATE: Idle\n")
         Terminates all the client threads."""
 
         print("\n\nShutting down...\n")
+        self.heartbeat_stop_event.set()
+        if self.handoff_listener is not None: self.handoff_listener.close()
+        self.close_waiting_clients()
         self.broadcast(SHUTDOWN_MESSAGE_PREFIX + "ServerTerminated")
-        for client_info in self.live_connections: client_info[-1].close()
-        for client_thread in self.client_threads.values(): client_thread.join()
+        client_interfaces = list(self.live_connections.values())
+        # The pending messages (including the above) are flushed by the writers before closing.
+        for client_interface in client_interfaces: client_interface.finish()
+        shutdown_deadline = time.monotonic() + SHUTDOWN_FLUSH_TIMEOUT
+        for client_interface in client_interfaces:
+            client_interface.wait_finished(max(0, shutdown_deadline - time.monotonic()))
+            client_interface.close()
+        for client_thread in list(self.client_threads.values()): client_thread.join()
+        if self.file_transfers is not None: self.file_transfers.close()
+        if self.chat_search is not None: self.chat_search.close()
+        if self.chat_history is not None: self.chat_history.close()
+        if self.wire_capture is not None: self.wire_capture.close()
+        if self.metrics_endpoint is not None: self.metrics_endpoint.close()
+        self.event_log.log("info", "stopped")
+        self.event_log.close()
+        # Closing alone does not wake up a blocked 'accept' on every platform.
+        try: self.server_socket.shutdown(socket.SHUT_RDWR)
+        except: pass
         self.server_socket.close()
 
 
+class WaitingClient(object):
+    """A new client which waits in the waiting room for a free slot.
+    Client connection and client address must be given at the time of instance creation.
+    The client sends nothing until it is accepted, so any data or end of stream means that it had left."""
+
+    def __init__(self, connection, address):
+        self.connection = connection
+        self.address = address
+        self.gone = False
+
+    def send_queue_position(self, position):
+        """Gets the position of the client in the waiting room and tells it to the client (unframed)."""
+
+        if self.gone: return
+        try: self.connection.send(f"{QUEUE_POSITION_MESSAGE_PREFIX}{position}\n".encode())
+        except: self.gone = True
+
+    def is_gone(self):
+        """Returns True if the client had left the waiting room, else False (without blocking)."""
+
+        if self.gone: return True
+        try:
+            self.connection.setblocking(False)
+            self.gone = not(self.connection.recv(1, socket.MSG_PEEK))
+        except BlockingIOError: pass
+        except: self.gone = True
+        finally:
+            try: self.connection.setblocking(True)
+            except: pass
+        return self.gone
+
+    def close(self):
+        """Closes the connection of the client (which was not accepted)."""
+
+        self.gone = True
+        try: self.connection.close()
+        except: pass
+
+
+class AcceptRateLimiter(object):
+    """Limits the rate at which the connections are accepted from each address, with a token bucket per address.
+    An address can connect 'burst' times at once and then 'rate' times a second.
+    The buckets which had refilled are pruned when too many addresses are tracked."""
+
+    def __init__(self, rate = ACCEPT_RATE_PER_IP, burst = ACCEPT_BURST_PER_IP, max_addresses = ACCEPT_RATE_MAX_ADDRESSES):
+        self.rate = rate
+        self.burst = burst
+        self.max_addresses = max_addresses
+        self.buckets = {}       # Will contain items like this: <Address>: [<Tokens>, <Last-update-time>]
+
+    def allow(self, address):
+        """Gets the address of a new connection and,
+        Returns True if the connection can be accepted (taking a token), else False."""
+
+        if not(self.rate) or address in ACCEPT_RATE_EXEMPT_ADDRESSES: return True
+        now = time.monotonic()
+        bucket = self.buckets.get(address)
+        if bucket is None:
+            if len(self.buckets) >= self.max_addresses: self.prune(now)
+            bucket = self.buckets[address] = [self.burst, now]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def prune(self, now):
+        """Forgets the addresses whose buckets had refilled (or the oldest one, if none had)."""
+
+        for address, (tokens, last_update_time) in list(self.buckets.items()):
+            if tokens + (now - last_update_time) * self.rate >= self.burst: del self.buckets[address]
+        if len(self.buckets) >= self.max_addresses: del self.buckets[next(iter(self.buckets))]
+
+
 class ClientInterface(object):
     """Contains all the required methods for communication with the client.
     Instance of this class must be created for each client.
     Client id number, Socket connection and client address 
-        must be given at the time of instance creation."""
+        must be given at the time of instance creation.
+    The messages to the client are queued in a bounded outbound queue which is drained by its own writer,
+        so that a slow client never blocks the others (see OUTBOUND_OVERFLOW_POLICY)."""
 
     def __init__(self, id_number, connection, address):
         self.id_no = id_number
         self.connection = connection
         self.address = address
+        self.name = ""
+        self.configured = False     # Set once the handshake is completed (the client gets broadcasts after it)
+        self.room = None
         self.closed = False
 
+        self.framed = None          # Decided by the first data received from the client
+        self.compressed = False     # Set if the client asked for compression along with the framing
+        self.heartbeats = False     # Set if the client asked for heartbeats along with the framing
+        self.resumable = False      # Set if the client asked for the sessions along with the framing
+        self.session_token = None   # Set when the client joins (see 'client_sessions.py')
+        self.last_received_at = time.monotonic()
+        self.last_pinged_at = 0
+        self.flood_buckets = None   # Set by the flood control (see 'flood_control.py')
+        self.flood_limit_hits = 0
+        self.rate_limit_notified_at = 0
+        self.frame_decoder = FrameDecoder()
+        self.receive_buffer_size = RECEIVE_BUFFER_SIZE
+        self.pending_messages = deque()
+        self.held_message = None    # A message delayed by the flood control (see 'receive_client_messages')
+        self.handoff_gate = None    # Set by the server (see 'server_handoff.py')
+        self.handing_off = False    # When set, the writer stops and the connection is never closed by this process
+        self.downloads = deque()    # The files being relayed to the client, in order (see 'file_transfers.py')
+
+        self.outbound_queue = deque()
+        self.outbound_queue_size = OUTBOUND_QUEUE_SIZE
+        self.overflow_policy = OUTBOUND_OVERFLOW_POLICY
+        self.outbound_ready = Condition()
+        self.finishing = False      # When set, the writer closes the connection once the queue is empty
+        self.peak_queue_depth = 0
+        self.dropped_messages = 0
+        self.batch_window = OUTBOUND_BATCH_WINDOW
+        self.batch_size = OUTBOUND_BATCH_SIZE
+        self.write_calls = 0
+        self.writer_thread = None
+
+        self.metrics = None         # Set by the server (see 'ServerMetrics')
+        self.event_log = None       # Set by the server (see 'event_log.py')
+        self.wire_capture = None    # Set by the server if capturing (see 'wire_capture.py')
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.oldest_queued_at = 0   # When the oldest message in the outbound queue was queued (for the send latency)
+
     def set_client_name(self, name):
         """Creates a binding for client name"""
 
         self.name = name
 
+    def feed_received_data(self, data):
+        """Gets the bytes received from the client and,
+        Queues the complete messages in 'pending_messages'.
+        The first data received decides whether the client uses framing (see FRAMING_REQUEST).
+        Raises ValueError if the client sends an invalid frame."""
+
+        self.bytes_received += len(data)
+        self.last_received_at = time.monotonic()
+        if self.wire_capture is not None: self.wire_capture.record_data(self.id_no, data)
+        if self.framed is None:
+            self.framed = data.startswith(FRAMING_REQUEST.encode())
+            if self.framed: data = data[len(FRAMING_REQUEST):]
+            if self.framed and data.startswith(COMPRESSION_REQUEST.encode()):
+                data = data[len(COMPRESSION_REQUEST):]
+                self.compressed = COMPRESSION_ENABLED
+            if self.framed and data.startswith(HEARTBEAT_REQUEST.encode()):
+                data = data[len(HEARTBEAT_REQUEST):]
+                self.heartbeats = True
+            if self.framed and data.startswith(SESSION_REQUEST.encode()):
+                data = data[len(SESSION_REQUEST):]
+                self.resumable = True
+        if self.framed: self.pending_messages.extend(self.frame_decoder.feed(data))
+        else: self.pending_messages.append(data.decode(errors = "replace"))
+
+    def encode_message(self, message):
+        """Gets a string message and returns the bytes to be sent to this client."""
+
+        if self.framed: return encode_frame(message, self.compressed)
+        # Unframed clients cannot handle colons in the message content.
+        message_type, separator, message_content = message.partition(":")
+        return (message_type + separator + message_content.replace(":", "{colon}")).encode()
+
     def get_client_message_wait(self):
         """Waits for message from the client and,
-        Returns the message.
+        Returns the message (Returns empty string if the connection is lost),
+        Returns None if the server is handing over its clients (the socket is not read from then on).
+        The message returned is counted as being processed by the handoff gate, until it is left.
         Note: This function is a blocking call."""
 
-        try: return self.connection.recv(MAX_MESSAGE_LENGTH).decode()
-        except: return ""
+        handoff_gate = self.handoff_gate
+        while 1:
+            with handoff_gate.condition:
+                if handoff_gate.handing_off: return None
+                if self.pending_messages:
+                    handoff_gate.active += 1
+                    return self.pending_messages.popleft()
+            handoff_gate.wait_readable(self.connection)
+            if not(handoff_gate.enter()): return None
+            try:
+                data = self.connection.recv(self.receive_buffer_size if self.framed else MAX_MESSAGE_LENGTH)
+                if data: self.feed_received_data(data)
+            except: data = b""
+            if not(data): return ""
+            handoff_gate.leave()
+
+    def start_download(self, file_download):
+        """Gets a file download and relays it to the client after the files being relayed before it
+            (in place of the earlier download of the same file, if any, as the client resumes it)."""
+
+        for other_file_download in list(self.downloads):
+            if other_file_download.transfer is file_download.transfer: self.end_download(other_file_download)
+        self.downloads.append(file_download)
+        file_download.transfer.downloaders.add(self)
+        self.wake_writer()
+
+    def end_download(self, file_download):
+        """Gets a file download and stops relaying it."""
+
+        try: self.downloads.remove(file_download)
+        except ValueError: return
+        if file_download.is_done(): file_download.transfer.downloads_completed += 1
+        file_download.transfer.downloaders.discard(self)
+        file_download.close()
+
+    def fetch_file_slice(self):
+        """Returns a tuple like this for the first file download which has frames to be relayed:
+            (<FileDownload>, <Length of the frames>),
+        Returns None if there is none (and always while finishing, the files are not flushed when shutting down)."""
+
+        if self.finishing: return None
+        for file_download in list(self.downloads):
+            slice_length = file_download.fetch_slice_length()
+            if slice_length: return file_download, slice_length
+            if file_download.is_done(): self.end_download(file_download)
+        return None
+
+    def send_file_slice(self, file_download, slice_length):
+        """Gets a file download and the length of its frames to be relayed and,
+        Sends them to the client straight from the spool ('sendfile', zero-copy where the platform has it).
+        Note: This function is a blocking call."""
+
+        self.write_calls += 1
+        self.connection.sendfile(file_download.open_spool(), file_download.spool_offset, slice_length)
+        self.record_file_sent(file_download, slice_length)
+
+    def record_file_sent(self, file_download, slice_length):
+        """Counts the bytes of the file slice which was sent and ends the download if it is done."""
+
+        file_download.advance(slice_length)
+        self.bytes_sent += slice_length
+        if self.metrics is not None: self.metrics.file_bytes_relayed += slice_length
+        if file_download.is_done(): self.end_download(file_download)
+
+    def wake_writer(self):
+        """Wakes up the writer, as there may be more to send (a chunk was spooled for a file being relayed)."""
+
+        with self.outbound_ready: self.outbound_ready.notify()
+
+    def start_writer(self):
+        """Creates and starts the thread which sends the queued messages to the client."""
+
+        self.writer_thread = Thread(target = self.write_outbound_messages)
+        self.writer_thread.start()
+
+    def queue_outbound(self, data):
+        """Gets the bytes to be sent and appends them to the outbound queue, 
+        Applying the overflow policy if the queue is full.
+        Returns False if the client has to be disconnected as a slow consumer, else True."""
+
+        if len(self.outbound_queue) >= self.outbound_queue_size:
+            self.dropped_messages += 1
+            if self.overflow_policy == "disconnect": return False
+            self.outbound_queue.popleft()
+        if not(self.outbound_queue): self.oldest_queued_at = time.perf_counter()
+        self.outbound_queue.append(data)
+        if len(self.outbound_queue) > self.peak_queue_depth: self.peak_queue_depth = len(self.outbound_queue)
+        return True
+
+    def send_message(self, message):
+        """Queues the given string message to be sent to the client.
+        This is a non-blocking call."""
+
+        self.send_data(self.encode_message(message))
+
+    def send_data(self, data):
+        """Queues the given encoded message (bytes) to be sent to the client.
+        This is a non-blocking call."""
+
+        if self.closed or self.finishing: return
+        with self.outbound_ready:
+            queued = self.queue_outbound(data)
+            self.outbound_ready.notify()
+        if not(queued):
+            if self.event_log is not None: self.event_log.log("warning", "too_slow", self.id_no, self.address,\
+                name = self.name, queue_depth = len(self.outbound_queue))
+            self.close()
+
+    def write_outbound_messages(self):
+        """Sends the queued messages to the client until the connection is closed.
+        The messages queued within the batching window are coalesced into a single vectored write
+            (except for the unframed clients, which take every 'recv' as one message).
+        The files being relayed are sent only while no message is queued, a slice at a time.
+        Note: This function is a blocking call."""
+
+        while 1:
+            with self.outbound_ready:
+                file_slice = None
+                while not(self.outbound_queue or self.closed or self.finishing or self.handing_off):
+                    file_slice = self.fetch_file_slice()
+                    if file_slice is not None: break
+                    self.outbound_ready.wait()
+                if self.handing_off: return     # The queued messages are handed over
+                if self.closed or not(self.outbound_queue or file_slice): break
+            if not(self.outbound_queue) and file_slice is not None:
+                try: self.send_file_slice(*file_slice)
+                except: break
+                continue
+            batch_size = self.batch_size if self.framed else 1
+            if self.framed and self.batch_window and len(self.outbound_queue) < batch_size and not(self.finishing):
+                time.sleep(self.batch_window)       # Lets more messages gather for this write
+            with self.outbound_ready:
+                if self.handing_off: return
+                batch = [self.outbound_queue.popleft() for n in range(min(len(self.outbound_queue), batch_size))]
+                batch_queued_at = self.pop_queued_at()
+            try: self.send_buffers(batch)
+            except: break
+            self.record_sent(batch, batch_queued_at)
+        self.close()
+
+    def pop_queued_at(self):
+        """Returns when the oldest message of the batch just taken from the outbound queue was queued.
+        The messages left in the queue are taken as queued now (an approximation, so that the queue needs no timestamps)."""
+
+        batch_queued_at = self.oldest_queued_at
+        self.oldest_queued_at = time.perf_counter()
+        return batch_queued_at
+
+    def record_sent(self, batch, batch_queued_at):
+        """Counts the bytes of the batch which was written and records its send latency."""
+
+        self.bytes_sent += sum(len(data) for data in batch)
+        if self.metrics is not None: self.metrics.send_latency_seconds.observe(time.perf_counter() - batch_queued_at)
+
+    def send_buffers(self, buffers):
+        """Gets a list of bytes and sends all of them to the client, 
+        With as few system calls as possible ('sendmsg' where available).
+        Note: This function is a blocking call."""
+
+        if not(hasattr(self.connection, "sendmsg")):
+            self.write_calls += 1
+            self.connection.sendall(b"".join(buffers))
+            return
+        buffers = [memoryview(buffer) for buffer in buffers]
+        while buffers:
+            self.write_calls += 1
+            sent = self.connection.sendmsg(buffers)
+            # Drops the buffers which were sent completely and slices the one which was sent partially.
+            n = 0
+            while n < len(buffers) and sent >= len(buffers[n]):
+                sent -= len(buffers[n])
+                n += 1
+            buffers = buffers[n:]
+            if buffers and sent: buffers[0] = buffers[0][sent:]
+
+    def finish(self):
+        """Lets the writer send the queued messages and then close the connection.
+        This is a non-blocking call."""
+
+        with self.outbound_ready:
+            self.finishing = True
+            self.outbound_ready.notify()
+
+    def stop_writer(self):
+        """Stops the writer once the batch being sent (if any) is sent, as the client is being handed over
+            to a new server process (see 'server_handoff.py'). The connection is never closed by this process after this.
+        This is a non-blocking call."""
+
+        with self.outbound_ready:
+            self.handing_off = True
+            self.outbound_ready.notify()
+
+    def wait_finished(self, timeout):
+        """Waits (for the given timeout in seconds at the max.) until the writer had finished."""
+
+        if self.writer_thread is not None: self.writer_thread.join(timeout)
 
     def close(self):
         """Closes the client connection."""
 
-        if not(self.closed):
-            self.connection.close()
+        with self.outbound_ready:
+            if self.closed or self.handing_off: return     # A client being handed over keeps its connection
             self.closed = True
+            self.outbound_ready.notify()
+        for file_download in list(self.downloads): self.end_download(file_download)
+        # Shutting down first wakes up the threads blocked in 'recv' and 'sendall' on this connection.
+        try: self.connection.shutdown(socket.SHUT_RDWR)
+        except: pass
+        self.connection.close()
+
+    def abort(self):
+        """Closes the client connection at once, even if the peer is gone (the unsent data is discarded)."""
 
+        self.close()
 
-#def ...(...):
+
+def tune_connection(connection, settings):
+    """Gets a client connection and the settings (see 'server_settings.py') and applies the socket tunables to it:
+    The sizes of the kernel buffers (unless 0), TCP_NODELAY (set either way, as asyncio sets it by itself) and
+    The TCP keepalive (see TCP_KEEPALIVE_IDLE), so that the kernel drops the connections whose peer had vanished,
+        even for the clients without heartbeats."""
+
+    try:
+        if settings["SOCKET_SEND_BUFFER_SIZE"]:
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, settings["SOCKET_SEND_BUFFER_SIZE"])
+        if settings["SOCKET_RECEIVE_BUFFER_SIZE"]:
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, settings["SOCKET_RECEIVE_BUFFER_SIZE"])
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(settings["TCP_NODELAY_ENABLED"]))
+        if not(settings["TCP_KEEPALIVE_IDLE"]): return
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):     # The fine tuning is not available on every platform
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, settings["TCP_KEEPALIVE_IDLE"])
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, settings["TCP_KEEPALIVE_INTERVAL"])
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, settings["TCP_KEEPALIVE_PROBES"])
+    except OSError: pass        # Not a TCP connection (like the socket pairs of 'fanout_benchmark.py')
+
+
+def create_server(engine, server_port, host = None, **options):
+    """Gets the name of the server engine ("threaded" or "asyncio"), the port and optionally the host and,
+    Returns an instance of the respective server class.
+    The other options are passed on to the server class."""
+
+    if engine == "threaded": return GroupChatServer(server_port, host, **options)
+    elif engine == "asyncio":
+        from async_group_chat_server import AsyncGroupChatServer
+        return AsyncGroupChatServer(server_port, host, **options)
+    else: raise ValueError(f"Unknown server engine: {engine}")
+
+
+def take_over_server(engine, handoff_path = HANDOFF_SOCKET_PATH, **options):
+    """Gets the name of the server engine and the Unix socket path where the running server waits to be taken over and,
+    Takes over the listening socket and the clients of the running server (which exits then, see 'server_handoff.py').
+    Returns an instance of the respective server class, serving the clients taken over (call 'start_listening' on it).
+    The other options are passed on to the server class.
+    Note: This function is a blocking call."""
+
+    server_record, listening_socket, handed_clients = receive_handover(handoff_path)
+    server = create_server(engine, 0, None, handoff_path = handoff_path, listening_socket = listening_socket, **options)
+    server.next_client_id_number = server_record["next_client_id_number"]
+    # The older versions (taken over when upgrading) did not hand over everything.
+    if server_record.get("sessions") is not None: server.session_registry.restore_state(server_record["sessions"])
+    if server.file_transfers is not None and server_record.get("file_transfers") is not None:
+        server.file_transfers.restore_state(server_record["file_transfers"])
+    server.adopt_clients(handed_clients)
+    print(f"Took over {len(handed_clients)} connections from the previous server process\n")
+    server.event_log.log("info", "took_over", connections = len(handed_clients))
+    return server
 
 
 if __name__ == '__main__':
-    server = GroupChatServer(SERVER_LISTENING_PORT)
+    # The server engine can be given as the first command line argument (threaded / asyncio),
+    # 'takeover' as the second one replaces the server running on this computer without disconnecting its clients.
+    # The settings can be given as options (see 'server_settings.py'), run with '--help' to see them.
+    argument_parser = argparse.ArgumentParser(description = "The server of the Group Chat application.")
+    argument_parser.add_argument("engine", nargs = "?", choices = ("threaded", "asyncio"),\
+        help = "the server engine (overrides --server-engine)")
+    argument_parser.add_argument("action", nargs = "?", choices = ("takeover",),\
+        help = "takes over the server running on this computer without disconnecting its clients")
+    add_setting_arguments(argument_parser)
+    arguments = argument_parser.parse_args()
+    try:
+        argument_settings = fetch_argument_settings(arguments)
+        if arguments.engine is not None: argument_settings["SERVER_ENGINE"] = arguments.engine
+        settings = load_settings(argument_settings, arguments.settings_file)
+    except ValueError as error: argument_parser.error(str(error))
+
+    if arguments.action == "takeover": server = take_over_server(settings["SERVER_ENGINE"], settings = settings,\
+        metrics_port = settings["METRICS_PORT"], event_log_path = settings["EVENT_LOG_PATH"])
+    else: server = create_server(settings["SERVER_ENGINE"], settings["SERVER_LISTENING_PORT"],\
+        handoff_path = HANDOFF_SOCKET_PATH, settings = settings, metrics_port = settings["METRICS_PORT"],\
+        event_log_path = settings["EVENT_LOG_PATH"])
     server_main_thread = Thread(target = server.start_listening)
     server_main_thread.start()
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda *args: reload_settings(server, argument_settings, arguments.settings_file))
     try:
-        while 1: input("Press Ctrl-C to stop the server\n")
+        while 1:
+            command = input("Press Ctrl-C to stop the server (or type 'reload' to reload the settings)\n")
+            if command.strip() == "reload": reload_settings(server, argument_settings, arguments.settings_file)
     except (KeyboardInterrupt, SystemExit):
         server.shutdown()
         server_main_thread.join()
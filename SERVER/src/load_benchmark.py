@@ -0,0 +1,218 @@
+"""
+--------------
+LOAD BENCHMARK
+--------------
+
+* Headless load generator for the Group Chat server (no PyQt5 needed).
+* Opens the given no. of simulated clients which speak the real protocol (the 'RequestAccepted' handshake,
+    the name, the client list, 'Chat:' and 'ShutDown:') and makes them chat at the given rate and message size.
+* Reports the connect rate, the chat messages delivered per second, the lost deliveries and
+    the p50/p99/p999 end-to-end fan-out latency (from sending a message to each client receiving it).
+* Either starts a server of the given engine on loopback (the default) or loads an already running server.
+* Usage: python load_benchmark.py [<no. of clients> [<messages per second> [<message size> [<duration in seconds>
+    [<engine or port of a running server>]]]]]
+
+"""
+
+
+import asyncio
+import contextlib
+import io
+import os
+import resource
+import sys
+import time
+from threading import Thread
+
+from server_config import *
+from group_chat_server import create_server
+from message_framing import FrameDecoder, encode_frame
+
+
+BENCHMARK_HOST                      = "127.0.0.1"
+DEFAULT_CLIENTS                     = 1000
+DEFAULT_MESSAGE_RATE                = 100           # Chat messages sent per second (by all the clients together)
+DEFAULT_MESSAGE_SIZE                = 100           # Characters of chat content per message
+DEFAULT_DURATION                    = 10.0          # Seconds
+CONNECT_CONCURRENCY                 = 100
+DRAIN_TIMEOUT                       = 5.0           # Seconds to wait for the last deliveries after sending stops
+PACING_INTERVAL                     = 0.001         # Seconds between the checks of the sender
+
+
+class LoadClient(object):
+    """A simulated client.
+    Keeps reading from the server in the background and records the fan-out latency of every chat message
+    (of this run only, told from the replayed history and the earlier runs of this process by 'run_token')."""
+
+    def __init__(self, client_number, reader, writer, latencies, run_token):
+        self.client_number = client_number
+        self.run_token = run_token
+        self.name = f"bot{client_number}"
+        self.reader = reader
+        self.writer = writer
+        self.latencies = latencies
+        self.frame_decoder = FrameDecoder()
+        self.ready = asyncio.get_running_loop().create_future()    # Resolved when the client list arrives
+        self.read_task = asyncio.ensure_future(self.read_forever())
+
+    async def read_forever(self):
+        """Reads and decodes everything the server sends (so that the server never blocks on us)."""
+
+        while 1:
+            try: data = await self.reader.read(RECEIVE_BUFFER_SIZE)
+            except: data = b""
+            if not(data): break
+            received_time = time.perf_counter()
+            for message in self.frame_decoder.feed(data):
+                if message.startswith(CHAT_MESSAGE_PREFIX):
+                    # "Chat:<name>> <run token> <send time> <padding>"
+                    stamp = message.partition("> ")[2].split(" ", 2)
+                    if len(stamp) < 2 or stamp[0] != self.run_token: continue
+                    try: self.latencies.append(received_time - float(stamp[1]))
+                    except ValueError: pass
+                elif message.startswith((CLIENT_LIST_SNAPSHOT_MESSAGE_PREFIX, CLIENT_LIST_UPDATE_MESSAGE_PREFIX)):
+                    if not(self.ready.done()): self.ready.set_result(received_time)
+                elif message.startswith(SHUTDOWN_MESSAGE_PREFIX): break
+        if not(self.ready.done()): self.ready.set_exception(ConnectionResetError(f"{self.name} got disconnected"))
+
+    def send_chat_message(self, message_size):
+        """Sends a chat message (of the given size) stamped with the current time."""
+
+        content = f"{self.run_token} {time.perf_counter():.9f} "
+        self.writer.write(encode_frame(CHAT_MESSAGE_PREFIX + content + "x" * max(0, message_size - len(content))))
+
+    async def close(self):
+        self.writer.write(encode_frame(SHUTDOWN_MESSAGE_PREFIX + "ClientTerminated"))
+        try: await self.writer.drain()
+        except: pass
+        self.writer.close()
+        self.read_task.cancel()
+
+
+async def open_load_client(port, client_number, latencies, run_token):
+    """Connects with the server and does the handshake.
+    Returns a 'LoadClient' instance (or None if the server denied the request)."""
+
+    reader, writer = await asyncio.open_connection(BENCHMARK_HOST, port)
+    permission = (await reader.read(MAX_MESSAGE_LENGTH)).decode()
+    if not(ACCEPT_MESSAGE in permission):
+        writer.close()
+        return None
+    load_client = LoadClient(client_number, reader, writer, latencies, run_token)
+    writer.write(FRAMING_REQUEST.encode() + encode_frame(load_client.name))
+    await load_client.ready
+    return load_client
+
+
+async def run_load(port, no_of_clients, message_rate, message_size, duration):
+    """Connects the clients, makes them chat for the given duration and,
+    Returns the results as a dictionary."""
+
+    latencies = []
+    run_token = os.urandom(4).hex()
+    semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect(client_number):
+        async with semaphore: return await open_load_client(port, client_number, latencies, run_token)
+
+    start = time.perf_counter()
+    load_clients = await asyncio.gather(*[connect(client_number) for client_number in range(no_of_clients)])
+    connect_time = time.perf_counter() - start
+    denied = load_clients.count(None)
+    load_clients = [load_client for load_client in load_clients if load_client is not None]
+    if not(load_clients): raise ConnectionRefusedError("The server denied all the clients")
+    await asyncio.sleep(0.5)        # Lets the client list updates of the last joins settle
+
+    # The sender catches up in bursts, as sleeping is much coarser than the gap between the messages at high rates.
+    sent = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        due = int((time.perf_counter() - start) * message_rate)
+        while sent < due:
+            load_clients[sent % len(load_clients)].send_chat_message(message_size)
+            sent += 1
+        await asyncio.sleep(PACING_INTERVAL)
+    expected_deliveries = sent * len(load_clients)
+    drain_deadline = time.perf_counter() + DRAIN_TIMEOUT
+    while len(latencies) < expected_deliveries and time.perf_counter() < drain_deadline: await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    for load_client in load_clients: await load_client.close()
+    await asyncio.sleep(0.2)
+
+    latencies.sort()
+    return {
+        "connected": len(load_clients),
+        "denied": denied,
+        "connects_per_second": len(load_clients) / connect_time,
+        "sent": sent,
+        "delivered": len(latencies),
+        "lost": expected_deliveries - len(latencies),
+        "deliveries_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "p999_ms": percentile(latencies, 0.999) * 1000,
+        "max_ms": percentile(latencies, 1.0) * 1000,
+    }
+
+
+def percentile(sorted_values, fraction):
+    """Returns the given percentile (as a fraction) of the sorted values (0 if there are no values)."""
+
+    if not(sorted_values): return 0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def raise_open_files_limit(no_of_clients):
+    """Raises the limit of open files of this process (if needed and allowed) for the given no. of clients.
+    A local server needs a socket for each client too."""
+
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = 2 * no_of_clients + 100
+    if soft_limit != resource.RLIM_INFINITY and soft_limit < needed:
+        new_limit = needed if hard_limit == resource.RLIM_INFINITY else min(needed, hard_limit)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (new_limit, hard_limit))
+
+
+def benchmark(target, no_of_clients, message_rate, message_size, duration, settings = None):
+    """Benchmarks the server (a local one of the given engine, or a running one on the given port) and,
+    Returns the results as a dictionary.
+    The settings of a local server can be given (see 'server_settings.py', the client limit is raised anyway)."""
+
+    raise_open_files_limit(no_of_clients)
+    if target.isdigit(): return asyncio.run(run_load(int(target), no_of_clients, message_rate, message_size, duration))
+
+    # The server logs every connection to the console, which is not what is measured here.
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = create_server(target, 0, BENCHMARK_HOST, settings = settings, event_log_path = None)
+        server.max_clients = no_of_clients
+        server.flood_control.enabled = False      # The clients send faster than the chat rate limits
+        server_thread = Thread(target = server.start_listening)
+        server_thread.start()
+        server.listening_event.wait()
+        try: results = asyncio.run(run_load(server.server_port, no_of_clients, message_rate, message_size, duration))
+        finally:
+            server.shutdown()
+            server_thread.join()
+    return results
+
+
+if __name__ == '__main__':
+    no_of_clients = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CLIENTS
+    message_rate = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_MESSAGE_RATE
+    message_size = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_MESSAGE_SIZE
+    duration = float(sys.argv[4]) if len(sys.argv) > 4 else DEFAULT_DURATION
+    target = sys.argv[5] if len(sys.argv) > 5 else SERVER_ENGINE
+
+    print(f"\nServer: {target}    Clients: {no_of_clients}    Rate: {message_rate:g} messages/s\
+    Size: {message_size}    Duration: {duration:g} s\n")
+    results = benchmark(target, no_of_clients, message_rate, message_size, duration)
+    print(f"Connected:      {results['connected']} ({results['denied']} denied)")
+    print(f"Connect rate:   {results['connects_per_second']:.1f} connects/s")
+    print(f"Messages:       {results['sent']} sent, {results['delivered']} delivered, {results['lost']} lost")
+    print(f"Throughput:     {results['deliveries_per_second']:.0f} deliveries/s")
+    print(f"Fan-out (ms):   p50 {results['p50_ms']:.2f}    p99 {results['p99_ms']:.2f}\
+    p999 {results['p999_ms']:.2f}    max {results['max_ms']:.2f}\n")
+
+
+# END
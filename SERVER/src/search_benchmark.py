@@ -0,0 +1,126 @@
+"""
+----------------
+SEARCH BENCHMARK
+----------------
+
+* Micro-benchmark of the chat search index (no network involved), see 'chat_search.py'.
+* Fills an index with synthetic chat messages (a Zipf-like vocabulary, many senders and rooms) and reports
+    the insert cost per message (including the evictions once the index is full), the cost added to
+    the broadcast path (queueing a message for the indexing thread) and the memory of the index.
+* Then reports the query latency (p50/p99/max) of typical searches: a rare word, a common word, two words,
+    a sender, a word from a sender, a word in the last minute and a word which is in no message.
+* Usage: python search_benchmark.py [<no. of messages> [<no. of queries per kind>]]
+
+"""
+
+
+import random
+import resource
+import sys
+import time
+#from ... import ...
+
+from server_config import *
+from chat_search import InvertedIndex, ChatSearch
+
+
+DEFAULT_MESSAGES                    = 1000000
+DEFAULT_QUERIES                     = 200
+VOCABULARY_SIZE                     = 50000
+WORDS_PER_MESSAGE                   = (3, 25)       # The range
+NO_OF_SENDERS                       = 500
+NO_OF_ROOMS                         = 20
+MESSAGES_PER_SECOND                 = 100           # Of the synthetic timestamps
+
+
+def measure_memory():
+    """Returns the resident memory of this process in MB (Linux only, else the peak)."""
+
+    try:
+        with open("/proc/self/statm") as statm: return int(statm.read().split()[1]) * resource.getpagesize() / 2 ** 20
+    except (OSError, ValueError, IndexError): return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def generate_messages(no_of_messages):
+    """Yields tuples like this: (<Timestamp>, <Room-name>, <Sender-name>, <Message>)
+    The words are drawn with a Zipf-like distribution (a few are very common, most are rare)."""
+
+    random.seed(1)
+    vocabulary = [f"w{n}" for n in range(VOCABULARY_SIZE)]
+    weights = [1 / (n + 1) for n in range(VOCABULARY_SIZE)]
+    senders = [f"user{n:03d}" for n in range(NO_OF_SENDERS)]
+    rooms = [DEFAULT_ROOM_NAME] + [f"room-{n}" for n in range(1, NO_OF_ROOMS)]
+    start = time.time() - no_of_messages / MESSAGES_PER_SECOND
+    batch = []
+    for message_number in range(no_of_messages):
+        if not(batch): batch = random.choices(vocabulary, weights, k = 100000)
+        no_of_words = random.randint(*WORDS_PER_MESSAGE)
+        words, batch = batch[:no_of_words], batch[no_of_words:]
+        yield start + message_number / MESSAGES_PER_SECOND, random.choice(rooms), random.choice(senders), " ".join(words)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+if __name__ == '__main__':
+    no_of_messages = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_MESSAGES
+    no_of_queries = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_QUERIES
+
+    print(f"\nMessages: {no_of_messages}    Index size: {SEARCH_INDEX_MAX_MESSAGES} (and {no_of_messages} for the queries)\
+    Vocabulary: {VOCABULARY_SIZE}\n")
+    messages = list(generate_messages(no_of_messages))
+
+    # Inserting into an index smaller than the messages includes the cost of evicting.
+    # The memory does not count the message strings, which are shared with the generated messages.
+    for max_messages in sorted({min(SEARCH_INDEX_MAX_MESSAGES, no_of_messages), no_of_messages}):
+        memory_before = measure_memory()
+        index = InvertedIndex(max_messages)
+        start = time.perf_counter()
+        for timestamp, room_name, sender_name, message in messages: index.add(timestamp, room_name, sender_name, message)
+        insert_time = (time.perf_counter() - start) / no_of_messages
+        print(f"Index of {max_messages:>8}: insert {insert_time * 1e6:6.1f} us/message    {len(index.postings)} tokens\
+    {measure_memory() - memory_before:7.1f} MB")
+        if max_messages < no_of_messages: del index
+
+    # The broadcast path only queues the message (the indexing thread is kept busy meanwhile).
+    chat_search = ChatSearch(max_messages = 1000)
+    chat_messages = [CHAT_MESSAGE_PREFIX + sender_name + "> " + message for timestamp, room_name, sender_name, message\
+        in messages[:SEARCH_QUEUE_SIZE]]
+    start = time.perf_counter()
+    for chat_message in chat_messages: chat_search.append(DEFAULT_ROOM_NAME, chat_message)
+    append_time = (time.perf_counter() - start) / len(chat_messages)
+    chat_search.close()
+    print(f"Broadcast path: {append_time * 1e6:.2f} us/message ({chat_search.dropped_messages} not indexed)\n")
+
+    random.seed(2)
+    last_timestamp = messages[-1][0]
+    query_kinds = (
+        ("rare word", lambda: {"words": f"w{random.randrange(20000, VOCABULARY_SIZE)}"}),
+        ("common word", lambda: {"words": f"w{random.randrange(10)}"}),
+        ("two words", lambda: {"words": f"w{random.randrange(100)} w{random.randrange(100, 2000)}"}),
+        ("sender", lambda: {"sender_name": f"user{random.randrange(NO_OF_SENDERS):03d}"}),
+        ("word from sender", lambda: {"words": f"w{random.randrange(100, 1000)}",\
+            "sender_name": f"user{random.randrange(NO_OF_SENDERS):03d}"}),
+        ("word in a room", lambda: {"words": f"w{random.randrange(100, 1000)}", "room_name": DEFAULT_ROOM_NAME}),
+        ("word, last minute", lambda: {"words": f"w{random.randrange(100, 1000)}", "since": last_timestamp - 60}),
+        ("no match", lambda: {"words": "w1 nothing"}),
+    )
+    print(f"{'Query':<20}{'p50 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}{'Results':>9}{'Truncated':>11}")
+    for description, make_query in query_kinds:
+        latencies, no_of_results, no_of_truncated = [], 0, 0
+        for query_number in range(no_of_queries):
+            query = make_query()
+            start = time.perf_counter()
+            matching_ids, truncated = index.search(**query)
+            results = [index.fetch_message(message_id) for message_id in matching_ids]
+            latencies.append(time.perf_counter() - start)
+            no_of_results += len(results)
+            no_of_truncated += truncated
+        latencies.sort()
+        print(f"{description:<20}{percentile(latencies, 0.5) * 1e3:>10.3f}{percentile(latencies, 0.99) * 1e3:>10.3f}\
+{latencies[-1] * 1e3:>10.3f}{no_of_results / no_of_queries:>9.1f}{no_of_truncated:>11}")
+    print()
+
+
+# END
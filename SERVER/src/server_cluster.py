@@ -0,0 +1,270 @@
+"""
+--------------
+SERVER CLUSTER
+--------------
+
+* Multi-core mode of the Group Chat server: A supervisor process forks N worker processes,
+    each running a complete server (of the given engine) on the same listening port via SO_REUSEPORT,
+    so that the kernel spreads the incoming connections over the workers (and so over the CPU cores).
+* The workers exchange the chat messages and the room membership changes over a local bus:
+    Every worker is connected with the supervisor by a Unix domain socket pair and
+    the supervisor relays the events (length-prefixed JSON, see 'message_framing.py') of a worker to all the others.
+* The global MAX_CLIENTS limit is enforced over all the workers through a shared-memory array of client counts.
+* A dead worker is removed from the rooms of the others and restarted.
+* Each worker keeps its own chat history log (in a 'worker-<no.>' sub-directory of CHAT_HISTORY_DIRECTORY).
+* Each worker serves its own metrics, on METRICS_PORT + <worker no.>.
+* The workers run with the settings of the settings file and the environment (see 'server_settings.py').
+* Usage: python server_cluster.py [<no. of workers> [<engine> [<port> [<max. no. of clients>]]]]
+
+Note: Linux (or any platform with 'os.fork' and SO_REUSEPORT) only.
+
+"""
+
+
+import json
+import multiprocessing
+import os
+import queue
+import selectors
+import signal
+import socket
+import sys
+import time
+from threading import Thread
+#from ... import ...
+
+from server_config import *
+from message_framing import FrameDecoder, encode_frame
+from group_chat_server import create_server
+from event_log import fetch_worker_log_path
+from server_settings import load_settings
+
+
+class ClusterBus(object):
+    """The end of the bus in a worker process.
+    The events are published through a queue drained by a writer thread, so that publishing never blocks.
+    The socket connected with the supervisor must be given when instance of the class is created."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.publish_queue = queue.Queue()
+        self.writer_thread = Thread(target = self.write_events)
+        self.writer_thread.start()
+
+    def publish(self, event):
+        """Gets an event (dictionary) and queues it to be sent to the other workers."""
+
+        self.publish_queue.put(event)
+
+    def write_events(self):
+        """Sends the queued events to the supervisor until 'close' is called.
+        Note: This function is a blocking call."""
+
+        while 1:
+            event = self.publish_queue.get()
+            if event is None: break
+            try: self.connection.sendall(encode_frame(json.dumps(event, ensure_ascii = False)))
+            except OSError: break
+
+    def read_events(self, server):
+        """Receives the events of the other workers and applies them to the given server.
+        Shuts down the server when the supervisor is gone.
+        Note: This function is a blocking call."""
+
+        server.listening_event.wait()      # The events can be applied only once the server is running
+        frame_decoder = FrameDecoder(CLUSTER_BUS_MAX_EVENT_LENGTH)
+        while 1:
+            try: data = self.connection.recv(RECEIVE_BUFFER_SIZE)
+            except OSError: data = b""
+            if not(data): break
+            for event in frame_decoder.feed(data): server.run_in_server_context(server.apply_cluster_event, json.loads(event))
+        server.shutdown()
+
+    def close(self):
+        """Sends the queued events and closes the connection with the supervisor."""
+
+        self.publish_queue.put(None)
+        self.writer_thread.join()
+        self.connection.close()
+
+
+class ClusterSupervisor(object):
+    """Forks and supervises the worker processes and relays the events between them.
+    The no. of workers, the port and optionally the host, the server engine, the max. no. of clients
+        and the settings of the workers (see 'server_settings.py') must be given when instance of the class is created."""
+
+    def __init__(self, no_of_workers, server_port, host = None, engine = SERVER_ENGINE, max_clients = MAX_CLIENTS,\
+        settings = None):
+        self.no_of_workers = no_of_workers
+        self.host = host if host is not None else socket.gethostname()
+        self.engine = engine
+        self.max_clients = max_clients
+        self.settings = settings
+
+        # Holds the port (without listening on it), so that the workers can bind to it even if 0 was given.
+        self.port_socket = socket.socket()
+        self.port_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.port_socket.bind((self.host, server_port))
+        self.server_port = self.port_socket.getsockname()[1]
+
+        self.client_counts = multiprocessing.Array("i", no_of_workers)     # No. of clients of each worker
+        self.worker_pids = {}           # Will contain items like this: <Worker-no.>: <Process-id>
+        self.bus_connections = {}       # Will contain items like this: <Worker-no.>: <Socket>
+        self.frame_decoders = {}
+        self.memberships = {}           # Will contain items like this: <Worker-no.>: {<Client-id-no.>: [<Room>, <Name>]}
+        self.selector = selectors.DefaultSelector()
+        self.respawn_deadlines = {}     # Will contain items like this: <Worker-no.>: <Time to restart the dead worker at>
+        self.stopping = False
+
+    def start(self):
+        """Starts the workers and relays the events between them until interrupted.
+        Note: This function is a blocking call."""
+
+        print(f"\nCluster of {self.no_of_workers} '{self.engine}' workers on {self.host}:{self.server_port}\n")
+        signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+        try:
+            for worker_index in range(self.no_of_workers): self.start_worker(worker_index)
+            self.relay_events()
+        except (KeyboardInterrupt, SystemExit): pass
+        finally: self.stop()
+
+    def start_worker(self, worker_index):
+        """Forks the worker of the given no. and tells it about the clients of the other workers."""
+
+        supervisor_side, worker_side = socket.socketpair(socket.AF_UNIX)
+        worker_pid = os.fork()
+        if worker_pid == 0:
+            supervisor_side.close()
+            for bus_connection in self.bus_connections.values(): bus_connection.close()
+            self.port_socket.close()
+            try: run_worker(worker_index, self.no_of_workers, worker_side, self.client_counts,\
+                self.server_port, self.host, self.engine, self.max_clients, self.settings)
+            except BaseException as error: print(f"\nWorker {worker_index} failed: {error!r}\n")
+            os._exit(0)         # Never returns into the code of the supervisor
+
+        worker_side.close()
+        self.worker_pids[worker_index] = worker_pid
+        self.bus_connections[worker_index] = supervisor_side
+        self.frame_decoders[worker_index] = FrameDecoder(CLUSTER_BUS_MAX_EVENT_LENGTH)
+        self.memberships[worker_index] = {}
+        self.selector.register(supervisor_side, selectors.EVENT_READ, worker_index)
+        for other_index, members in list(self.memberships.items()):
+            for client_id_number, (room_name, client_name) in list(members.items()):
+                self.send_event(worker_index, {"type": "join", "room": room_name, "id": client_id_number, "name": client_name})
+
+    def relay_events(self):
+        """Relays the events of every worker to all the other workers.
+        The dead workers are restarted after CLUSTER_RESPAWN_DELAY, while the events of the others are still relayed.
+        Note: This function is a blocking call."""
+
+        while 1:
+            timeout = None
+            if self.respawn_deadlines: timeout = max(0, min(self.respawn_deadlines.values()) - time.monotonic())
+            for key, events in self.selector.select(timeout):
+                worker_index = key.data
+                try: data = key.fileobj.recv(RECEIVE_BUFFER_SIZE)
+                except OSError: data = b""
+                if not(data):
+                    self.remove_worker(worker_index)
+                    self.respawn_deadlines[worker_index] = time.monotonic() + CLUSTER_RESPAWN_DELAY
+                    continue
+                for event in self.frame_decoders[worker_index].feed(data):
+                    self.track_membership(worker_index, json.loads(event))
+                    self.forward_event(worker_index, encode_frame(event))
+            for worker_index, respawn_deadline in list(self.respawn_deadlines.items()):
+                if respawn_deadline > time.monotonic(): continue
+                del self.respawn_deadlines[worker_index]
+                self.start_worker(worker_index)
+
+    def track_membership(self, worker_index, event):
+        """Keeps track of the room of every client, so that the clients of a dead worker can be removed."""
+
+        if event["type"] == "join": self.memberships[worker_index][event["id"]] = [event["room"], event["name"]]
+        elif event["type"] == "leave": self.memberships[worker_index].pop(event["id"], None)
+
+    def forward_event(self, source_index, event_frame):
+        """Sends the given event (frame) to all the workers except the source."""
+
+        for worker_index, bus_connection in list(self.bus_connections.items()):
+            if worker_index == source_index: continue
+            try: bus_connection.sendall(event_frame)
+            except OSError: pass        # The worker is dead, noticed when reading from it
+
+    def send_event(self, worker_index, event):
+        """Sends the given event (dictionary) to the given worker."""
+
+        try: self.bus_connections[worker_index].sendall(encode_frame(json.dumps(event, ensure_ascii = False)))
+        except OSError: pass
+
+    def remove_worker(self, worker_index):
+        """Reaps the dead worker of the given no. and,
+        Removes its clients from the rooms of the other workers and from the global client count."""
+
+        bus_connection = self.bus_connections.pop(worker_index)
+        self.selector.unregister(bus_connection)
+        bus_connection.close()
+        try: os.waitpid(self.worker_pids.pop(worker_index), 0)
+        except ChildProcessError: pass
+        print(f"\nWorker {worker_index} stopped, restarting it...\n")
+
+        for client_id_number, (room_name, client_name) in self.memberships.pop(worker_index).items():
+            self.forward_event(worker_index, encode_frame(json.dumps({"type": "leave", "room": room_name,\
+                "id": client_id_number}, ensure_ascii = False)))
+        with self.client_counts.get_lock(): self.client_counts[worker_index] = 0
+
+    def stop(self):
+        """Stops all the workers (closing the bus makes them shut down) and waits for them."""
+
+        if self.stopping: return
+        self.stopping = True
+        print("\n\nStopping the workers...\n")
+        for bus_connection in self.bus_connections.values(): bus_connection.close()
+        for worker_pid in self.worker_pids.values():
+            try: os.waitpid(worker_pid, 0)
+            except ChildProcessError: pass
+        self.selector.close()
+        self.port_socket.close()
+
+
+def run_worker(worker_index, no_of_workers, bus_connection, client_counts, server_port, host, engine, max_clients,\
+    settings = None):
+    """Runs a server as the worker of the given no. (in the forked process) until the bus is closed.
+    The settings default to those of the settings file and the environment (see 'server_settings.py').
+    Note: This function is a blocking call."""
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)       # The supervisor stops the workers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if settings is None: settings = load_settings()
+    settings = dict(settings, WIRE_CAPTURE_PATH = fetch_worker_log_path(settings["WIRE_CAPTURE_PATH"], worker_index))
+    server = create_server(engine, server_port, host, reuse_port = True,\
+        chat_history_directory = os.path.join(CHAT_HISTORY_DIRECTORY, f"worker-{worker_index}"),\
+        event_log_path = fetch_worker_log_path(settings["EVENT_LOG_PATH"], worker_index),\
+        settings = settings,\
+        metrics_port = METRICS_PORT + worker_index if METRICS_PORT is not None else None)
+    server.max_clients = max_clients
+    server.worker_index = worker_index
+    server.next_client_id_number = worker_index + 1    # The client id numbers are unique over the cluster
+    server.client_id_step = no_of_workers
+    server.cluster_client_counts = client_counts
+    server.cluster_bus = ClusterBus(bus_connection)
+    bus_thread = Thread(target = server.cluster_bus.read_events, args = (server,))
+    bus_thread.start()
+    server.start_listening()
+    bus_thread.join()
+    server.cluster_bus.close()
+
+
+if __name__ == '__main__':
+    no_of_workers = int(sys.argv[1]) if len(sys.argv) > 1 else CLUSTER_WORKERS
+    server_engine = sys.argv[2] if len(sys.argv) > 2 else SERVER_ENGINE
+    server_port = int(sys.argv[3]) if len(sys.argv) > 3 else SERVER_LISTENING_PORT
+    max_clients = int(sys.argv[4]) if len(sys.argv) > 4 else MAX_CLIENTS
+
+    try: settings = load_settings()
+    except ValueError as error: raise SystemExit(f"\nInvalid settings: {error}\n")
+    cluster_supervisor = ClusterSupervisor(no_of_workers, server_port, engine = server_engine, max_clients = max_clients,\
+        settings = settings)
+    cluster_supervisor.start()
+
+
+# END
@@ -20,15 +20,162 @@ SERVER CONFIG
 # Server Core Configurations
 VERSION                             = "1.0.4"
 MAX_CLIENTS                         = 5
-MAX_MESSAGE_LENGTH                  = 1024
+MAX_MESSAGE_LENGTH                  = 1024          # For the unframed (legacy) messages
+MAX_FRAME_LENGTH                    = 65536
+RECEIVE_BUFFER_SIZE                 = 65536         # Bytes read per 'recv' (may contain many frames)
 SERVER_LISTENING_PORT               = 50000
+DEFAULT_ROOM_NAME                   = "Lobby"
+MAX_ROOM_NAME_LENGTH                = 24
+SERVER_ENGINE                       = "threaded"    # "threaded" (thread per client) or "asyncio" (single event loop)
+OUTBOUND_QUEUE_SIZE                 = 256           # Max. no. of messages waiting to be sent to a client
+OUTBOUND_OVERFLOW_POLICY            = "drop_oldest" # "drop_oldest" or "disconnect" (the slow client)
+OUTBOUND_BATCH_WINDOW               = 0.001         # Seconds to gather messages for one coalesced write (0 to disable)
+OUTBOUND_BATCH_SIZE                 = 64            # Max. no. of messages coalesced into one write
+COMPRESSION_ENABLED                 = True          # Compresses the large messages to the clients which ask for it
+COMPRESSION_THRESHOLD               = 256           # Bytes (the smaller messages are never compressed)
+COMPRESSION_LEVEL                   = 6             # zlib level (1: fastest ... 9: smallest)
+SHUTDOWN_FLUSH_TIMEOUT              = 2.0           # Seconds to wait for the pending messages when shutting down
+WAITING_ROOM_SIZE                   = 50            # Clients kept waiting (in order) for a free slot (0 to deny at once)
+ACCEPT_RATE_PER_IP                  = 5.0           # Connections accepted per second from an address (0 for no limit)
+ACCEPT_BURST_PER_IP                 = 10            # Connections accepted at once from an address before limiting
+ACCEPT_RATE_MAX_ADDRESSES           = 10000         # Addresses tracked by the accept rate limiter
+ACCEPT_RATE_EXEMPT_ADDRESSES        = ("127.0.0.1", "::1")  # Never rate limited (the local tools and benchmarks)
+HEARTBEAT_INTERVAL                  = 15.0          # Seconds of silence before a client (which asked for heartbeats) is pinged
+HEARTBEAT_TIMEOUT                   = 45.0          # Seconds of silence before such a client (or a stalled handshake) is reaped
+HEARTBEAT_CHECK_INTERVAL            = 1.0           # Seconds between the checks of the heartbeat monitor
+TCP_KEEPALIVE_IDLE                  = 60            # Seconds before the kernel probes a silent connection (0 to disable)
+TCP_KEEPALIVE_INTERVAL              = 10            # Seconds between the keepalive probes
+TCP_KEEPALIVE_PROBES                = 3             # Unanswered probes before the kernel drops the connection
+SERVER_BIND_ADDRESS                 = None          # Address to listen on (None for the host name of this computer, "0.0.0.0" for all)
+LISTEN_BACKLOG                      = 128           # Connections the kernel keeps until they are accepted (a connect storm overflows it)
+TCP_NODELAY_ENABLED                 = True          # Sends the small messages at once (the writes are coalesced already)
+SOCKET_SEND_BUFFER_SIZE             = 0             # Bytes of the kernel send buffer per client (0 for the default of the kernel)
+SOCKET_RECEIVE_BUFFER_SIZE          = 0             # Bytes of the kernel receive buffer per client (0 for the default of the kernel)
+
+# Chat History
+CHAT_HISTORY_ENABLED                = True
+CHAT_HISTORY_DIRECTORY              = "chat_history"
+CHAT_HISTORY_SEGMENT_SIZE           = 4 * 1024 * 1024   # Bytes (a segment is rotated when it is full)
+CHAT_HISTORY_SEGMENT_MAX_AGE        = 24 * 60 * 60      # Seconds (a segment is rotated when it is older)
+CHAT_HISTORY_RING_BUFFER_SIZE       = 200               # Recent messages kept in the memory per room
+CHAT_HISTORY_REPLAY_COUNT           = 50                # Recent messages sent to a client joining a room
+CHAT_HISTORY_MAX_ROOMS              = 1000              # Rooms whose recent messages are kept in the memory
+CHAT_HISTORY_QUEUE_SIZE             = 10000             # Messages waiting to be written to the log
+CHAT_HISTORY_LOAD_SEGMENTS          = 2                 # Newest segments read at startup to fill the memory
+
+# Cluster (see 'server_cluster.py')
+CLUSTER_WORKERS                     = 4                 # Worker processes sharing the listening port
+CLUSTER_RESPAWN_DELAY               = 1.0               # Seconds to wait before restarting a dead worker
+CLUSTER_BUS_MAX_EVENT_LENGTH        = 4 * MAX_FRAME_LENGTH  # Bytes (an event carries a whole chat message)
+
+# Flood Control (see 'flood_control.py')
+FLOOD_CONTROL_ENABLED               = True
+FLOOD_POLICY                        = "throttle"        # "throttle" (delays the reads), "drop" (the message) or "disconnect"
+CHAT_RATE_PER_CLIENT                = 5.0               # Chat messages per second from a client (0 for no limit)
+CHAT_BURST_PER_CLIENT               = 10                # Chat messages at once from a client
+CHAT_BYTE_RATE_PER_CLIENT           = 4096              # Chat bytes per second from a client (0 for no limit)
+CHAT_BYTE_BURST_PER_CLIENT          = 16384             # Chat bytes at once from a client
+CHAT_RATE_GLOBAL                    = 1000.0            # Chat messages per second from all the clients (0 for no limit)
+CHAT_BURST_GLOBAL                   = 2000
+CHAT_BYTE_RATE_GLOBAL               = 1024 * 1024       # Chat bytes per second from all the clients (0 for no limit)
+CHAT_BYTE_BURST_GLOBAL              = 2 * 1024 * 1024
+RATE_LIMIT_NOTICE_INTERVAL          = 1.0               # Seconds between the notices to a client over the limit
+
+# Client Sessions (see 'client_sessions.py')
+RESUME_BUFFER_SIZE                  = 5000              # Recent chat messages (of all the rooms) kept for the resuming clients
+SESSION_RESUME_TIMEOUT              = 120.0             # Seconds a lost client can resume its session within
+MAX_SESSIONS                        = 10000             # Sessions kept (the suspended ones which expire first are evicted)
+
+# File Transfers (see 'file_transfers.py')
+FILE_TRANSFERS_ENABLED              = True
+FILE_SPOOL_DIRECTORY                = "file_spool"
+MAX_FILE_SIZE                       = 100 * 1024 * 1024 # Bytes
+MAX_FILE_NAME_LENGTH                = 255
+MAX_FILE_TRANSFERS                  = 100               # Files kept in the spool at once
+FILE_SPOOL_TIMEOUT                  = 60 * 60           # Seconds a file is kept after its last chunk (unless relayed then)
+FILE_SPOOL_PRUNE_INTERVAL           = 60                # Seconds between the checks for the files to be forgotten
+FILE_SEND_SLICE                     = 256 * 1024        # Bytes of whole frames relayed at a time (a chat message waits
+                                                        # for one slice at the max.)
+
+# Chat Search (see 'chat_search.py')
+CHAT_SEARCH_ENABLED                 = True
+SEARCH_INDEX_MAX_MESSAGES           = 200000            # Recent chat messages (of all the rooms) kept in the index
+SEARCH_QUEUE_SIZE                   = 10000             # Messages and searches waiting for the indexing thread
+SEARCH_RESULT_LIMIT                 = 50                # Max. no. of matches returned
+SEARCH_MAX_SCANNED                  = 100000            # Max. no. of candidates checked per search (bounds the latency)
+SEARCH_MAX_TOKEN_LENGTH             = 32                # Longer words are not indexed
+SEARCH_MAX_TOKENS_PER_MESSAGE       = 100               # Distinct words indexed per message
+
+# Zero-Downtime Restart (see 'server_handoff.py')
+HANDOFF_SOCKET_PATH                 = "group_chat_server.sock"  # Unix socket where the running server waits to be taken over
+HANDOFF_DRAIN_TIMEOUT               = 2.0               # Seconds to wait for the messages being processed and sent
+
+# Runtime Settings (see 'server_settings.py')
+SETTINGS_FILE_PATH                  = "server_settings.json"    # Read at startup and when reloading (if it exists)
+SETTINGS_ENVIRONMENT_PREFIX         = "GROUPCHAT_"              # Like GROUPCHAT_MAX_CLIENTS=50
+SETTINGS_PROFILE                    = None                      # One of the below (the other overrides are applied over it)
+SETTINGS_PROFILES                   = {
+    "low-latency": {"TCP_NODELAY_ENABLED": True, "OUTBOUND_BATCH_WINDOW": 0},
+    "throughput": {"OUTBOUND_BATCH_WINDOW": 0.005, "OUTBOUND_BATCH_SIZE": 256, "RECEIVE_BUFFER_SIZE": 262144,\
+        "SOCKET_SEND_BUFFER_SIZE": 1024 * 1024},
+    "many-clients": {"SERVER_ENGINE": "asyncio", "MAX_CLIENTS": 10000, "WAITING_ROOM_SIZE": 1000, "LISTEN_BACKLOG": 4096,\
+        "SOCKET_SEND_BUFFER_SIZE": 65536, "SOCKET_RECEIVE_BUFFER_SIZE": 16384},     # Less kernel memory per client
+}
+
+# Event Log (see 'event_log.py')
+EVENT_LOG_PATH                      = "server_events.log"   # JSON lines (None to log nothing to a file)
+EVENT_LOG_LEVEL                     = "info"            # Lowest level logged to the file ("debug", "info", "warning" or "error")
+EVENT_LOG_CONSOLE_LEVEL             = "info"            # Lowest level shown on the console too (None to show nothing)
+EVENT_LOG_SAMPLE_EVERY              = {"junk": 10, "room_name_too_long": 10}   # Logs one of every N of these events
+EVENT_LOG_QUEUE_SIZE                = 10000             # Events waiting for the writer (the ones over it are dropped)
+EVENT_LOG_BATCH_SIZE                = 500               # Events written at a time
+EVENT_LOG_MAX_FILE_SIZE             = 10 * 1024 * 1024  # Bytes (the file is rotated when it is full)
+EVENT_LOG_BACKUP_COUNT              = 5                 # Rotated files kept (like 'server_events.log.1')
+
+# Wire Capture (see 'wire_capture.py' and 'wire_replay.py')
+WIRE_CAPTURE_PATH                   = None              # File where all the data the clients send is captured (None to disable)
+WIRE_CAPTURE_QUEUE_SIZE             = 100000            # Pieces of data waiting for the writer (the ones over it are dropped)
+WIRE_CAPTURE_MAX_FILE_SIZE          = 1024 * 1024 * 1024    # Bytes (capturing stops when the file is full)
+
+# Metrics (see 'server_metrics.py')
+METRICS_PORT                        = 50001             # Port of the localhost-only metrics endpoint (None to disable)
+PROFILING_SAMPLE_EVERY              = 0                 # Profiles one of every N broadcasts and messages (0 to disable)
 
 # Message Format
 DENY_MESSAGE                        = "RequestDenied"
 ACCEPT_MESSAGE                      = "RequestAccepted"
-CLIENT_LIST_UPDATE_MESSAGE_PREFIX   = "UpdateClientList:"
+QUEUE_POSITION_MESSAGE_PREFIX       = "QueuePosition:"         # "QueuePosition:<position>\n" (before 'RequestAccepted')
+CLIENT_LIST_UPDATE_MESSAGE_PREFIX   = "UpdateClientList:"      # Full list of names (for the unframed clients)
+CLIENT_LIST_SNAPSHOT_MESSAGE_PREFIX = "ClientListSnapshot:"    # {"room": room, "clients": [[id, name], ...]} (sent on join)
+CLIENT_LIST_DELTA_MESSAGE_PREFIX    = "ClientListDelta:"       # {"added": [[id, name], ...], "removed": [id, ...]}
 CHAT_MESSAGE_PREFIX                 = "Chat:"
 SHUTDOWN_MESSAGE_PREFIX             = "ShutDown:"
+JOIN_ROOM_MESSAGE_PREFIX            = "JoinRoom:"
+LEAVE_ROOM_MESSAGE_PREFIX           = "LeaveRoom:"              # Goes back to the default room
+LIST_ROOMS_MESSAGE_PREFIX           = "ListRooms:"
+ROOM_LIST_MESSAGE_PREFIX            = "RoomList:"               # [[room, no. of members], ...]
+FRAMING_REQUEST                     = "UseFraming:"
+COMPRESSION_REQUEST                 = "UseCompression:"         # Sent right after FRAMING_REQUEST (optional)
+HEARTBEAT_REQUEST                   = "UseHeartbeats:"          # Sent after the above requests (optional)
+PING_MESSAGE_PREFIX                 = "Ping:"                   # Answered with "Pong:" (only to the clients which asked)
+PONG_MESSAGE_PREFIX                 = "Pong:"
+RATE_LIMITED_MESSAGE_PREFIX         = "RateLimited:"            # {"action": FLOOD_POLICY, "retry_after": seconds}
+SESSION_REQUEST                     = "UseSessions:"            # Sent after the above requests (optional)
+SESSION_MESSAGE_PREFIX              = "Session:"                # {"token": token, "seq": last seq. no., "resumed": bool, "complete": bool}
+RESUME_MESSAGE_PREFIX               = "Resume:"                 # {"token": token, "last_seq": seq. no., "name": name} (instead of the name)
+SEQUENCED_MESSAGE_PREFIX            = "Seq:"                    # "Seq:<seq. no.>:<chat message>" (only to the clients which asked)
+DIRECT_MESSAGE_PREFIX               = "Direct:"                 # {"to": id or name, "message": msg} from the client,
+                                                                # {"from": [id, name], "to": [id, name], "message": msg} to both
+DIRECT_FAILED_MESSAGE_PREFIX        = "DirectFailed:"           # {"to": id or name, "reason": "unknown"/"ambiguous"/"unsupported"}
+FILE_OFFER_MESSAGE_PREFIX           = "FileOffer:"              # The file messages are described in 'file_transfers.py'
+FILE_ACCEPTED_MESSAGE_PREFIX        = "FileAccepted:"
+FILE_REJECTED_MESSAGE_PREFIX        = "FileRejected:"
+FILE_OFFERED_MESSAGE_PREFIX         = "FileOffered:"
+FILE_CHUNK_MESSAGE_PREFIX           = "FileChunk:"
+FILE_REQUEST_MESSAGE_PREFIX         = "FileRequest:"
+FILE_COMPLETE_MESSAGE_PREFIX        = "FileComplete:"
+SEARCH_MESSAGE_PREFIX               = "Search:"                 # The search messages are described in 'chat_search.py'
+SEARCH_RESULTS_MESSAGE_PREFIX       = "SearchResults:"
 
 
 if __name__ == '__main__':
@@ -0,0 +1,233 @@
+"""
+--------------
+SERVER HANDOFF
+--------------
+
+* Zero-downtime restart (upgrade) of the Group Chat server, without disconnecting any client.
+* The running server waits on a Unix socket (see HANDOFF_SOCKET_PATH) for a new server process, which is started with
+    'python group_chat_server.py <engine> takeover'. The running server then stops reading and accepting,
+    lets the messages being processed and the writes in progress finish, and hands over its listening socket and
+    the sockets of all its clients (with their ids, names, rooms, negotiated options, the data which is
+    not yet processed or sent and the files being relayed to them) through SCM_RIGHTS. Then it exits without closing the connections, and
+    the new server carries on with them. The engine of the new server may differ from the old one.
+* Contains the class called 'HandoffGate' (keeps the threads of the threaded engine out of the sockets during
+    the handover), the class called 'HandoffListener' (the running server side, see 'hand_over' in
+    'group_chat_server.py') and the function called 'receive_handover' (the new server side, see 'take_over_server').
+* Unix only (needs AF_UNIX and SCM_RIGHTS). The workers of a cluster are not handed over.
+
+Protocol: length-prefixed (4 bytes) JSON records on the Unix socket, each carrying at most one file descriptor:
+    {"type": "takeover"} from the new server, then from the running server {"type": "server", ...} with
+    the listening socket, {"type": "client", ...} with each client socket, {"type": "waiting", ...} with each
+    socket in the waiting room and finally {"type": "done"}, after which the running server exits.
+
+"""
+
+
+import base64
+import json
+import os
+import select
+import socket
+import struct
+from threading import Thread, Condition
+
+from server_config import *
+
+
+RECORD_HEADER = struct.Struct("!I")
+
+
+class HandoffGate(object):
+    """Keeps the threads of the threaded engine from reading the client sockets (and from processing the messages)
+    once a handover begins, as the sockets are shared with the new server process from then on.
+    A thread waits for data on its socket and on 'wakeup_socket', which becomes readable when the handover begins.
+    'active' counts the messages being processed (the handover waits until there are none)."""
+
+    def __init__(self):
+        self.condition = Condition()
+        self.handing_off = False
+        self.active = 0
+        self.wakeup_socket, self.wakeup_trigger = socket.socketpair()
+
+    def enter(self):
+        """Counts a message as being processed.
+        Returns False (counting nothing) if the handover had begun, else True."""
+
+        with self.condition:
+            if self.handing_off: return False
+            self.active += 1
+            return True
+
+    def leave(self):
+        """Uncounts a message which was processed."""
+
+        with self.condition:
+            self.active -= 1
+            if not(self.active): self.condition.notify_all()
+
+    def begin(self, timeout):
+        """Begins the handover: wakes up the waiting threads and,
+        Waits until no message is being processed (for the given timeout in seconds at the max.)."""
+
+        with self.condition:
+            self.handing_off = True
+            self.wakeup_trigger.send(b"!")
+            self.condition.wait_for(lambda: not(self.active), timeout)
+
+    def wait_readable(self, connection):
+        """Waits until the given socket has data (or is closed) or the handover begins.
+        Note: This function is a blocking call."""
+
+        try:
+            if hasattr(select, "poll"):     # Not limited to the first FD_SETSIZE file descriptors like 'select'
+                poller = select.poll()
+                poller.register(connection, select.POLLIN)
+                poller.register(self.wakeup_socket, select.POLLIN)
+                poller.poll()
+            else: select.select([connection, self.wakeup_socket], [], [])
+        except (OSError, ValueError): pass     # Closed meanwhile, the next 'recv' or 'accept' finds it out
+
+
+class HandoffListener(object):
+    """Waits (in a background thread) for a new server process to take over the given server.
+    The Unix socket path should be given when instance of the class is created."""
+
+    def __init__(self, server, path):
+        self.server = server
+        self.path = path
+        try: os.unlink(path)        # Left behind by the server which handed over to this one (or crashed)
+        except OSError: pass
+        self.listening_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listening_socket.bind(path)
+        os.chmod(path, 0o600)       # Whoever connects gets all the client connections
+        self.listening_socket.listen(1)
+        self.waiting_thread = Thread(target = self.wait_for_takeover, daemon = True)
+        self.waiting_thread.start()
+
+    def wait_for_takeover(self):
+        """Waits for a new server process and hands over the server to it (this process exits after that).
+        Note: This function is a blocking call."""
+
+        while 1:
+            try: handoff_connection, address = self.listening_socket.accept()
+            except OSError: return      # Closed as the server shuts down
+            try:
+                fds, request = receive_record(handoff_connection)
+                if request.get("type") == "takeover": break
+            except (OSError, ValueError): pass
+            handoff_connection.close()
+
+        print("\n\nHanding over to the new server process...\n")
+        self.listening_socket.close()
+        try: self.server.hand_over(handoff_connection)
+        finally:
+            # Exits without closing (or shutting down) any connection, the new server holds the same sockets.
+            os._exit(0)
+
+    def close(self):
+        """Stops waiting for a new server process."""
+
+        try: self.listening_socket.shutdown(socket.SHUT_RDWR)
+        except OSError: pass
+        self.listening_socket.close()
+        try: os.unlink(self.path)
+        except OSError: pass
+
+
+def capture_client(client_interface):
+    """Gets the client interface of a client which is not processing or sending anything (see 'hand_over') and,
+    Returns its record (without the socket), with the messages received but not processed and the data not sent."""
+
+    pending_messages = list(client_interface.pending_messages)
+    if client_interface.held_message is not None: pending_messages.insert(0, client_interface.held_message)
+    return {"type": "client", "id": client_interface.id_no, "address": list(client_interface.address),\
+        "name": client_interface.name, "room": client_interface.room, "configured": client_interface.configured,\
+        "framed": client_interface.framed, "compressed": client_interface.compressed,\
+        "heartbeats": client_interface.heartbeats, "resumable": client_interface.resumable,\
+        "session_token": client_interface.session_token, "pending_messages": pending_messages,\
+        "partial_frame": base64.b64encode(bytes(client_interface.frame_decoder.buffer)).decode(),\
+        "outbound": [base64.b64encode(data).decode() for data in client_interface.outbound_queue],\
+        "downloads": [[file_download.transfer.id, file_download.spool_offset] for file_download in client_interface.downloads]}
+
+
+def restore_client(client_interface, record):
+    """Gets a new client interface and the record of the client and applies the record to it."""
+
+    client_interface.name = record["name"]
+    client_interface.room = record["room"]
+    client_interface.configured = record["configured"]
+    client_interface.framed = record["framed"]
+    client_interface.compressed = record["compressed"]
+    client_interface.heartbeats = record["heartbeats"]
+    client_interface.resumable = record.get("resumable", False)       # Not in the records of the older versions
+    client_interface.session_token = record.get("session_token")
+    client_interface.pending_messages.extend(record["pending_messages"])
+    client_interface.frame_decoder.buffer.extend(base64.b64decode(record["partial_frame"]))
+    for data in record["outbound"]: client_interface.queue_outbound(base64.b64decode(data))
+
+
+def send_record(connection, record, fd = None):
+    """Sends the given record (a dictionary) along with the given file descriptor (if any)."""
+
+    data = json.dumps(record).encode()
+    data = RECORD_HEADER.pack(len(data)) + data
+    sent = socket.send_fds(connection, [data], [fd]) if fd is not None else 0
+    connection.sendall(data[sent:])
+
+
+def receive_record(connection):
+    """Receives a record.
+    Returns a tuple like this: (<List of the file descriptors which came with it>, <Record (a dictionary)>)
+    Raises EOFError if the connection is closed before a record starts, ValueError if a record is broken."""
+
+    # The file descriptors come with the first byte of the record, so the header is read with 'recvmsg'.
+    header = b""
+    fds = []
+    while len(header) < RECORD_HEADER.size:
+        data, received_fds, flags, address = socket.recv_fds(connection, RECORD_HEADER.size - len(header), 1)
+        if not(data):
+            if header: raise ValueError("The handoff connection was closed in a record")
+            raise EOFError("The handoff connection was closed")
+        header += data
+        fds += received_fds
+    length = RECORD_HEADER.unpack(header)[0]
+    data = b""
+    while len(data) < length:
+        chunk = connection.recv(length - len(data))
+        if not(chunk): raise ValueError("The handoff connection was closed in a record")
+        data += chunk
+    return fds, json.loads(data)
+
+
+def receive_handover(path = HANDOFF_SOCKET_PATH):
+    """Gets the Unix socket path of the running server and,
+    Takes over the running server (which exits once it had handed over everything).
+    Returns a tuple like this: (<Server record>, <Listening socket>, <List of (<Record>, <Socket>) of the clients>)
+    Note: This function is a blocking call."""
+
+    handoff_connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    handoff_connection.connect(path)
+    send_record(handoff_connection, {"type": "takeover"})
+    server_record, listening_socket, handed_clients = None, None, []
+    while 1:
+        fds, record = receive_record(handoff_connection)
+        if record["type"] == "done": break
+        connection = socket.socket(fileno = fds[0])
+        if record["type"] == "server": server_record, listening_socket = record, connection
+        else: handed_clients.append((record, connection))
+    # Waits for the running server to exit, so that nothing but this process reads the shared sockets from now on.
+    while handoff_connection.recv(1): pass
+    handoff_connection.close()
+    return server_record, listening_socket, handed_clients
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the zero-downtime restart of the server.\n\
+Run 'group_chat_server.py <engine> takeover' while a server runs to replace it.\n\
+")
+
+
+# END
@@ -0,0 +1,270 @@
+"""
+--------------
+SERVER METRICS
+--------------
+
+* Counters and histograms of the Group Chat server (accepts, denials, waiting clients, active clients,
+    bytes in and out per client, broadcast fan-out time, send latency, outbound queue depths and so on).
+* Contains the class called 'ServerMetrics' which is updated in the hot paths with plain increments only
+    (no locks, so a rare increment may be lost between threads); the text is rendered only when scraped.
+* Contains the class called 'MetricsEndpoint' which serves the metrics in the Prometheus text format
+    over HTTP on localhost only ('/metrics'), along with the sampled profile ('/profile').
+* The optional sampling profiler (see PROFILING_SAMPLE_EVERY) profiles one of every N broadcasts and
+    received messages with 'cProfile', to find the stalls in production.
+
+"""
+
+
+import bisect
+import cProfile
+import io
+import pstats
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+
+from server_config import *
+
+
+LATENCY_BUCKETS                     = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,\
+    0.25, 0.5, 1.0, 2.5)            # Seconds
+PROFILE_TOP_FUNCTIONS               = 40
+
+
+class Histogram(object):
+    """A histogram with fixed (upper-bound) buckets, rendered cumulatively like in Prometheus."""
+
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # The last one is the '+Inf' bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Gets a value (like a latency in seconds) and counts it in its bucket."""
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, help_text):
+        """Returns the lines of the histogram in the Prometheus text format."""
+
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        cumulative_count = 0
+        for bucket, count in zip(self.buckets + ("+Inf",), list(self.counts)):
+            cumulative_count += count
+            lines.append(f'{name}_bucket{{le="{bucket}"}} {cumulative_count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {cumulative_count}")
+        return lines
+
+
+class SamplingProfiler(object):
+    """Profiles one of every 'sample_every' calls given to 'run' (only one call is profiled at a time)
+    and accumulates the statistics. Does nothing but the call itself when 'sample_every' is 0."""
+
+    def __init__(self, sample_every = PROFILING_SAMPLE_EVERY):
+        self.sample_every = sample_every
+        self.calls = 0
+        self.sampled_calls = 0
+        self.profiling = False
+        self.stats = None
+        self.stats_lock = Lock()
+
+    def run(self, function, *args):
+        """Calls the given function with the given arguments (profiling it if sampled) and returns its result."""
+
+        if not(self.sample_every): return function(*args)
+        self.calls += 1
+        if self.calls % self.sample_every: return function(*args)
+        with self.stats_lock:
+            if self.profiling: return function(*args)
+            self.profiling = True
+        profile = cProfile.Profile()
+        try: return profile.runcall(function, *args)
+        finally:
+            with self.stats_lock:
+                if self.stats is None: self.stats = pstats.Stats(profile)
+                else: self.stats.add(profile)
+                self.sampled_calls += 1
+                self.profiling = False
+
+    def render(self):
+        """Returns the accumulated profile (the top functions by cumulative time) as text."""
+
+        if not(self.sample_every): return "Profiling is disabled (see PROFILING_SAMPLE_EVERY in 'server_config.py')\n"
+        report = io.StringIO()
+        report.write(f"Sampled calls: {self.sampled_calls} of {self.calls}\n")
+        with self.stats_lock:
+            if self.stats is not None:
+                self.stats.stream = report
+                self.stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        return report.getvalue()
+
+
+class ServerMetrics(object):
+    """Contains the counters and histograms of a server.
+    The gauges (active clients, queue depths and so on) are read from the server when rendering."""
+
+    def __init__(self):
+        self.accepted_clients = 0
+        self.denied_clients = 0
+        self.queued_clients = 0
+        self.rate_limited_clients = 0
+        self.chat_messages = 0
+        self.direct_messages = 0
+        self.searches = 0
+        self.file_transfers = 0
+        self.file_bytes_received = 0
+        self.file_bytes_relayed = 0
+        self.junk_messages = 0
+        self.reaped_clients = 0
+        self.flood_limit_hits = {"throttle": 0, "drop": 0, "disconnect": 0}     # By the action taken
+        self.fan_out_seconds = Histogram()
+        self.send_latency_seconds = Histogram()
+        self.profiler = SamplingProfiler()
+
+    def render(self, server):
+        """Gets the server and returns all its metrics in the Prometheus text format."""
+
+        lines = []
+        for name, value, help_text in (
+            ("groupchat_accepted_clients_total", self.accepted_clients, "Clients accepted"),
+            ("groupchat_denied_clients_total", self.denied_clients, "Clients denied as the waiting room was full too"),
+            ("groupchat_queued_clients_total", self.queued_clients, "Clients put in the waiting room"),
+            ("groupchat_rate_limited_clients_total", self.rate_limited_clients, "Clients denied as they connected too often"),
+            ("groupchat_chat_messages_total", self.chat_messages, "Chat messages received"),
+            ("groupchat_direct_messages_total", self.direct_messages, "Direct messages received"),
+            ("groupchat_searches_total", self.searches, "Chat searches received"),
+            ("groupchat_file_transfers_total", self.file_transfers, "Files offered (and accepted)"),
+            ("groupchat_file_bytes_received_total", self.file_bytes_received, "Bytes of the files received"),
+            ("groupchat_file_bytes_relayed_total", self.file_bytes_relayed, "Bytes of the file chunks relayed"),
+            ("groupchat_junk_messages_total", self.junk_messages, "Non-comprehensible messages received"),
+            ("groupchat_reaped_clients_total", self.reaped_clients, "Clients disconnected as they stopped responding"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+
+        lines += ["# HELP groupchat_flood_limit_hits_total Chat messages over the rate limits (by the action taken)",\
+            "# TYPE groupchat_flood_limit_hits_total counter"]
+        for action, count in self.flood_limit_hits.items():
+            lines.append(f'groupchat_flood_limit_hits_total{{action="{action}"}} {count}')
+
+        client_interfaces = list(server.live_connections.values())
+        lines += ["# HELP groupchat_active_clients Clients connected", "# TYPE groupchat_active_clients gauge",\
+            f"groupchat_active_clients {len(client_interfaces)}"]
+        lines += ["# HELP groupchat_waiting_clients Clients waiting for a free slot", "# TYPE groupchat_waiting_clients gauge",\
+            f"groupchat_waiting_clients {len(server.waiting_clients)}"]
+        lines += ["# HELP groupchat_rooms Rooms with clients", "# TYPE groupchat_rooms gauge",\
+            f"groupchat_rooms {len(server.rooms)}"]
+        if server.chat_history is not None:
+            lines += ["# HELP groupchat_history_dropped_appends_total Chat messages not persisted",\
+                "# TYPE groupchat_history_dropped_appends_total counter",\
+                f"groupchat_history_dropped_appends_total {server.chat_history.dropped_appends}"]
+
+        lines += ["# HELP groupchat_event_log_dropped_events_total Events not logged as the writer was too far behind",\
+            "# TYPE groupchat_event_log_dropped_events_total counter",\
+            f"groupchat_event_log_dropped_events_total {server.event_log.dropped_events}",\
+            "# HELP groupchat_event_log_sampled_out_events_total Events not logged due to the sampling",\
+            "# TYPE groupchat_event_log_sampled_out_events_total counter",\
+            f"groupchat_event_log_sampled_out_events_total {server.event_log.sampled_out_events}"]
+
+        if server.wire_capture is not None:
+            lines += ["# HELP groupchat_wire_capture_dropped_records_total Data not captured as the writer was too far behind",\
+                "# TYPE groupchat_wire_capture_dropped_records_total counter",\
+                f"groupchat_wire_capture_dropped_records_total {server.wire_capture.dropped_records}"]
+
+        if server.chat_search is not None:
+            lines += ["# HELP groupchat_search_indexed_messages Chat messages in the search index",\
+                "# TYPE groupchat_search_indexed_messages gauge",\
+                f"groupchat_search_indexed_messages {len(server.chat_search.index)}",\
+                "# HELP groupchat_search_dropped_messages_total Chat messages not indexed",\
+                "# TYPE groupchat_search_dropped_messages_total counter",\
+                f"groupchat_search_dropped_messages_total {server.chat_search.dropped_messages}"]
+
+        if server.file_transfers is not None:
+            file_stats = server.file_transfers.fetch_stats()
+            for name, key, metric_type, help_text in (
+                ("groupchat_file_transfer_bytes_received", "received", "gauge", "Bytes of the file received so far"),
+                ("groupchat_file_transfer_bytes_per_second", "bytes_per_second", "gauge", "Throughput of the upload"),
+                ("groupchat_file_transfer_bytes_relayed_total", "bytes_relayed", "counter", "Bytes of the file relayed"),
+                ("groupchat_file_transfer_downloads_active", "downloads_active", "gauge", "Clients it is relayed to now"),
+                ("groupchat_file_transfer_downloads_completed_total", "downloads_completed", "counter",\
+                    "Clients it was relayed to completely"),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+                for transfer_stats in file_stats:
+                    lines.append(f'{name}{{id="{transfer_stats["id"]}",name="{escape_label(transfer_stats["name"])}"}}\
+ {transfer_stats[key]}')
+
+        lines += self.fan_out_seconds.render("groupchat_fan_out_seconds", "Time taken to queue a broadcast for all the recipients")
+        lines += self.send_latency_seconds.render("groupchat_send_latency_seconds",\
+            "Time from queueing a message until it is written to the client")
+
+        for name, attribute, metric_type, help_text in (
+            ("groupchat_client_bytes_received_total", "bytes_received", "counter", "Bytes received from the client"),
+            ("groupchat_client_bytes_sent_total", "bytes_sent", "counter", "Bytes sent to the client"),
+            ("groupchat_client_queue_depth", None, "gauge", "Messages waiting in the outbound queue of the client"),
+            ("groupchat_client_peak_queue_depth", "peak_queue_depth", "gauge", "Peak depth of the outbound queue"),
+            ("groupchat_client_dropped_messages_total", "dropped_messages", "counter", "Messages dropped as the client was slow"),
+            ("groupchat_client_flood_limit_hits_total", "flood_limit_hits", "counter", "Chat messages over the rate limits"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+            for client_interface in client_interfaces:
+                if attribute is None: value = len(client_interface.outbound_queue)
+                else: value = getattr(client_interface, attribute)
+                lines.append(f'{name}{{id="{client_interface.id_no}",name="{escape_label(client_interface.name)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+class MetricsEndpoint(object):
+    """Serves the metrics of the given server over HTTP on localhost (at the given port) from a background thread."""
+
+    def __init__(self, server, port):
+        metrics_server = server
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path == "/metrics": body = metrics_server.metrics.render(metrics_server)
+                elif self.path == "/profile": body = metrics_server.metrics.profiler.render()
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): pass      # The scrapes are not worth printing
+
+        self.http_server = ThreadingHTTPServer(("127.0.0.1", port), MetricsRequestHandler)
+        self.http_server.daemon_threads = True
+        self.port = self.http_server.server_address[1]
+        self.serving_thread = Thread(target = self.http_server.serve_forever, daemon = True)
+        self.serving_thread.start()
+
+    def close(self):
+        """Stops serving the metrics."""
+
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+
+def escape_label(value):
+    """Returns the given string escaped for a label value of the Prometheus text format."""
+
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the server metrics.\n\
+Scrape 'http://127.0.0.1:<METRICS_PORT>/metrics' while the server runs.\n\
+")
+
+
+# END
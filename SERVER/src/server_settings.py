@@ -0,0 +1,198 @@
+"""
+---------------
+SERVER SETTINGS
+---------------
+
+* The runtime configuration of the Group Chat server: the tunables of 'server_config.py' listed in SETTINGS
+    can be overridden without editing it by (in the order of precedence, the last one wins):
+    a profile (see SETTINGS_PROFILES), the settings file (a JSON object, see SETTINGS_FILE_PATH),
+    the environment variables (like GROUPCHAT_MAX_CLIENTS=50) and the command line options (like --max-clients 50).
+* The reloadable settings can be changed on a running server: type 'reload' in its console (or send it SIGHUP)
+    and the settings are read again from the same sources. The client limits, the heartbeats, the flood control and
+    the levels of the event log apply at once, the socket tunables and the outbound batching to the clients accepted from then on.
+    The others (like the port) need a restart, see 'group_chat_server.py' for a restart without disconnecting.
+* MAX_MESSAGE_LENGTH is not a setting, as it must match the one of the (unframed) clients.
+* Run 'settings_benchmark.py' to see what the settings do to the chat latency and throughput.
+
+"""
+
+
+import argparse
+import json
+import os
+#from ... import ...
+
+import server_config
+from server_config import *
+from event_log import LOG_LEVELS
+
+
+SETTINGS = {
+    # <Name>: (<Type>, <Can be None>, <Reloadable>)
+    "SERVER_ENGINE":                (str, False, False),
+    "SERVER_LISTENING_PORT":        (int, False, False),
+    "SERVER_BIND_ADDRESS":          (str, True, False),
+    "LISTEN_BACKLOG":               (int, False, False),
+    "METRICS_PORT":                 (int, True, False),
+    "EVENT_LOG_PATH":               (str, True, False),
+    "WIRE_CAPTURE_PATH":            (str, True, False),
+    "SETTINGS_PROFILE":             (str, True, True),
+    "MAX_CLIENTS":                  (int, False, True),
+    "WAITING_ROOM_SIZE":            (int, False, True),
+    "ACCEPT_RATE_PER_IP":           (float, False, True),
+    "ACCEPT_BURST_PER_IP":          (int, False, True),
+    "HEARTBEAT_INTERVAL":           (float, False, True),
+    "HEARTBEAT_TIMEOUT":            (float, False, True),
+    "FLOOD_CONTROL_ENABLED":        (bool, False, True),
+    "RECEIVE_BUFFER_SIZE":          (int, False, True),
+    "OUTBOUND_BATCH_WINDOW":        (float, False, True),
+    "OUTBOUND_BATCH_SIZE":          (int, False, True),
+    "TCP_NODELAY_ENABLED":          (bool, False, True),
+    "SOCKET_SEND_BUFFER_SIZE":      (int, False, True),
+    "SOCKET_RECEIVE_BUFFER_SIZE":   (int, False, True),
+    "TCP_KEEPALIVE_IDLE":           (int, False, True),
+    "TCP_KEEPALIVE_INTERVAL":       (int, False, True),
+    "TCP_KEEPALIVE_PROBES":         (int, False, True),
+    "EVENT_LOG_LEVEL":              (str, False, True),
+    "EVENT_LOG_CONSOLE_LEVEL":      (str, True, True),
+}
+SETTING_CHOICES = {
+    "SERVER_ENGINE": ("threaded", "asyncio"),
+    "SETTINGS_PROFILE": tuple(SETTINGS_PROFILES),
+    "EVENT_LOG_LEVEL": tuple(LOG_LEVELS),
+    "EVENT_LOG_CONSOLE_LEVEL": tuple(LOG_LEVELS),
+}
+MIN_SETTING_VALUES = {"RECEIVE_BUFFER_SIZE": 1, "OUTBOUND_BATCH_SIZE": 1, "LISTEN_BACKLOG": 1, "MAX_CLIENTS": 1}
+RESTART_SETTINGS = tuple(name for name, (setting_type, nullable, reloadable) in SETTINGS.items() if not(reloadable))
+
+
+def fetch_default_settings():
+    """Returns the settings as in 'server_config.py' (a dictionary like this: <Name>: <Value>)."""
+
+    return {name: getattr(server_config, name) for name in SETTINGS}
+
+
+def parse_setting(name, value):
+    """Gets the name of a setting and its value (as given in the settings file or a profile, or as a string) and,
+    Returns the value as the type of the setting. Raises ValueError if it is not a valid value for the setting."""
+
+    if not(name in SETTINGS): raise ValueError(f"Unknown setting: {name}")
+    setting_type, nullable, reloadable = SETTINGS[name]
+    if value is None or (nullable and isinstance(value, str) and value.lower() in ("", "none")):
+        if nullable: return None
+        raise ValueError(f"{name} cannot be none")
+
+    if setting_type is bool:
+        if isinstance(value, bool): return value
+        if isinstance(value, str) and value.lower() in ("1", "true", "yes", "on"): return True
+        if isinstance(value, str) and value.lower() in ("0", "false", "no", "off"): return False
+        raise ValueError(f"{name} must be true or false, not {value!r}")
+    if setting_type is str:
+        if not(isinstance(value, str)): raise ValueError(f"{name} must be a string, not {value!r}")
+        parsed_value = value
+    else:
+        if isinstance(value, bool) or not(isinstance(value, (str, int, float))):
+            raise ValueError(f"{name} must be a number, not {value!r}")
+        try: parsed_value = setting_type(value)
+        except ValueError: raise ValueError(f"{name} must be {'an integer' if setting_type is int else 'a number'},\
+ not {value!r}") from None
+        if setting_type is int and isinstance(value, float) and parsed_value != value:
+            raise ValueError(f"{name} must be an integer, not {value!r}")
+        if parsed_value < MIN_SETTING_VALUES.get(name, 0): raise ValueError(f"{name} is too small: {value!r}")
+
+    choices = SETTING_CHOICES.get(name)
+    if choices is not None and not(parsed_value in choices):
+        raise ValueError(f"{name} must be one of {', '.join(choices)}, not {value!r}")
+    return parsed_value
+
+
+def read_settings_file(settings_file_path):
+    """Gets the path of a settings file (a JSON object like this: {<Name>: <Value>, ...}) and,
+    Returns the settings in it (none if the path is None or the file does not exist).
+    Raises ValueError if the file cannot be read or has an invalid setting."""
+
+    if settings_file_path is None or not(os.path.exists(settings_file_path)): return {}
+    try:
+        with open(settings_file_path) as settings_file: file_settings = json.load(settings_file)
+        if not(isinstance(file_settings, dict)): raise ValueError("Not a JSON object")
+        return {name: parse_setting(name, value) for name, value in file_settings.items()}
+    except (OSError, ValueError) as error: raise ValueError(f"{settings_file_path}: {error}") from None
+
+
+def read_environment_settings(environment):
+    """Gets the environment variables (a dictionary) and,
+    Returns the settings given in them (named like SETTINGS_ENVIRONMENT_PREFIX + <Name>).
+    Raises ValueError if any of them is invalid."""
+
+    return {name: parse_setting(name, environment[SETTINGS_ENVIRONMENT_PREFIX + name]) for name in SETTINGS\
+        if SETTINGS_ENVIRONMENT_PREFIX + name in environment}
+
+
+def load_settings(argument_settings = None, settings_file_path = SETTINGS_FILE_PATH, environment = None):
+    """Gets the settings given on the command line (see 'fetch_argument_settings'), the path of the settings file
+        and the environment variables (of this process, if not given) and,
+    Returns all the settings, the defaults of 'server_config.py' overridden by the profile (if any is selected),
+        then by the settings file, the environment and the command line.
+    Raises ValueError if any setting is invalid."""
+
+    overrides = read_settings_file(settings_file_path)
+    overrides.update(read_environment_settings(os.environ if environment is None else environment))
+    overrides.update(argument_settings or {})
+    settings = fetch_default_settings()
+    profile = overrides.get("SETTINGS_PROFILE", settings["SETTINGS_PROFILE"])
+    if profile is not None:
+        for name, value in SETTINGS_PROFILES[profile].items(): settings[name] = parse_setting(name, value)
+    settings.update(overrides)
+    return settings
+
+
+def add_setting_arguments(argument_parser):
+    """Gets an argument parser and adds an option for every setting to it (like --max-clients for MAX_CLIENTS),
+    And the option for the path of the settings file (--settings-file)."""
+
+    argument_parser.add_argument("--settings-file", default = SETTINGS_FILE_PATH, metavar = "PATH",\
+        help = f"the JSON file of the settings (default: {SETTINGS_FILE_PATH})")
+    argument_group = argument_parser.add_argument_group("settings",\
+        f"(override the settings file and the {SETTINGS_ENVIRONMENT_PREFIX}<NAME> environment variables)")
+    for name, (setting_type, nullable, reloadable) in SETTINGS.items():
+        argument_group.add_argument("--" + name.lower().replace("_", "-"), dest = name, metavar = "VALUE",\
+            default = argparse.SUPPRESS, help = f"{setting_type.__name__}{' or none' if nullable else ''}\
+{', reloadable' if reloadable else ''} (default: {getattr(server_config, name)})")
+
+
+def fetch_argument_settings(arguments):
+    """Gets the arguments parsed by a parser with the setting options (see 'add_setting_arguments') and,
+    Returns the settings given in them. Raises ValueError if any of them is invalid."""
+
+    return {name: parse_setting(name, getattr(arguments, name)) for name in SETTINGS if hasattr(arguments, name)}
+
+
+def reload_settings(server, argument_settings, settings_file_path):
+    """Gets a running server, the settings given on its command line and the path of its settings file and,
+    Reads the settings again and applies them to the server (see 'GroupChatServer.apply_settings').
+    Reports what changed (and what needs a restart to change). Returns True if reloaded, else False."""
+
+    try: settings = load_settings(argument_settings, settings_file_path)
+    except ValueError as error:
+        print(f"\nCould not reload the settings: {error}\n")
+        return False
+    changed_settings = [name for name in SETTINGS if settings[name] != server.settings[name]]
+    server.run_in_server_context(server.apply_settings, settings)
+    applied_settings = [f"{name} = {settings[name]}" for name in changed_settings if not(name in RESTART_SETTINGS)]
+    ignored_settings = [name for name in changed_settings if name in RESTART_SETTINGS]
+    print(f"\nSettings reloaded: {', '.join(applied_settings) or 'nothing changed'}")
+    if ignored_settings: print(f"These need a restart: {', '.join(ignored_settings)}")
+    print()
+    return True
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the runtime settings of the server.\n\
+Run 'group_chat_server.py --help' to see the settings.\n\
+")
+
+
+# END
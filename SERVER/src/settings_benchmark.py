@@ -0,0 +1,66 @@
+"""
+------------------
+SETTINGS BENCHMARK
+------------------
+
+* Sweeps the runtime settings of the Group Chat server (see 'server_settings.py') under the same load
+    (see 'load_benchmark.py'): A local server is started for every combination of the values given,
+    and the delivered messages per second and the p50/p99/max end-to-end fan-out latency of each are reported.
+* The values to sweep are given like the options of the server, comma separated, for example:
+    python settings_benchmark.py --tcp-nodelay-enabled false,true --socket-send-buffer-size 0,16384
+    or the profiles: python settings_benchmark.py --settings-profile none,low-latency,throughput
+    (without any, TCP_NODELAY_ENABLED and OUTBOUND_BATCH_WINDOW are swept).
+* The settings file and the environment variables are not read, so that the runs are comparable.
+* Usage: python settings_benchmark.py [<no. of clients> [<messages per second> [<message size> [<duration in seconds>
+    [<engine>]]]]] [--<setting> <value>,<value>,...]
+
+"""
+
+
+import argparse
+import itertools
+#import ...
+
+from server_config import *
+from server_settings import SETTINGS, load_settings, add_setting_arguments, parse_setting
+from load_benchmark import benchmark
+
+
+DEFAULT_CLIENTS                     = 200
+DEFAULT_MESSAGE_RATE                = 200           # Chat messages sent per second (by all the clients together)
+DEFAULT_MESSAGE_SIZE                = 100           # Characters of chat content per message
+DEFAULT_DURATION                    = 5.0           # Seconds per combination
+DEFAULT_SWEEP                       = {"TCP_NODELAY_ENABLED": "false,true", "OUTBOUND_BATCH_WINDOW": "0,0.001,0.005"}
+
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description = "Sweeps the settings of the Group Chat server under load.")
+    argument_parser.add_argument("no_of_clients", nargs = "?", type = int, default = DEFAULT_CLIENTS)
+    argument_parser.add_argument("message_rate", nargs = "?", type = float, default = DEFAULT_MESSAGE_RATE)
+    argument_parser.add_argument("message_size", nargs = "?", type = int, default = DEFAULT_MESSAGE_SIZE)
+    argument_parser.add_argument("duration", nargs = "?", type = float, default = DEFAULT_DURATION)
+    argument_parser.add_argument("engine", nargs = "?", choices = ("threaded", "asyncio"), default = SERVER_ENGINE)
+    add_setting_arguments(argument_parser)
+    arguments = argument_parser.parse_args()
+
+    sweep = {name: getattr(arguments, name) for name in SETTINGS if hasattr(arguments, name)} or DEFAULT_SWEEP
+    try: sweep = {name: [parse_setting(name, value) for value in values.split(",")] for name, values in sweep.items()}
+    except ValueError as error: argument_parser.error(str(error))
+
+    print(f"\nServer: {arguments.engine}    Clients: {arguments.no_of_clients}    Rate: {arguments.message_rate:g} messages/s\
+    Size: {arguments.message_size}    Duration: {arguments.duration:g} s per combination\n")
+    names = list(sweep)
+    header = "".join(f"{name:>{max(len(name), 8) + 2}}" for name in names)
+    print(f"{header}{'Delivered/s':>13}{'Lost':>7}{'p50 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}")
+    for values in itertools.product(*sweep.values()):
+        argument_settings = dict(zip(names, values), SERVER_ENGINE = arguments.engine)
+        settings = load_settings(argument_settings, settings_file_path = None, environment = {})
+        results = benchmark(arguments.engine, arguments.no_of_clients, arguments.message_rate, arguments.message_size,\
+            arguments.duration, settings)
+        row = "".join(f"{str(value):>{max(len(name), 8) + 2}}" for name, value in zip(names, values))
+        print(f"{row}{results['deliveries_per_second']:>13.0f}{results['lost']:>7}{results['p50_ms']:>10.2f}\
+{results['p99_ms']:>10.2f}{results['max_ms']:>10.2f}")
+    print()
+
+
+# END
@@ -0,0 +1,144 @@
+"""
+------------
+WIRE CAPTURE
+------------
+
+* Opt-in capture of everything the clients send to the Group Chat server (see WIRE_CAPTURE_PATH),
+    so that a production session can be replayed against another server build (see 'wire_replay.py').
+* Contains the class called 'WireCapture' which records, per connection, the opening (at the accept),
+    every piece of data received (as read from the socket, the handshake included) and the closing,
+    each with its time. The records are queued (in a bounded queue) from the receiving threads (or the event loop)
+    and written by a background writer thread, so that capturing never waits for the disk.
+* A connection whose data could not be queued (the writer being too far behind) is marked as damaged
+    (its replay would be wrong), and capturing stops once the file reaches WIRE_CAPTURE_MAX_FILE_SIZE.
+* The file is appended to, so that a server which takes over another one (see 'server_handoff.py')
+    carries on the capture of the clients it adopts.
+
+File format: CAPTURE_MAGIC, then records like this (big-endian):
+    <Type (1 byte)> <Connection no. (4 bytes)> <Time in microseconds since the epoch (8 bytes)> <Length (4 bytes)> <Payload>
+    Types: OPEN_RECORD (payload: {"address": [host, port], "adopted": bool} as JSON), DATA_RECORD (payload: the data),
+    CLOSE_RECORD and DAMAGED_RECORD (no payload)
+
+"""
+
+
+import json
+import queue
+import struct
+import time
+from threading import Thread
+
+from server_config import *
+
+
+CAPTURE_MAGIC = b"GroupChatWire1\n"
+RECORD_HEADER = struct.Struct("!BIQI")
+OPEN_RECORD, DATA_RECORD, CLOSE_RECORD, DAMAGED_RECORD = 1, 2, 3, 4
+
+
+class WireCapture(object):
+    """Captures the data the clients send to a server into a file.
+    The path of the file should be given when instance of the class is created."""
+
+    def __init__(self, path, max_file_size = WIRE_CAPTURE_MAX_FILE_SIZE):
+        self.path = path
+        self.max_file_size = max_file_size
+        self.record_queue = queue.Queue(WIRE_CAPTURE_QUEUE_SIZE)
+        self.damaged_connections = set()    # Whose records were dropped (and not yet marked so in the file)
+        self.dropped_records = 0
+        self.full = False
+
+        self.capture_file = open(self.path, "ab")
+        if not(self.capture_file.tell()): self.capture_file.write(CAPTURE_MAGIC)
+        self.writer_thread = Thread(target = self.write_records)
+        self.writer_thread.start()
+
+    def record_open(self, connection_number, address, adopted = False):
+        """Gets the no. of a connection which was just accepted (or adopted from another server process) and its address."""
+
+        self.record(OPEN_RECORD, connection_number, json.dumps({"address": list(address), "adopted": adopted}).encode())
+
+    def record_data(self, connection_number, data):
+        """Gets the no. of a connection and the data (bytes) just received from it."""
+
+        self.record(DATA_RECORD, connection_number, data)
+
+    def record_close(self, connection_number):
+        """Gets the no. of a connection which was closed."""
+
+        self.record(CLOSE_RECORD, connection_number, b"")
+
+    def record(self, record_type, connection_number, payload):
+        """Queues a record to be written.
+        This is a non-blocking call (the record is dropped, and its connection marked as damaged,
+            if the writer is too far behind)."""
+
+        if self.full: return
+        try: self.record_queue.put_nowait((record_type, connection_number, time.time(), payload))
+        except queue.Full:
+            self.dropped_records += 1
+            self.damaged_connections.add(connection_number)
+
+    def write_records(self):
+        """Writes the queued records until 'close' is called.
+        Note: This function is a blocking call."""
+
+        closing = False
+        while not(closing):
+            record = self.record_queue.get()
+            closing = record is None
+            try:
+                if record is not None: self.write_record(*record)
+                if closing or self.record_queue.empty():
+                    while self.damaged_connections:
+                        self.write_record(DAMAGED_RECORD, self.damaged_connections.pop(), time.time(), b"")
+                    self.capture_file.flush()
+            except OSError as error:
+                print(f"\nCould not write the wire capture: {error}\n")
+                self.full = True
+        self.capture_file.close()
+
+    def write_record(self, record_type, connection_number, timestamp, payload):
+        """Writes a record to the file (or stops capturing if the file is full)."""
+
+        if self.full: return
+        if self.capture_file.tell() + RECORD_HEADER.size + len(payload) > self.max_file_size:
+            self.full = True
+            return
+        self.capture_file.write(RECORD_HEADER.pack(record_type, connection_number, int(timestamp * 1000000), len(payload)))
+        self.capture_file.write(payload)
+
+    def close(self):
+        """Writes the queued records, closes the file and stops the writer thread."""
+
+        self.record_queue.put(None)
+        self.writer_thread.join()
+
+
+def read_capture(path):
+    """Yields the records of the given capture file as tuples like this:
+        (<Type>, <Connection no.>, <Time (seconds since the epoch)>, <Payload>)
+    Stops at the end of the complete records (a capture which is still being written may end with a partial one).
+    Raises ValueError if it is not a capture file."""
+
+    with open(path, "rb") as capture_file: data = capture_file.read()
+    if not(data.startswith(CAPTURE_MAGIC)): raise ValueError(f"{path} is not a wire capture")
+    offset = len(CAPTURE_MAGIC)
+    while offset + RECORD_HEADER.size <= len(data):
+        record_type, connection_number, timestamp, payload_length = RECORD_HEADER.unpack_from(data, offset)
+        payload_start = offset + RECORD_HEADER.size
+        if payload_start + payload_length > len(data): break
+        yield record_type, connection_number, timestamp / 1000000, data[payload_start:payload_start + payload_length]
+        offset = payload_start + payload_length
+
+
+if __name__ == '__main__':
+    print("\n\
+NOT MEANT TO BE RUN\n\
+\n\
+This is just the module for the wire capture of the server.\n\
+Run 'wire_replay.py' to replay a capture.\n\
+")
+
+
+# END
@@ -0,0 +1,380 @@
+"""
+-----------
+WIRE REPLAY
+-----------
+
+* Replays the sessions captured by a Group Chat server (see WIRE_CAPTURE_PATH and 'wire_capture.py') against a server
+    (no PyQt5 needed): every captured connection is opened again and sends the same data at the same pace
+    (relative to the first one), or N times faster (--speed N).
+* The order the server got the data of the different sessions in is kept: the openings, the data and the closings
+    are replayed one after the other in the captured order, and before going on with another session the replay waits
+    for the server to settle (to deliver everything due to the data just sent, see REPLAY_SETTLE_TIME).
+    So a session is opened only once the ones opened before it were accepted and had their handshake answered,
+    and the client lists, the rooms and the messages each session gets do not depend on the timing of the server.
+* Records everything the server delivers to each session and the end-to-end latency of every chat message
+    (from the session which sent it being replayed sending it, to each session getting it).
+* Given two servers (like the current build and a new one), replays the capture against each in turn and compares
+    the messages delivered to each session (with the volatile parts, like the session tokens, the sequence numbers
+    and the timings, masked, and the pings left out) and the latency distributions.
+* Either starts a server of the given engine on loopback (with an empty chat history, the client limit raised
+    to the no. of sessions and, when replaying faster, no flood control) or replays against an already running server
+    (its port), which should be started with an empty chat history too for the outputs to be comparable.
+* The sessions whose capture is damaged, or which were adopted from another server process (without their handshake),
+    are skipped.
+* Usage: python wire_replay.py <capture file> <engine or port> [<engine or port>] [--speed <N>]
+
+"""
+
+
+import argparse
+import asyncio
+import bisect
+import contextlib
+import io
+import json
+import re
+import tempfile
+import time
+from collections import Counter
+from threading import Thread
+
+from server_config import *
+from group_chat_server import create_server, ClientInterface
+from message_framing import FrameDecoder
+from load_benchmark import percentile, raise_open_files_limit
+from wire_capture import read_capture, OPEN_RECORD, DATA_RECORD, CLOSE_RECORD, DAMAGED_RECORD
+
+
+REPLAY_HOST                         = "127.0.0.1"
+REPLAY_SETTLE_TIME                  = 0.01          # Seconds without deliveries after which the server is taken as settled
+MAX_SETTLE_TIME                     = 0.5           # Seconds the replay waits for the server to settle at most
+ADMISSION_TIMEOUT                   = 1.0           # Seconds the replay waits for a session to be accepted before going on
+                                                    # (it may be in the waiting room until a later session leaves)
+PERMISSION_TIMEOUT                  = 30.0          # Seconds a session waits to be accepted (maybe in the waiting room)
+DRAIN_TIMEOUT                       = 2.0           # Seconds to wait for the last deliveries after the last data is sent
+MAX_SHOWN_DIFFERENCES               = 10            # Sessions whose differences are shown
+VOLATILE_PATTERNS = (
+    (re.compile(r"^" + SEQUENCED_MESSAGE_PREFIX + r"\d+:"), ""),
+    (re.compile(r'"(token|id)": "[^"]*"'), r'"\1": "*"'),
+    (re.compile(r'"(seq|seconds|bytes_per_second|retry_after|time)": [-+0-9.eE]+'), r'"\1": *'),
+)
+OPEN_EVENT, DATA_EVENT, CLOSE_EVENT = "open", "data", "close"
+
+
+class ReplaySession(object):
+    """A captured session, along with what happened when it was replayed.
+    The connection no., the address, the time it was opened (when captured) and the no. of its opening record
+        must be given at the time of instance creation."""
+
+    def __init__(self, connection_number, address, opened_at, record_number, adopted = False):
+        self.connection_number = connection_number
+        self.address = address
+        self.opened_at = opened_at
+        self.adopted = adopted          # Adopted from another server process (its handshake was not captured)
+        self.damaged = False
+        self.events = [(record_number, opened_at, OPEN_EVENT, None)]
+        # Will also contain items like these: (<Record no.>, <Time>, DATA_EVENT, (<Data>, [(<Name>, <Chat content>), ...])),
+        #   (<Record no.>, <Time>, CLOSE_EVENT, None) (none if it was still open when the capture ended)
+        self.name = None
+        self.framed = False
+
+        self.status = None              # "replayed", "denied" or "failed" once replayed
+        self.deliveries = []            # Will contain items like this: (<Time received>, <Message>)
+        self.writer = None
+        self.read_task = None
+        self.held_events = []           # The events due before the session was accepted
+        self.closed = False
+
+    def parse_events(self):
+        """Decodes the captured data the way the server does (see 'ClientInterface.feed_received_data'),
+        To find the name of the client and the chat messages it sent in each piece of data."""
+
+        parser = ClientInterface(self.connection_number, None, self.address)
+        for record_number, captured_at, event_type, event_data in self.events:
+            if event_type != DATA_EVENT: continue
+            data, chat_keys = event_data
+            try: parser.feed_received_data(data)
+            except ValueError: break        # The server disconnected the client here too
+            for message in parser.pending_messages:
+                if self.name is None:
+                    self.name = message
+                    if message.startswith(RESUME_MESSAGE_PREFIX):
+                        try: self.name = str(json.loads(message[len(RESUME_MESSAGE_PREFIX):])["name"])
+                        except (ValueError, TypeError, KeyError): pass
+                elif message.startswith(CHAT_MESSAGE_PREFIX): chat_keys.append((self.name, message[len(CHAT_MESSAGE_PREFIX):]))
+            parser.pending_messages.clear()
+        self.framed = bool(parser.framed)
+
+    def fetch_output(self):
+        """Returns the messages delivered to the session (masked, see 'mask_message') as a Counter."""
+
+        if not(self.framed): return Counter(["".join(message for received_at, message in self.deliveries)])
+        return Counter(mask_message(message) for received_at, message in self.deliveries\
+            if not(message.startswith(PING_MESSAGE_PREFIX)))
+
+
+def load_sessions(capture_path):
+    """Gets the path of a capture file and,
+    Returns the captured sessions as a dictionary like this: <Connection no.>: <ReplaySession>."""
+
+    sessions = {}
+    for record_number, (record_type, connection_number, captured_at, payload) in enumerate(read_capture(capture_path)):
+        session = sessions.get(connection_number)
+        if record_type == OPEN_RECORD:
+            if session is not None: continue        # Carried on by the server process which took over
+            open_record = json.loads(payload)
+            sessions[connection_number] = ReplaySession(connection_number, tuple(open_record["address"]), captured_at,\
+                record_number, open_record["adopted"])
+        elif session is None: continue
+        elif record_type == DATA_RECORD: session.events.append((record_number, captured_at, DATA_EVENT, (payload, [])))
+        elif record_type == CLOSE_RECORD: session.events.append((record_number, captured_at, CLOSE_EVENT, None))
+        elif record_type == DAMAGED_RECORD: session.damaged = True
+    for session in sessions.values(): session.parse_events()
+    return sessions
+
+
+class CaptureReplay(object):
+    """Replays the given sessions against the server on the given port, at the given speed (see 'run')."""
+
+    def __init__(self, sessions, port, speed):
+        self.sessions = sessions
+        self.port = port
+        self.speed = speed
+        self.chat_sends = {}            # Will contain items like this: (<Name>, <Chat content>): [<Time sent>, ...]
+        self.last_delivery_at = 0
+        self.opening_tasks = []
+
+    async def run(self):
+        """Replays all the sessions, their events one after the other in the captured order (see the module docstring).
+        Returns the end-to-end latencies of the chat messages (sorted).
+        Note: This function is a coroutine."""
+
+        for session in self.sessions:
+            session.status, session.deliveries, session.writer, session.read_task = None, [], None, None
+            session.held_events, session.closed = [], False
+        events = sorted((event + (session,) for session in self.sessions for event in session.events), key = lambda event: event[0])
+        # The sessions still open when the capture ended are closed (in the order they were opened) once drained.
+        open_sessions = [session for session in self.sessions if session.events[-1][2] != CLOSE_EVENT]
+        replay_base = events[0][1]
+        start = time.perf_counter()
+        last_session = None
+        for record_number, captured_at, event_type, event_data, session in events:
+            await asyncio.sleep(max(0, start + (captured_at - replay_base) / self.speed - time.perf_counter()))
+            if last_session is not None and session is not last_session: await self.wait_for_settling()
+            last_session = session
+            if event_type == OPEN_EVENT:
+                opening_task = asyncio.ensure_future(self.open_session(session))
+                self.opening_tasks.append(opening_task)
+                await asyncio.wait({opening_task}, timeout = ADMISSION_TIMEOUT)
+            else: self.replay_event(session, event_type, event_data)
+        await asyncio.sleep(DRAIN_TIMEOUT)
+        for session in open_sessions:
+            self.replay_event(session, CLOSE_EVENT, None)
+            await self.wait_for_settling()
+        for opening_task in self.opening_tasks: opening_task.cancel()
+        await asyncio.gather(*self.opening_tasks, return_exceptions = True)
+        for session in self.sessions: self.close_session(session)
+        await asyncio.sleep(0)
+        return self.measure_latencies()
+
+    async def wait_for_settling(self):
+        """Waits until nothing was delivered to any session for REPLAY_SETTLE_TIME (but at most MAX_SETTLE_TIME).
+        Note: This function is a coroutine."""
+
+        deadline = time.perf_counter() + MAX_SETTLE_TIME
+        await asyncio.sleep(REPLAY_SETTLE_TIME)
+        while time.perf_counter() - self.last_delivery_at < REPLAY_SETTLE_TIME and time.perf_counter() < deadline:
+            await asyncio.sleep(REPLAY_SETTLE_TIME)
+
+    async def open_session(self, session):
+        """Opens the connection of the session and waits to be accepted (maybe in the waiting room),
+        Then replays the events of the session which were due meanwhile.
+        Note: This function is a coroutine."""
+
+        try:
+            reader, writer = await asyncio.open_connection(REPLAY_HOST, self.port)
+            permission = ""
+            while not(permission.split("\n")[-1] in (ACCEPT_MESSAGE, DENY_MESSAGE)):
+                data = await asyncio.wait_for(reader.read(MAX_MESSAGE_LENGTH), PERMISSION_TIMEOUT)
+                if not(data): raise ConnectionResetError("Closed before accepting")
+                permission += data.decode(errors = "replace")
+        except (OSError, asyncio.TimeoutError):
+            session.status = "failed"
+            return
+        if permission.endswith(DENY_MESSAGE):
+            session.status = "denied"
+            writer.close()
+            return
+
+        session.status = "replayed"
+        session.writer = writer
+        session.read_task = asyncio.ensure_future(self.read_deliveries(session, reader))
+        for event_type, event_data in session.held_events: self.replay_event(session, event_type, event_data)
+        session.held_events = []
+
+    def replay_event(self, session, event_type, event_data):
+        """Sends the data of the session (recording when its chat messages were sent) or closes it.
+        The events due before the session was accepted are held until then."""
+
+        if session.status is None:
+            session.held_events.append((event_type, event_data))
+            return
+        if session.writer is None or session.closed: return
+        if event_type == CLOSE_EVENT:
+            self.close_session(session)
+            return
+        if session.read_task.done(): return     # Disconnected by the server
+        data, chat_keys = event_data
+        session.writer.write(data)
+        sent_at = time.perf_counter()
+        for chat_key in chat_keys: self.chat_sends.setdefault(chat_key, []).append(sent_at)
+
+    def close_session(self, session):
+        """Closes the connection of the session (if open)."""
+
+        if session.writer is None or session.closed: return
+        session.closed = True
+        session.writer.close()
+        session.read_task.cancel()
+
+    async def read_deliveries(self, session, reader):
+        """Reads (and decodes) everything the server delivers to the replayed session until the connection is closed.
+        Note: This function is a coroutine."""
+
+        frame_decoder = FrameDecoder()
+        while 1:
+            try: data = await reader.read(RECEIVE_BUFFER_SIZE)
+            except: data = b""
+            if not(data): break
+            received_at = self.last_delivery_at = time.perf_counter()
+            if not(session.framed):
+                session.deliveries.append((received_at, data.decode(errors = "replace")))
+                continue
+            try: messages = frame_decoder.feed(data)
+            except ValueError: break
+            for message in messages: session.deliveries.append((received_at, message))
+
+    def measure_latencies(self):
+        """Returns the end-to-end latencies of the chat messages delivered (sorted)."""
+
+        latencies = []
+        for session in self.sessions:
+            for received_at, message in session.deliveries:
+                message = VOLATILE_PATTERNS[0][0].sub("", message)     # The sequence no.
+                if not(message.startswith(CHAT_MESSAGE_PREFIX)): continue
+                name, separator, content = message[len(CHAT_MESSAGE_PREFIX):].partition("> ")
+                sent_times = self.chat_sends.get((name, content))
+                if not(separator) or not(sent_times): continue
+                index = bisect.bisect_right(sent_times, received_at)     # The latest one sent before it was received
+                if index: latencies.append(received_at - sent_times[index - 1])
+        latencies.sort()
+        return latencies
+
+
+def replay(sessions, target, speed):
+    """Gets the sessions to be replayed, the target (an engine to start a local server of, or the port of a running one)
+        and the speed and,
+    Replays the sessions against it. Returns the results as a dictionary."""
+
+    raise_open_files_limit(len(sessions))
+    if target.isdigit(): latencies = asyncio.run(CaptureReplay(sessions, int(target), speed).run())
+    else:
+        # The server logs every connection to the console, which is not what is replayed here.
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            server = create_server(target, 0, REPLAY_HOST, chat_history_directory = directory,\
+                file_spool_directory = directory + "/file_spool", metrics_port = None, event_log_path = None)
+            server.max_clients = max(server.max_clients, len(sessions))
+            if speed != 1: server.flood_control.enabled = False     # The sessions send faster than the chat rate limits
+            server_thread = Thread(target = server.start_listening)
+            server_thread.start()
+            server.listening_event.wait()
+            try: latencies = asyncio.run(CaptureReplay(sessions, server.server_port, speed).run())
+            finally:
+                server.shutdown()
+                server_thread.join()
+
+    return {
+        "target": target,
+        "replayed": sum(1 for session in sessions if session.status == "replayed"),
+        "denied": sum(1 for session in sessions if session.status == "denied"),
+        "failed": sum(1 for session in sessions if session.status == "failed"),
+        "delivered": sum(len(session.deliveries) for session in sessions),
+        "chat_deliveries": len(latencies),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": percentile(latencies, 1.0) * 1000,
+        "outputs": {session.connection_number: session.fetch_output() for session in sessions},
+    }
+
+
+def mask_message(message):
+    """Returns the given message with its volatile parts (see VOLATILE_PATTERNS) masked."""
+
+    for pattern, replacement in VOLATILE_PATTERNS: message = pattern.sub(replacement, message)
+    return message
+
+
+def compare_outputs(sessions, first_results, second_results):
+    """Gets the sessions and the results of replaying them against two servers and,
+    Returns the no. of sessions which got the same messages from both and
+        the differences of the others as a list like this: [(<ReplaySession>, <Only first (Counter)>, <Only second>), ...]"""
+
+    same, differences = 0, []
+    for session in sessions:
+        first_output = first_results["outputs"][session.connection_number]
+        second_output = second_results["outputs"][session.connection_number]
+        if first_output == second_output: same += 1
+        else: differences.append((session, first_output - second_output, second_output - first_output))
+    return same, differences
+
+
+def shorten(message, length = 80):
+    """Returns the given message, cut to the given length (to be shown in a line)."""
+
+    return repr(message if len(message) <= length else message[:length] + "...")
+
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description = "Replays a wire capture of the Group Chat server.")
+    argument_parser.add_argument("capture", help = "the capture file (see WIRE_CAPTURE_PATH)")
+    argument_parser.add_argument("targets", nargs = "+", metavar = "target",\
+        help = "the engine of a local server to start (threaded / asyncio) or the port of a running server (up to 2)")
+    argument_parser.add_argument("--speed", type = float, default = 1.0, help = "the replay speed (default: 1)")
+    arguments = argument_parser.parse_args()
+    if len(arguments.targets) > 2: argument_parser.error("At most two targets can be compared")
+    if arguments.speed <= 0: argument_parser.error("The speed must be positive")
+    for target in arguments.targets:
+        if not(target.isdigit() or target in ("threaded", "asyncio")): argument_parser.error(f"Unknown target: {target}")
+    try: all_sessions = load_sessions(arguments.capture)
+    except (OSError, ValueError) as error: argument_parser.error(str(error))
+
+    sessions = [session for session in all_sessions.values() if not(session.adopted or session.damaged)]
+    print(f"\nCapture: {arguments.capture}    Sessions: {len(sessions)} ({len(all_sessions) - len(sessions)} skipped)\
+    Speed: {arguments.speed:g}x\n")
+    if not(sessions): raise SystemExit("Nothing to replay")
+    all_results = [replay(sessions, target, arguments.speed) for target in arguments.targets]
+
+    print(f"{'':<24}" + "".join(f"{results['target']:>14}" for results in all_results))
+    for label, key, value_format in (
+        ("Replayed sessions", "replayed", "d"), ("Denied sessions", "denied", "d"), ("Failed sessions", "failed", "d"),
+        ("Messages delivered", "delivered", "d"), ("Chat deliveries", "chat_deliveries", "d"),
+        ("Chat latency p50 (ms)", "p50_ms", ".2f"), ("Chat latency p90 (ms)", "p90_ms", ".2f"),
+        ("Chat latency p99 (ms)", "p99_ms", ".2f"), ("Chat latency max (ms)", "max_ms", ".2f"),
+    ):
+        print(f"{label:<24}" + "".join(f"{format(results[key], value_format):>14}" for results in all_results))
+
+    if len(all_results) == 2:
+        same, differences = compare_outputs(sessions, *all_results)
+        print(f"\nDelivered output: {same} of {len(sessions)} sessions got the same messages from both")
+        for session, first_only, second_only in differences[:MAX_SHOWN_DIFFERENCES]:
+            print(f"\n  Session {session.connection_number} {session.address} ({session.name!r}):")
+            for target, only_messages in ((arguments.targets[0], first_only), (arguments.targets[1], second_only)):
+                for message, count in only_messages.most_common(3):
+                    print(f"    only from {target}: {shorten(message)} x{count}")
+        if len(differences) > MAX_SHOWN_DIFFERENCES:
+            print(f"\n  ... and {len(differences) - MAX_SHOWN_DIFFERENCES} more sessions")
+    print()
+
+
+# END